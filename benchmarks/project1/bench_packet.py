@@ -0,0 +1,64 @@
+"""Microbenchmark for Packet encoding/decoding and memory use.
+
+Run from the repository root:
+    python -m benchmarks.project1.bench_packet
+"""
+import argparse
+import tracemalloc
+import timeit
+
+from cse461.project1.packet import Packet, PacketView, UINT32
+
+PAYLOAD = UINT32.pack(0) + b'\0' * 36
+RAW = Packet(payload=PAYLOAD, p_secret=0xdeadbeef, step=1, student_id=592).bytes
+
+
+def encode():
+    return Packet(payload=PAYLOAD, p_secret=0xdeadbeef, step=1, student_id=592)
+
+
+def decode():
+    return Packet.from_raw(RAW)
+
+
+def view():
+    packet = PacketView(RAW)
+    return packet.p_secret, packet.payload
+
+
+def pack_into(buffer=bytearray(len(RAW)), packet=encode()):
+    return packet.pack_into(buffer)
+
+
+def unpack_from():
+    return Packet.unpack_from(RAW)
+
+
+def bench_cpu(number: int):
+    for fn in (encode, decode, view, pack_into, unpack_from):
+        seconds = min(timeit.repeat(fn, number=number, repeat=5))
+        print(f"{fn.__name__:>12}: {seconds / number * 1e9:8.1f} ns/packet")
+
+
+def bench_memory(count: int):
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    packets = [Packet.from_raw(bytes(RAW)) for _ in range(count)]
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{'memory':>12}: {(after - before) / len(packets):8.1f} bytes/packet "
+          f"({len(RAW)}-byte packets)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--number', type=int, default=100_000,
+                        help="Iterations per timing run.")
+    args = parser.parse_args()
+
+    bench_cpu(args.number)
+    bench_memory(args.number)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Load benchmark for PreforkServer: stage A throughput by worker count.
+
+Starts a PreforkServer with each worker count in turn and measures how
+many hellos per second it answers while several client processes send
+hellos as fast as they are answered. Use --full to run whole sessions
+with Client instead.
+
+Run from the repository root:
+    python -m benchmarks.project1.bench_prefork --workers 1 2 4 --clients 8
+"""
+import multiprocessing
+import argparse
+import logging
+import random
+import socket
+import time
+
+from cse461.project1 import Client, PreforkServer, Packet
+from cse461.project1.consts import SERVER_ADDR, START_PORT
+
+HELLO = Packet(payload=b'hello world\0', p_secret=0, step=1, student_id=592).bytes
+
+
+def send_hellos(seconds: float, port: int) -> int:
+    """Sends hellos one at a time for `seconds` seconds. Returns the number answered."""
+    answered = 0
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(1)
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            sock.sendto(HELLO, (SERVER_ADDR, port))
+            try:
+                sock.recv(1024)
+                answered += 1
+            except socket.timeout:
+                pass
+    return answered
+
+
+def run_sessions(seconds: float, port: int) -> int:
+    """Runs whole sessions for `seconds` seconds. Returns the number completed."""
+    completed = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        with Client(student_id=random.randint(100, 999)) as client:
+            client.start(port)
+            completed += 1
+    return completed
+
+
+def bench(workers: int, clients: int, seconds: float, full: bool, udp_pool_size: int) -> float:
+    target = run_sessions if full else send_hellos
+    with PreforkServer(workers=workers, udp_pool_size=udp_pool_size) as server:
+        server.start(START_PORT)
+        with multiprocessing.Pool(clients) as pool:
+            start = time.monotonic()
+            total = sum(pool.starmap(target, [(seconds, START_PORT)] * clients))
+            elapsed = time.monotonic() - start
+        stats = server.stats()
+    unit = "sessions" if full else "hellos"
+    print(f"{workers:>3} workers: {total / elapsed:10.1f} {unit}/s "
+          f"(started: {stats['started']}, completed: {stats['completed']})")
+    return total / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-w', '--workers', type=int, nargs='+', default=[1, 2, 4],
+                        help="Worker counts to benchmark.")
+    parser.add_argument('-c', '--clients', type=int, default=multiprocessing.cpu_count(),
+                        help="Number of client processes.")
+    parser.add_argument('-s', '--seconds', type=float, default=5,
+                        help="Duration of each run.")
+    parser.add_argument('--full', action='store_true',
+                        help="Run whole sessions instead of sending hellos.")
+    parser.add_argument('--udp-pool-size', type=int, default=2,
+                        help="Shared stage B servers per worker, so that hellos "
+                             "don't each start a UDP server.")
+    args = parser.parse_args()
+    # Per-packet logging would dominate the measurement
+    logging.disable(logging.INFO)
+
+    print(f"{multiprocessing.cpu_count()} CPUs, {args.clients} client processes")
+    baseline = None
+    for workers in args.workers:
+        rate = bench(workers, args.clients, args.seconds, args.full, args.udp_pool_size)
+        baseline = baseline or rate
+        print(f"{'':>12} {rate / baseline:.2f}x the first run")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,26 @@
 from .client import Client
+from .async_client import AsyncClient
 from .server import Server
+from .async_server import AsyncServer
 from .consts import *
-from .packet import Packet
-from .wrappers import synchronized
+from .packet import Packet, PacketView
+from .batch import PacketBatch
+from .window import SendWindow
+from .rtt import RttEstimator
+from .protocol import ClientProtocol, Exchange, StageB
+from .framer import PacketFramer
+from .datagrams import DatagramBatch, DatagramRequest
+from .sessions import SessionStore, Session, Stage
+from .tokens import SessionTokens
+from .admission import AdmissionControl, TokenBucket
+from .scheduler import Scheduler
+from .workers import WorkerPool
+from .ports import PortAllocator
+from .prefork import PreforkServer
+from .balancer import Balancer, HashRing
+from .wrappers import Stoppable, synchronized
+from .logs import LogSampler
+from .metrics import Histogram, MetricsRegistry
 import logging
 
 # Log all messages as white text
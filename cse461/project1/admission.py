@@ -0,0 +1,174 @@
+import threading
+import heapq
+import time
+
+from typing import Dict, Optional
+
+__all__ = ['TokenBucket', 'AdmissionControl']
+
+
+class TokenBucket:
+    """Allows `rate` events per second on average, in bursts of up to
+    `burst` events.
+
+    Usage:
+    >>> bucket = TokenBucket(rate=100, burst=10)
+    >>> if bucket.take():
+    ...     # Handle the event
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self, now: float = None) -> bool:
+        """Takes a token if one is available. Returns False if the bucket
+        is empty."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.tokens = min(self.burst, self.tokens + max(now - self.updated, 0) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class AdmissionControl:
+    """Decides whether to admit new sessions, so that bursts of hellos
+    can't exhaust a server's ports and threads.
+
+    Sessions are admitted at up to `rate` per second (in bursts of up to
+    `burst`, see TokenBucket), while fewer than `max_sessions` admitted
+    sessions are in progress, and fewer than `max_per_ip` from the
+    session's IP address. Each limit is disabled if None.
+
+    Each admitted session holds a lease under its current secret, which
+    moves to the session's next secret with transfer(), until release()
+    is called for it or `lease` seconds pass, so that sessions that are
+    abandoned or time out free their place without any extra
+    bookkeeping. A lease is only freed once, so replaying a secret can't
+    free the places of other sessions.
+
+    Usage:
+    >>> admission = AdmissionControl(max_sessions=1000, max_per_ip=10, lease=18)
+    >>> reason = admission.admit(secret_a, '10.0.0.1')
+    >>> if reason is None:
+    ...     # Start the session. Call admission.transfer(secret_a, secret_b)
+    ...     # when it moves on to secret_b, and admission.release(secret_b)
+    ...     # once it finishes.
+    """
+    # Reasons returned by admit()
+    RATE = 'rate'
+    SESSIONS = 'sessions'
+    IP = 'ip'
+
+    def __init__(self, max_sessions: int = None, max_per_ip: int = None,
+                 rate: float = None, burst: int = None, lease: float = 60):
+        """
+        :param max_sessions: Maximum number of sessions in progress.
+        :param max_per_ip: Maximum number of sessions in progress per IP address.
+        :param rate: Maximum average number of sessions admitted per second.
+        :param burst: Maximum number of sessions admitted at once when
+                    rate-limited. Defaults to `rate` (one second's worth).
+        :param lease: Seconds after which an admitted session that was
+                    never released stops counting.
+        """
+        self.max_sessions = max_sessions
+        self.max_per_ip = max_per_ip
+        self.bucket = None
+        if rate is not None:
+            self.bucket = TokenBucket(rate, burst if burst is not None else max(1, int(rate)))
+        self.lease = lease
+        # (IP address, deadline) of the lease held under each secret
+        self.leases = {}
+        # Number of leases held by each IP address
+        self.per_ip = {}
+        # (deadline, secret) of every lease, including released and
+        # transferred ones
+        self.deadlines = []
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return (self.bucket is not None or self.max_sessions is not None
+                or self.max_per_ip is not None)
+
+    def admit(self, secret: int, ip: str, now: float = None) -> Optional[str]:
+        """
+        Admits the session with `secret` from `ip` if no limit is reached.
+
+        :return: None if the session was admitted, or the limit that was
+                 reached: AdmissionControl.RATE, SESSIONS or IP.
+        """
+        if not self.enabled:
+            return None
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self._expire(now)
+            if self.max_sessions is not None and len(self.leases) >= self.max_sessions:
+                return self.SESSIONS
+            if self.max_per_ip is not None and self.per_ip.get(ip, 0) >= self.max_per_ip:
+                return self.IP
+            # Only take a token for sessions that will be admitted
+            if self.bucket is not None and not self.bucket.take(now):
+                return self.RATE
+            if secret in self.leases:
+                # The secret was reused before its lease ran out
+                self._remove(secret)
+            deadline = now + self.lease
+            self.leases[secret] = (ip, deadline)
+            self.per_ip[ip] = self.per_ip.get(ip, 0) + 1
+            heapq.heappush(self.deadlines, (deadline, secret))
+            return None
+
+    def transfer(self, secret: int, new_secret: int):
+        """Moves the lease held under `secret` to `new_secret`, once the
+        session moves on to it. Does nothing if `secret` holds no lease."""
+        if not self.enabled:
+            return
+        with self.lock:
+            lease = self.leases.pop(secret, None)
+            if lease is None:
+                return
+            if new_secret in self.leases:
+                self._remove(new_secret)
+            self.leases[new_secret] = lease
+            heapq.heappush(self.deadlines, (lease[1], new_secret))
+
+    def release(self, secret: int):
+        """Frees the place of the finished session holding a lease under
+        `secret`. Does nothing if it was already freed."""
+        if not self.enabled:
+            return
+        with self.lock:
+            if secret in self.leases:
+                self._remove(secret)
+
+    def _remove(self, secret: int):
+        """Removes the lease held under `secret`. Call with the lock held."""
+        ip, _ = self.leases.pop(secret)
+        count = self.per_ip[ip] - 1
+        if count:
+            self.per_ip[ip] = count
+        else:
+            del self.per_ip[ip]
+
+    def _expire(self, now: float):
+        """Removes leases that ran out. Call with the lock held."""
+        while self.deadlines and self.deadlines[0][0] <= now:
+            deadline, secret = heapq.heappop(self.deadlines)
+            lease = self.leases.get(secret)
+            # Skip leases that were released, or replaced since
+            if lease is not None and lease[1] == deadline:
+                self._remove(secret)
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the number of admitted sessions in progress, and the
+        number of IP addresses they came from."""
+        with self.lock:
+            self._expire(time.monotonic())
+            return {'active': len(self.leases), 'ips': len(self.per_ip)}
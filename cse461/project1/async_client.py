@@ -0,0 +1,256 @@
+import asyncio
+import logging
+import time
+
+from typing import Callable, Iterable, List, Union
+from cse461.project1.packet import Packet, HEADER
+from cse461.project1.protocol import ClientProtocol, Exchange, sample
+from cse461.project1.consts import (CLIENT_ADDR, START_PORT, STUDENT_ID, STAGE_B_WINDOW,
+                                    MAX_RETRIES)
+
+__all__ = ['AsyncClient']
+logger = logging.getLogger(__name__)
+
+
+class DatagramQueue(asyncio.DatagramProtocol):
+    """DatagramProtocol that queues every datagram it receives for recv()."""
+
+    def __init__(self):
+        self.queue = asyncio.Queue()
+
+    def datagram_received(self, data: bytes, addr: tuple):
+        self.queue.put_nowait(data)
+
+    def error_received(self, exc: Exception):
+        # e.g. ICMP port unreachable. The datagram counts as lost.
+        logger.debug("UDP error: %r", exc)
+
+    async def recv(self, timeout: float = None) -> bytes:
+        """
+        Returns the next datagram.
+
+        :raises asyncio.TimeoutError: If none arrives within `timeout` seconds.
+        """
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+async def read_packet(reader: asyncio.StreamReader) -> Packet:
+    """Reads one packet, including its padding, from `reader`."""
+    header = await reader.readexactly(HEADER.size)
+    payload_len = HEADER.unpack(header)[0]
+    payload = await reader.readexactly(payload_len + (-payload_len % 4))
+    return Packet.from_raw(header + payload)
+
+
+class AsyncClient(ClientProtocol):
+    """asyncio implementation of the client for the protocol outlined in
+    CSE 461 SPR 2020 Project 1 (Sockets API).
+
+    Behaves like Client, but every stage is a coroutine on datagram and
+    stream transports, so one event loop (and one thread) can run any
+    number of sessions at once.
+
+    Usage:
+    >>> async with AsyncClient(student_id=123, ip_addr='localhost') as client:
+    ...     secrets = await client.start()
+
+    Generate load from many concurrent sessions:
+    >>> results = asyncio.run(AsyncClient.run_many(10_000, concurrency=500))
+    """
+
+    def __init__(self, student_id: int = STUDENT_ID, ip_addr: str = CLIENT_ADDR,
+                 window: int = STAGE_B_WINDOW, retries: int = MAX_RETRIES):
+        """
+        Constructor. Creates a client that will run through the protocol once.
+
+        :param student_id: Last 3 digits of student ID to include in all
+                        packet headers sent from this client. Defaults to
+                        consts.STUDENT_ID.
+        :param ip_addr: IP Address to send all packets to. Defaults to
+                        consts.CLIENT_ADDR.
+        :param window: Maximum number of stage B packets in flight (see
+                        SendWindow). Defaults to consts.STAGE_B_WINDOW.
+        :param retries: Number of times in a row a UDP request (a hello or
+                        a stage B packet) is sent again without a response
+                        before giving up with a TimeoutError. Defaults to
+                        consts.MAX_RETRIES.
+        """
+        super().__init__(student_id, window=window, retries=retries)
+        self.ip_addr = ip_addr
+        # Created by stage_a() and stage_c()
+        self.udp_transport = None
+        self.udp_protocol = None
+        self.tcp_reader = None
+        self.tcp_writer = None
+        # Set in stage C, used in stage D
+        self.tcp_port = None
+
+    async def exchange(self, exchange: Exchange, resend: Callable[[], None]) -> Packet:
+        """
+        Receives UDP packets until `exchange` accepts one, calling `resend`
+        whenever it times out.
+
+        :raises TimeoutError: If no packet is accepted after self.retries
+                    resends.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                packet = Packet.from_raw(
+                    await self.udp_protocol.recv(max(exchange.deadline - loop.time(), 0)))
+            except asyncio.TimeoutError:
+                exchange.timeout(loop.time())
+                resend()
+                continue
+            if exchange.receive(packet, loop.time()):
+                return packet
+
+    async def stage_a(self, port: int = START_PORT) -> Packet:
+        loop = asyncio.get_running_loop()
+        self.udp_transport, self.udp_protocol = await loop.create_datagram_endpoint(
+            DatagramQueue, local_addr=('0.0.0.0', 0))
+        packet, exchange = self.hello(loop.time())
+
+        def send():
+            if sample():
+                logger.debug("[Stage A] Sending packet %r to %s:%d", packet, self.ip_addr, port)
+            self.udp_transport.sendto(packet.bytes, (self.ip_addr, port))
+
+        send()
+        response = await self.exchange(exchange, send)
+        self.finish_stage_a(exchange, response)
+
+        logger.debug("[Stage A] Finished.")
+        return response
+
+    async def stage_b(self, response: Packet) -> Packet:
+        stage_b = self.start_stage_b(response)
+        address = (self.ip_addr, stage_b.port)
+
+        def send(packets: Iterable[Packet]):
+            for packet in packets:
+                if sample():
+                    logger.debug("[Stage B] Sending packet %r to %s:%d", packet, *address)
+                self.udp_transport.sendto(packet.bytes, address)
+
+        loop = asyncio.get_running_loop()
+        while not stage_b.done:
+            send(stage_b.to_send(loop.time()))
+            try:
+                packet = Packet.from_raw(
+                    await self.udp_protocol.recv(max(stage_b.deadline - loop.time(), 0)))
+            except asyncio.TimeoutError:
+                continue
+            stage_b.receive(packet, loop.time())
+
+        exchange = None
+        response = stage_b.response
+        if response is None:
+            exchange = stage_b.exchange(loop.time())
+            response = await self.exchange(exchange, lambda: send(stage_b.packets))
+        self.finish_stage_b(stage_b, response, exchange)
+
+        logger.debug("[Stage B] Finished.")
+        return response
+
+    async def stage_c(self, response: Packet) -> Packet:
+        tcp_port = self.stage_c_port(response)
+        self.tcp_reader, self.tcp_writer = await asyncio.open_connection(self.ip_addr, tcp_port)
+        self.tcp_port = tcp_port
+
+        logger.debug("[Stage C] Connected to TCP socket at %s:%d", self.ip_addr, tcp_port)
+        packet = await read_packet(self.tcp_reader)
+        self.finish_stage_c(packet)
+
+        logger.debug("[Stage C] Finished.")
+        return packet
+
+    async def stage_d(self, response: Packet):
+        batch = self.stage_d_packets(response)
+
+        if sample():
+            logger.debug("[Stage D] Sending %d packets with data %r to %s:%d",
+                         len(batch), batch[0].bytes, self.ip_addr, self.tcp_port)
+        self.tcp_writer.write(batch.buffer)
+        await self.tcp_writer.drain()
+
+        packet = await read_packet(self.tcp_reader)
+        self.finish_stage_d(packet)
+
+        logger.debug("[Stage D] Finished.")
+
+    async def start(self, port: int = START_PORT) -> dict:
+        logger.debug("[Start] Starting protocol. Connecting to server at %s.", self.ip_addr)
+        started = time.monotonic()
+        resp = await self.stage_a(port)
+        resp = await self.stage_b(resp)
+        resp = await self.stage_c(resp)
+        await self.stage_d(resp)
+
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("[Complete] Acquired secrets %s from %s:%d in %.3f seconds "
+                        "(%d retransmissions, RTT stats: %s).", self.secrets, self.ip_addr,
+                        port, time.monotonic() - started, self.retransmissions,
+                        self.rtt.stats())
+        return self.secrets
+
+    def stop(self):
+        if self.udp_transport is not None:
+            self.udp_transport.close()
+        if self.tcp_writer is not None:
+            self.tcp_writer.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.stop()
+
+    @classmethod
+    async def run_many(cls, n: int, port: int = START_PORT, concurrency: int = 100,
+                       timeout: float = None,
+                       **client_kwargs) -> List[Union[dict, BaseException]]:
+        """
+        Runs `n` sessions, at most `concurrency` at a time, each with a new
+        client.
+
+        :param port: Port of the server's stage A socket.
+        :param concurrency: Maximum number of sessions in progress at once.
+        :param timeout: Seconds after which a session is abandoned (with
+                    asyncio.TimeoutError). If None, sessions only give up
+                    once a UDP request runs out of retries, and wait
+                    forever for TCP responses.
+        :param client_kwargs: Passed to every client's constructor.
+        :return: The secrets of each session, or the exception it failed with.
+        """
+        results = [None] * n
+        sessions = iter(range(n))
+
+        async def run(index: int):
+            async with cls(**client_kwargs) as client:
+                results[index] = await asyncio.wait_for(client.start(port), timeout)
+
+        async def worker():
+            # Each worker runs one session at a time, so that only
+            # `concurrency` sessions (and their sockets) exist at once.
+            for index in sessions:
+                try:
+                    await run(index)
+                except Exception as e:
+                    results[index] = e
+
+        await asyncio.gather(*(worker() for _ in range(min(concurrency, n))))
+        return results
+
+
+def main():
+    started = time.monotonic()
+    results = asyncio.run(AsyncClient.run_many(1000, concurrency=100, timeout=10,
+                                               ip_addr='localhost'))
+    failed = sum(isinstance(result, BaseException) for result in results)
+    logger.info("[Complete] Ran %d sessions (%d failed) in %.3f seconds.",
+                len(results), failed, time.monotonic() - started)
+
+
+if __name__ == '__main__':
+    main()
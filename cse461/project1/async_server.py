@@ -0,0 +1,500 @@
+import threading
+import asyncio
+import logging
+import socket
+import secrets
+import errno
+import random
+import struct
+
+from typing import Callable, Optional
+from cse461.project1.packet import (Packet, PacketView, HEADER, UINT32, STAGE_A_RESPONSE,
+                                    STAGE_B_RESPONSE, STAGE_C_RESPONSE)
+from cse461.project1.batch import PacketBatch
+from cse461.project1.logs import LogSampler
+from cse461.project1.consts import *
+
+__all__ = ['AsyncServer']
+logger = logging.getLogger(__name__)
+
+Address = tuple
+
+
+class DatagramHandler(asyncio.DatagramProtocol):
+    """DatagramProtocol that forwards every datagram to `callback` and
+    closes its transport after `timeout` seconds without receiving one.
+    Timeouts are logged when `sample()` (e.g. a LogSampler) is true."""
+
+    def __init__(self,
+                 callback: Callable,
+                 timeout: float = None,
+                 after_close: Callable = lambda: None,
+                 sample: Callable[[], bool] = lambda: True):
+        self.callback = callback
+        self.timeout = timeout
+        self.after_close = after_close
+        self.sample = sample
+        self.transport = None
+        self.timer = None
+
+    def reset_timer(self):
+        if self.timeout is None:
+            return
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = asyncio.get_running_loop().call_later(self.timeout, self.handle_timeout)
+
+    def handle_timeout(self):
+        if self.sample():
+            logger.debug("UDP server at %s:%d timed out. Shutting down.",
+                         *self.transport.get_extra_info('sockname')[:2])
+        self.transport.close()
+
+    def connection_made(self, transport: asyncio.DatagramTransport):
+        self.transport = transport
+        self.reset_timer()
+
+    def datagram_received(self, data: bytes, addr: Address):
+        self.reset_timer()
+        self.callback(self.transport, data, addr)
+
+    def connection_lost(self, exc: Optional[Exception]):
+        if self.timer is not None:
+            self.timer.cancel()
+        self.after_close()
+
+
+class AsyncServer:
+    """Single-threaded asyncio implementation of the protocol outlined in
+    CSE 461 SPR 2020 Project 1 (Sockets API).
+
+    Speaks the same wire protocol as Server, but every stage runs on one
+    event loop: UDP stages use DatagramProtocol endpoints, stages C and D
+    use asyncio.start_server and timeouts are loop timers rather than
+    blocked threads.
+
+    Usage:
+    >>> server = AsyncServer(ip_addr='localhost')
+    >>> server.run()
+    >>> # Run forever...
+
+    Run in the background (the event loop runs in a single thread):
+    >>> server = AsyncServer()
+    >>> server.start()
+    >>> # Do other stuff...
+    >>> server.stop()
+
+    Or from a coroutine on an existing event loop:
+    >>> await server.serve()
+    """
+
+    def __init__(self, ip_addr: str = SERVER_ADDR, log_sample_rate: int = LOG_SAMPLE_RATE):
+        """
+        Constructor. Initializes the server but does not start it.
+        To start the server, call start(), run() or serve().
+
+        :param ip_addr: IP Address for this server. Defaults to consts.SERVER_ADDR.
+        :param log_sample_rate: Log one in this many packets at DEBUG level.
+                        Defaults to consts.LOG_SAMPLE_RATE.
+        """
+        self.ip_addr = ip_addr
+        # Numeric address to bind to. Binding to a hostname makes asyncio
+        # resolve it in a worker thread every time a server is started.
+        self.bind_addr = None
+        # Sessions in progress. Removed once the session moves on to its
+        # next secret, or when its server times out.
+        self.secrets = {}
+        self.tcp_servers = {}
+        self.udp_servers = {}
+        # Ports handed out by random_port() that are not bound yet
+        self.reserved_ports = set()
+        # Keep references to background tasks so they are not garbage collected
+        self.tasks = set()
+        self.loop = None
+        self.thread = None
+        self.sample = LogSampler(logger, rate=log_sample_rate)
+
+    async def serve(self, port: int = START_PORT):
+        """Starts listening for stage A packets on `port` on the running event loop."""
+        self.bind_addr = socket.gethostbyname(self.ip_addr)
+        await self.start_udp_server(port, self.handle_stage_a)
+        logger.info(f"[Start] Started new UDP server at {self.ip_addr}:{port}.")
+
+    async def close(self):
+        """Closes all servers started by this AsyncServer."""
+        for tcp_server in list(self.tcp_servers.values()):
+            tcp_server.close()
+        for udp_server in list(self.udp_servers.values()):
+            udp_server.close()
+        # Let connection_lost callbacks run
+        await asyncio.sleep(0)
+
+    def start(self, port: int = START_PORT):
+        """Starts the server on a new event loop in a background thread."""
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.serve(port), self.loop).result()
+
+    def stop(self):
+        logger.info("[Stop] Received stop request. Shutting down servers and cleaning up.")
+        if self.loop is not None and self.loop.is_running():
+            asyncio.run_coroutine_threadsafe(self.close(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop.close()
+        logger.info("[Stop] Successfully shut down all servers. Exiting.")
+
+    def spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def start_udp_server(self, port: int, callback: Callable, timeout: float = None,
+                               secret: int = None):
+        """Starts a UDP server on `port`. Once it closes, the session with
+        `secret` (if it is still in progress) is removed."""
+
+        def after_close():
+            self.udp_servers.pop(port)
+            if secret is not None:
+                self.secrets.pop(secret, None)
+
+        transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: DatagramHandler(callback, timeout=timeout, after_close=after_close,
+                                    sample=self.sample),
+            local_addr=(self.bind_addr, port)
+        )
+        assert port not in self.udp_servers
+        self.udp_servers[port] = transport
+        self.reserved_ports.discard(port)
+
+    async def start_tcp_server(self, port: int, response: Packet):
+        loop = asyncio.get_running_loop()
+
+        def handle_timeout():
+            if self.sample():
+                logger.debug("TCP server at %s:%d timed out. Shutting down.",
+                             self.ip_addr, port)
+            self.close_tcp_server(port)
+            # The client never connected
+            self.secrets.pop(response.p_secret, None)
+
+        timer = loop.call_later(TIMEOUT, handle_timeout)
+
+        async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            # TCP only handles a single request
+            timer.cancel()
+            self.close_tcp_server(port)
+            try:
+                await self.handle_stage_c(reader, writer, response)
+            finally:
+                writer.close()
+
+        server = await asyncio.start_server(handle_connection, self.bind_addr, port)
+        assert port not in self.tcp_servers
+        self.tcp_servers[port] = server
+        self.reserved_ports.discard(port)
+
+    def close_tcp_server(self, port: int):
+        server = self.tcp_servers.pop(port, None)
+        if server is not None:
+            server.close()
+
+    def handle_stage_a(self, transport: asyncio.DatagramTransport, data: bytes, addr: Address):
+        # Log every message about this packet, or none of them
+        sampled = self.sample()
+        if sampled:
+            logger.debug("[Stage A] Received packet %r from %s:%d", data, *addr[:2])
+        try:
+            packet = PacketView(data)
+        except ValueError as e:
+            # Packet is malformed
+            logger.error("%s", e)
+            return
+
+        if (packet.payload_len != 12 or
+                packet.p_secret != 0 or
+                packet.step != 1 or
+                packet.payload.tobytes().lower() != b'hello world\0'):
+            logger.error("[Stage A] Packet does not conform to protocol. "
+                         "Packet info: %r", packet)
+            return
+
+        self.spawn(self.start_stage_b(transport, packet.student_id, addr, sampled))
+
+    async def start_stage_b(self, transport: asyncio.DatagramTransport,
+                            student_id: int, addr: Address, sampled: bool = False):
+        num_packets = random.randint(5, 10)
+        # Guarantee that packet_len is a multiple of 4.
+        packet_len = random.randint(1, 10) * 4
+        secret_a = self.generate_secret()
+        # Store relevant data for stage B
+        self.secrets[secret_a] = {
+            'prev_stage': "a",
+            "num_packets": num_packets,
+            # Number of packets that the server is still expecting to receive
+            "remaining_packets": num_packets,
+            # For stage B, don't acknowledge one packet
+            "ack_fails": {random.choice(range(num_packets))},
+            "packet_len": packet_len
+        }
+        while True:
+            udp_port = self.random_port()
+            try:
+                await self.start_udp_server(udp_port, self.handle_stage_b, timeout=TIMEOUT,
+                                            secret=secret_a)
+                break
+            except OSError as e:
+                self.release_port(udp_port, e)
+        if sampled:
+            logger.debug("[Stage A] Started new UDP server at %s:%d.", self.ip_addr, udp_port)
+
+        payload = STAGE_A_RESPONSE.pack(num_packets, packet_len, udp_port, secret_a)
+        response = Packet(
+            payload=payload,
+            p_secret=0,
+            step=2,
+            student_id=student_id
+        )
+        if sampled:
+            logger.debug("[Stage A] Sending packet %r to %s:%d", response, *addr[:2])
+        transport.sendto(response.bytes, addr)
+
+    def handle_stage_b(self, transport: asyncio.DatagramTransport, data: bytes, addr: Address):
+        # Log every message about this packet, or none of them
+        sampled = self.sample()
+        if sampled:
+            logger.debug("[Stage B] Received packet %r from %s:%d", data, *addr[:2])
+        try:
+            packet = PacketView(data)
+        except ValueError as e:
+            # Malformed packet
+            logger.error("%s", e)
+            return
+        try:
+            session = self.secrets[packet.p_secret]
+            packet_id = UINT32.unpack_from(packet.payload)[0]
+        except KeyError:
+            logger.error("Unrecognized secret: %d", packet.p_secret)
+            return
+        except struct.error:
+            logger.error("Packet payload must be at least 4 bytes long")
+            return
+        assert session['prev_stage'] == "a"
+        num_packets = session["num_packets"]
+        remaining_packets = session["remaining_packets"]
+        # Ensure that this packet is a valid packet for step b1
+        if (packet.step != 1 or
+                session['packet_len'] + 4 != len(packet.payload)):
+            logger.error("[Stage B] Packet does not conform to protocol. "
+                         "Packet info: %r\n"
+                         "packet.step: %d, expected: 1\n"
+                         "len(packet.payload): %d, expected: %d\n"
+                         "packet_id: %d, expected: %d, "
+                         "num_packets: %d, remaining_packets: %d",
+                         packet, packet.step, len(packet.payload), session['packet_len'] + 4,
+                         packet_id, num_packets - remaining_packets,
+                         num_packets, remaining_packets)
+            return
+
+        if packet_id in session["ack_fails"]:
+            if sampled:
+                logger.debug("[Stage B] Dropping packet with id %d", packet_id)
+            session["ack_fails"].remove(packet_id)
+            return
+
+        if sampled:
+            logger.debug("[Stage B] Acknowledging packet with id %d", packet_id)
+        # Only decrement remaining_packets if this is not a resent packet.
+        # Stage C is started once, by the packet that completes stage B.
+        completed = False
+        if num_packets - remaining_packets == packet_id:
+            session["remaining_packets"] -= 1
+            completed = session["remaining_packets"] == 0
+        if completed:
+            del self.secrets[packet.p_secret]
+        ack = Packet(
+            payload=UINT32.pack(packet_id),
+            p_secret=packet.p_secret,
+            step=2,
+            student_id=packet.student_id
+        )
+        transport.sendto(ack.bytes, addr)
+
+        if completed:
+            self.spawn(self.start_stage_c(transport, packet.student_id, addr, sampled))
+
+    async def start_stage_c(self, transport: asyncio.DatagramTransport,
+                            student_id: int, addr: Address, sampled: bool = False):
+        secret_b = self.generate_secret()
+        self.secrets[secret_b] = {'prev_stage': "b"}
+
+        while True:
+            tcp_port = self.random_port()
+            payload = STAGE_B_RESPONSE.pack(tcp_port, secret_b)
+            response = Packet(
+                payload=payload,
+                p_secret=secret_b,
+                step=2,
+                student_id=student_id
+            )
+            try:
+                await self.start_tcp_server(tcp_port, response)
+                break
+            except OSError as e:
+                self.release_port(tcp_port, e)
+
+        if sampled:
+            logger.debug("[Stage B] Started new TCP server at %s:%d.", self.ip_addr, tcp_port)
+            logger.debug("[Stage B] Sending packet %r to %s:%d", response, *addr[:2])
+        transport.sendto(response.bytes, addr)
+
+    async def handle_stage_c(self, reader: asyncio.StreamReader,
+                             writer: asyncio.StreamWriter, packet: Packet):
+        # The session moves on to secret_c below
+        assert self.secrets.pop(packet.p_secret)["prev_stage"] == "b"
+        addr = writer.get_extra_info('peername')
+        # Log every message about this connection, or none of them
+        sampled = self.sample()
+
+        num2 = random.randint(1, 10)
+        len2 = random.randint(1, 10) * 4
+        secret_c = self.generate_secret()
+        char = secrets.token_bytes(1)
+
+        self.secrets[secret_c] = {
+            "prev_stage": "c",
+            "num2": num2,
+            "len2": len2,
+            "char": char
+        }
+        payload = STAGE_C_RESPONSE.pack(num2, len2, secret_c, char * 4)
+
+        response = Packet(
+            payload=payload,
+            p_secret=packet.p_secret,
+            step=2,
+            student_id=packet.student_id
+        )
+        if sampled:
+            logger.debug("[Stage C] Sending packet %r to %s:%d", response, *addr[:2])
+        try:
+            writer.write(response.bytes)
+            await writer.drain()
+            await self.handle_stage_d(reader, writer, sampled)
+        finally:
+            # The session is over, whether or not stage D succeeded
+            self.secrets.pop(secret_c, None)
+
+    async def handle_stage_d(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                             sampled: bool = False):
+        addr = writer.get_extra_info('peername')
+
+        try:
+            header = await asyncio.wait_for(reader.readexactly(HEADER.size), TIMEOUT)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+            logger.error("[Stage D] Failed to receive data from %s:%d: %r", *addr[:2], e)
+            return
+
+        payload_len, secret_c, step, student_id = HEADER.unpack(header)
+        try:
+            prev_stage = self.secrets[secret_c]['prev_stage']
+            num2 = self.secrets[secret_c]["num2"]
+            len2 = self.secrets[secret_c]["len2"]
+            char = self.secrets[secret_c]["char"]
+        except KeyError:
+            logger.error("Unrecognized secret: %d", secret_c)
+            return
+        assert prev_stage == "c"
+
+        try:
+            data = header + await asyncio.wait_for(
+                reader.readexactly(num2 * (HEADER.size + len2) - HEADER.size), TIMEOUT)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+            logger.error("[Stage D] Failed to receive %d packets from %s:%d: %r",
+                         num2, *addr[:2], e)
+            return
+        if sampled:
+            logger.debug("[Stage D] Received data %r from %s:%d", data, *addr[:2])
+
+        # Every packet must be a copy of the first, with the session's
+        # secret and payload, so the whole burst is checked at once.
+        expected = PacketBatch.repeat(Packet(payload=char * len2, p_secret=secret_c,
+                                             step=step, student_id=student_id), num2)
+        batch = PacketBatch(data, payload_len=len2, count=num2)
+        index = batch.compare(expected)
+        if index is not None:
+            logger.error("[Stage D] Packet %d does not conform to protocol. "
+                         "Packet info: %r, expected: %r", index, batch[index], expected[index])
+            return
+
+        payload = UINT32.pack(self.generate_secret())
+        response = Packet(
+            payload=payload,
+            p_secret=secret_c,
+            step=2,
+            student_id=student_id
+        )
+        if sampled:
+            logger.debug("[Stage D] Sending packet %r to %s:%d", response, *addr[:2])
+        writer.write(response.bytes)
+        await writer.drain()
+
+    def generate_secret(self) -> int:
+        """Returns a unique, cryptographically secure secret."""
+        while True:
+            secret = secrets.randbits(32)
+            if secret not in self.secrets:
+                return secret
+
+    def random_port(self) -> int:
+        """Returns a unique random port."""
+        while True:
+            port = random.randint(1024, 49151)
+            if (port not in self.udp_servers and
+                    port not in self.tcp_servers and
+                    port not in self.reserved_ports):
+                self.reserved_ports.add(port)
+                return port
+
+    def release_port(self, port: int, error: OSError):
+        """Releases a port returned by random_port() that failed to bind with
+        `error`. Re-raises `error` unless another socket already owns the port."""
+        self.reserved_ports.discard(port)
+        if error.errno != errno.EADDRINUSE:
+            raise error
+        logger.info(f"Port {port} is already in use. Retrying with a new port.")
+
+    def run(self, seconds: float = None, port: int = START_PORT):
+        """Convenience function target for testing. Runs this server on the
+        current thread for a maximum of `seconds` seconds. If `seconds` is
+        None, runs until this server is not listening to any ports (all timed
+        out or closed)."""
+
+        async def run():
+            try:
+                await self.serve(port)
+                loop = asyncio.get_running_loop()
+                deadline = None if seconds is None else loop.time() + seconds
+                while (self.udp_servers or self.tcp_servers) and (
+                        deadline is None or loop.time() < deadline):
+                    await asyncio.sleep(0.1)
+            finally:
+                await self.close()
+
+        asyncio.run(run())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def main():
+    AsyncServer().run(seconds=20)
+
+
+if __name__ == '__main__':
+    main()
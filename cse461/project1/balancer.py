@@ -0,0 +1,234 @@
+import collections
+import threading
+import hashlib
+import logging
+import bisect
+import socket
+
+from typing import Dict, Iterable, Optional, Sequence, Tuple, Union
+from cse461.project1.packet import HEADER
+from cse461.project1.datagrams import DatagramBatch, encapsulate
+from cse461.project1.scheduler import Scheduler
+from cse461.project1.wrappers import Stoppable, synchronized
+from cse461.project1.consts import *
+
+__all__ = ['Balancer', 'HashRing']
+logger = logging.getLogger(__name__)
+
+Address = Tuple[str, int]
+
+
+class HashRing:
+    """Consistent hash ring mapping keys to nodes.
+
+    Each node is placed on the ring at `replicas` pseudo-random points,
+    and a key belongs to the node at the first point after the key's
+    hash. Adding or removing a node only moves the keys of that node's
+    points (about 1/len(nodes) of all keys).
+
+    Usage:
+    >>> ring = HashRing([0, 1, 2])
+    >>> ring.lookup(b'127.0.0.1:5000') in (0, 1, 2)
+    True
+    """
+
+    def __init__(self, nodes: Iterable[int] = (), replicas: int = 64):
+        self.replicas = replicas
+        # Sorted hashes of every point, and the node at each point
+        self.points = []
+        self.nodes = []
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def hash(key: bytes) -> int:
+        return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'big')
+
+    def add(self, node: int):
+        for replica in range(self.replicas):
+            point = self.hash(f"{node}-{replica}".encode())
+            index = bisect.bisect(self.points, point)
+            self.points.insert(index, point)
+            self.nodes.insert(index, node)
+
+    def remove(self, node: int):
+        keep = [i for i, n in enumerate(self.nodes) if n != node]
+        self.points = [self.points[i] for i in keep]
+        self.nodes = [self.nodes[i] for i in keep]
+
+    def lookup(self, key: bytes) -> int:
+        """Returns the node that `key` belongs to."""
+        if not self.points:
+            raise LookupError("The ring has no nodes")
+        index = bisect.bisect(self.points, self.hash(key)) % len(self.points)
+        return self.nodes[index]
+
+    def __len__(self):
+        """Number of nodes on the ring."""
+        return len(set(self.nodes))
+
+
+class Balancer(Stoppable):
+    """UDP front end spreading stage A and B datagrams over several
+    Servers (nodes) that clients reach through one address.
+
+    Hellos (p_secret 0) are routed by consistent hashing of the client's
+    address. Every later datagram is routed to the node whose ID is in the
+    top `node_bits` bits of its p_secret, which is the node that issued
+    the secret (see the node_id and node_bits arguments of Server). If
+    node_bits is 0, every datagram is routed by the client's address.
+
+    The Balancer keeps no per-client or per-session state: datagrams are
+    relayed to a node with the client's address prepended (see
+    datagrams.encapsulate()), and the node's replies carry the address
+    back. Nodes must therefore be started with balancer_port set to the
+    Balancer's port.
+
+    Only UDP is relayed: clients connect to the TCP port in the stage B
+    response at the address they sent it to, which is the Balancer's.
+    Every node must therefore listen on the Balancer's IP address.
+
+    Usage:
+    >>> servers = [Server(node_id=i, node_bits=2, balancer_port=12235)
+    ...            for i in range(3)]
+    >>> for i, server in enumerate(servers):
+    ...     server.start(12240 + i)
+    >>> balancer = Balancer([('localhost', 12240 + i) for i in range(3)], node_bits=2)
+    >>> balancer.start(12235)
+    >>> # Clients connect to port 12235...
+    >>> balancer.stop()
+    """
+
+    def __init__(self, backends: Union[Sequence[Address], Dict[int, Address]],
+                 ip_addr: str = SERVER_ADDR, node_bits: int = 0, replicas: int = 64):
+        """
+        Constructor. Initializes the balancer but does not start it.
+        To start the balancer, call start() or run().
+
+        :param backends: Stage A address of each node, indexed by node ID.
+                    Every node must listen on `ip_addr`.
+        :param ip_addr: IP Address to listen on. Defaults to consts.SERVER_ADDR.
+        :param node_bits: Number of bits of each secret holding the node ID.
+        :param replicas: Number of points per node on the hash ring.
+        :raises ValueError: If a node ID doesn't fit in node_bits bits, or
+                    a node doesn't listen on `ip_addr`.
+        """
+        if not isinstance(backends, dict):
+            backends = dict(enumerate(backends))
+        if node_bits and any(node >= 1 << node_bits for node in backends):
+            raise ValueError(f"Node IDs must fit in {node_bits} bits")
+        host = socket.gethostbyname(ip_addr)
+        remote = sorted(node for node, (node_ip, _) in backends.items()
+                        if socket.gethostbyname(node_ip) != host)
+        if remote:
+            raise ValueError(f"Nodes {remote} must listen on {ip_addr}, since "
+                             f"stage C and D connect to them there")
+        self.backends = backends
+        self.ip_addr = ip_addr
+        self.node_bits = node_bits
+        self.ring = HashRing(backends, replicas)
+        self.scheduler = None
+        # Receives datagrams from clients
+        self.front = None
+        # Relays datagrams to nodes and receives their replies
+        self.upstream = None
+        self.batch = DatagramBatch()
+        self.replies = DatagramBatch(proxied=True)
+        # Set to make run() return (e.g. on SIGINT or SIGTERM)
+        self.stop_requested = threading.Event()
+        self.counts = collections.Counter()
+        self.counts_lock = threading.Lock()
+        self.lock = threading.RLock()
+
+        self.start = synchronized(self.start, lock=self.lock)
+        self.stop = synchronized(self.stop, lock=self.lock)
+
+    def start(self, port: int = START_PORT):
+        self.front = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.front.bind((self.ip_addr, port))
+        self.upstream = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.upstream.bind((self.ip_addr, 0))
+        self.scheduler = Scheduler()
+        self.scheduler.start()
+        self.scheduler.add_reader(self.front, self.handle_front)
+        self.scheduler.add_reader(self.upstream, self.handle_upstream)
+        logger.info(f"[Start] Balancing {self.ip_addr}:{port} over "
+                    f"{len(self.backends)} nodes.")
+
+    def stop(self):
+        if self.scheduler is not None:
+            self.scheduler.stop()
+            self.scheduler = None
+        for sock in (self.front, self.upstream):
+            if sock is not None:
+                sock.close()
+        logger.info(f"[Stop] Balancer stopped. Stats: {self.stats()}")
+
+    def route(self, data: memoryview, client_address: Address) -> Optional[int]:
+        """Returns the ID of the node to relay `data` from `client_address`
+        to, or None if it belongs to no node."""
+        if len(data) < HEADER.size:
+            return None
+        p_secret = HEADER.unpack_from(data)[1]
+        if p_secret == 0 or not self.node_bits:
+            return self.ring.lookup(f"{client_address[0]}:{client_address[1]}".encode())
+        node = p_secret >> (32 - self.node_bits)
+        return node if node in self.backends else None
+
+    def handle_front(self):
+        """Relays every datagram waiting on the front socket to its node.
+        Runs on the scheduler's thread."""
+        forwarded = collections.Counter()
+        for request in self.batch.recv(self.front):
+            node = self.route(request.data, request.client_address)
+            if node is None:
+                forwarded['dropped'] += 1
+                continue
+            try:
+                self.upstream.sendto(encapsulate(request.client_address, request.data),
+                                     self.backends[node])
+            except OSError:
+                forwarded['dropped'] += 1
+                continue
+            forwarded['forwarded'] += 1
+            forwarded[f"node_{node}"] += 1
+        with self.counts_lock:
+            self.counts.update(forwarded)
+
+    def handle_upstream(self):
+        """Relays every reply waiting on the upstream socket to its client.
+        Runs on the scheduler's thread."""
+        sent = 0
+        for request in self.replies.recv(self.upstream):
+            try:
+                self.front.sendto(request.data, request.client_address)
+                sent += 1
+            except OSError:
+                continue
+        with self.counts_lock:
+            self.counts['replies'] += sent
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the number of datagrams forwarded (in total and to each
+        node), dropped because they belonged to no node, and of replies
+        relayed back to clients."""
+        stats = {'forwarded': 0, 'dropped': 0, 'replies': 0}
+        with self.counts_lock:
+            stats.update(self.counts)
+        return stats
+
+    def run(self, seconds: float = None, port: int = START_PORT):
+        """Runs the balancer until `seconds` seconds have passed (forever if
+        None), SIGINT or SIGTERM is received, or request_stop() is called."""
+        with self.stop_on_signals():
+            try:
+                self.start(port)
+                self.stop_requested.wait(seconds)
+            finally:
+                self.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
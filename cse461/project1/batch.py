@@ -0,0 +1,217 @@
+import struct
+from typing import Iterable, Iterator, Optional, Union
+
+from cse461.project1.packet import Packet, PacketView, HEADER
+
+try:
+    import numpy as np
+except ImportError:
+    # Fall back to struct.iter_unpack
+    np = None
+
+__all__ = ['PacketBatch']
+
+
+class PacketBatch:
+    """Fixed-size packets stored back to back in one contiguous buffer
+    (e.g. the packets sent by a client in stage D).
+
+    Decoding and validating a batch happens in a single call rather than
+    one Packet per slice. If NumPy is installed, the buffer is viewed as a
+    structured array with one record per packet and comparisons are
+    vectorized; otherwise struct.iter_unpack is used.
+
+    Usage:
+    >>> batch = PacketBatch(data, payload_len=len2, count=num2)
+    >>> batch.find_mismatch(payload=char * len2) is None
+    True
+
+    Compare a batch against the exact packets expected, in one comparison:
+    >>> batch.compare(PacketBatch.repeat(packet, num2)) is None
+    True
+
+    Encode `num2` copies of a packet:
+    >>> sock.sendall(PacketBatch.repeat(packet, num2).bytes)
+    """
+    __slots__ = ('buffer', 'payload_len', 'packet_size', 'count')
+
+    def __init__(self,
+                 buffer: Union[bytes, bytearray, memoryview],
+                 payload_len: int,
+                 count: int = None):
+        """
+        Constructs a PacketBatch over `buffer` without copying it.
+
+        :param buffer: Buffer containing the packets.
+        :param payload_len: Payload length of every packet in the batch.
+        :param count: Number of packets in the batch. Trailing data in
+                    `buffer` after `count` packets is ignored. If None,
+                    `buffer` must hold a whole number of packets.
+        :raises: ValueError if `buffer` does not hold `count` packets.
+        """
+        view = memoryview(buffer)
+        if view.format != 'B':
+            view = view.cast('B')
+        packet_size = HEADER.size + payload_len + (-payload_len % 4)
+
+        if count is None:
+            if view.nbytes % packet_size != 0:
+                raise ValueError(f"`buffer` is not a whole number of "
+                                 f"{packet_size}-byte packets.")
+            count = view.nbytes // packet_size
+        elif view.nbytes < count * packet_size:
+            raise ValueError(f"`buffer` is truncated: expected {count} "
+                             f"{packet_size}-byte packets, got {view.nbytes} bytes.")
+
+        self.buffer = view[:count * packet_size]
+        self.payload_len = payload_len
+        self.packet_size = packet_size
+        self.count = count
+
+    @classmethod
+    def encode(cls, packets: Iterable[Packet]):
+        """
+        Encodes `packets` into a single buffer.
+
+        :param packets: Packets to encode. All packets must have the same payload_len.
+        :raises: ValueError if `packets` is empty or payload lengths differ.
+        :rtype: PacketBatch
+        """
+        packets = list(packets)
+        if not packets:
+            raise ValueError("`packets` must contain at least one Packet.")
+        payload_len = packets[0].payload_len
+        if any(packet.payload_len != payload_len for packet in packets):
+            raise ValueError("All packets in a PacketBatch must have the same payload_len.")
+
+        return cls(b''.join(packet.bytes for packet in packets), payload_len)
+
+    @classmethod
+    def repeat(cls, packet: Packet, count: int):
+        """
+        Encodes `count` copies of `packet` into a single buffer.
+
+        :rtype: PacketBatch
+        """
+        return cls(packet.bytes * count, packet.payload_len, count)
+
+    @property
+    def bytes(self) -> bytes:
+        return self.buffer.tobytes()
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index: int) -> PacketView:
+        if not -self.count <= index < self.count:
+            raise IndexError("PacketBatch index out of range")
+        start = (index % self.count) * self.packet_size
+        return PacketView(self.buffer[start:start + self.packet_size])
+
+    def __iter__(self) -> Iterator[PacketView]:
+        for start in range(0, self.buffer.nbytes, self.packet_size):
+            yield PacketView(self.buffer[start:start + self.packet_size])
+
+    def _struct(self) -> struct.Struct:
+        return struct.Struct(f"{HEADER.format}{self.packet_size - HEADER.size}s")
+
+    def _dtype(self):
+        return np.dtype([('payload_len', '>u4'),
+                         ('p_secret', '>u4'),
+                         ('step', '>u2'),
+                         ('student_id', '>u2'),
+                         ('payload', f'V{self.packet_size - HEADER.size}')])
+
+    def records(self):
+        """
+        Decodes every packet in the batch.
+
+        :return: A NumPy structured array with fields payload_len, p_secret,
+                    step, student_id and payload if NumPy is installed,
+                    otherwise a list of (payload_len, p_secret, step,
+                    student_id, payload) tuples.
+        """
+        if np is not None:
+            return np.frombuffer(self.buffer, dtype=self._dtype())
+        return list(self._struct().iter_unpack(self.buffer))
+
+    def compare(self, expected: Union[bytes, 'PacketBatch']) -> Optional[int]:
+        """
+        Compares the whole batch against the packets it is expected to
+        hold (e.g. PacketBatch.repeat(packet, count)) in a single bytes
+        comparison. The mismatching packet is only searched for if the
+        comparison fails.
+
+        :param expected: Expected packets, in the same layout as the batch.
+        :return: Index of the first packet that does not match, or None if
+                    all packets match.
+        """
+        if isinstance(expected, PacketBatch):
+            expected = expected.buffer
+        expected = bytes(expected)
+        # Comparing memoryviews goes item by item, while comparing bytes
+        # is a memcmp, so compare the underlying bytes object if the
+        # batch spans all of it.
+        data = self.buffer.obj
+        if not isinstance(data, bytes) or len(data) != self.buffer.nbytes:
+            data = self.buffer.tobytes()
+        if data == expected:
+            return None
+
+        if len(data) != len(expected):
+            # Packets past the shorter of the two don't match
+            size = min(len(data), len(expected))
+            index = self._first_difference(data[:size], expected[:size])
+            return size // self.packet_size if index is None else index
+        return self._first_difference(data, expected)
+
+    def _first_difference(self, data: bytes, expected: bytes) -> Optional[int]:
+        """Returns the index of the first packet that differs between
+        `data` and `expected`, which have the same length."""
+        if np is not None:
+            differences = np.flatnonzero(np.frombuffer(data, dtype=np.uint8)
+                                         != np.frombuffer(expected, dtype=np.uint8))
+            return int(differences[0]) // self.packet_size if differences.size else None
+        for index, start in enumerate(range(0, len(data), self.packet_size)):
+            end = start + self.packet_size
+            if data[start:end] != expected[start:end]:
+                return index
+        return None
+
+    def find_mismatch(self,
+                      payload_len: int = None,
+                      p_secret: int = None,
+                      step: int = None,
+                      student_id: int = None,
+                      payload: bytes = None) -> Optional[int]:
+        """
+        Compares every packet in the batch against the expected field values.
+        Fields that are None are not checked.
+
+        :param payload: Expected payload, excluding alignment padding.
+        :return: Index of the first packet that does not match, or None if
+                    all packets match.
+        """
+        expected = (payload_len, p_secret, step, student_id)
+        if payload is not None:
+            # Padding bytes are always zero
+            payload = payload.ljust(self.packet_size - HEADER.size, b'\0')
+
+        if np is not None:
+            records = self.records()
+            matches = np.ones(self.count, dtype=bool)
+            for name, value in zip(('payload_len', 'p_secret', 'step', 'student_id'), expected):
+                if value is not None:
+                    matches &= records[name] == value
+            if payload is not None:
+                matches &= records['payload'] == np.void(payload)
+            mismatches = np.flatnonzero(~matches)
+            return int(mismatches[0]) if mismatches.size else None
+
+        checks = [(i, value) for i, value in enumerate(expected + (payload,))
+                  if value is not None]
+        for index, fields in enumerate(self._struct().iter_unpack(self.buffer)):
+            for i, value in checks:
+                if fields[i] != value:
+                    return index
+        return None
@@ -1,15 +1,19 @@
 import socket
-import struct
 import logging
+import time
 
+from typing import Callable, Iterable
 from cse461.project1.packet import Packet
-from cse461.project1.consts import CLIENT_ADDR, START_PORT, STUDENT_ID
+from cse461.project1.framer import PacketFramer
+from cse461.project1.protocol import ClientProtocol, Exchange, sample
+from cse461.project1.consts import (CLIENT_ADDR, START_PORT, STUDENT_ID, STAGE_B_WINDOW,
+                                    MAX_RETRIES)
 
 __all__ = ['Client']
 logger = logging.getLogger(__name__)
 
 
-class Client:
+class Client(ClientProtocol):
     """Client implementation for protocol outlined in CSE 461 SPR 2020
     Project 1 (Sockets API).
 
@@ -31,7 +35,8 @@ class Client:
     ...     # Do stuff with secrets
     """
 
-    def __init__(self, student_id: int = STUDENT_ID, ip_addr: str = CLIENT_ADDR):
+    def __init__(self, student_id: int = STUDENT_ID, ip_addr: str = CLIENT_ADDR,
+                 window: int = STAGE_B_WINDOW, retries: int = MAX_RETRIES):
         """
         Constructor. Creates a client that will run through the protocol once.
 
@@ -40,110 +45,124 @@ class Client:
                         consts.STUDENT_ID.
         :param ip_addr: IP Address to send all packets to. Defaults to
                         consts.CLIENT_ADDR.
+        :param window: Maximum number of stage B packets in flight (see
+                        SendWindow). Defaults to consts.STAGE_B_WINDOW.
+        :param retries: Number of times in a row a UDP request (a hello or
+                        a stage B packet) is sent again without a response
+                        before giving up with a TimeoutError. Defaults to
+                        consts.MAX_RETRIES.
         """
-        self.step = 1
-        self.secrets = {}
-        self.student_id = student_id
+        super().__init__(student_id, window=window, retries=retries)
         self.ip_addr = ip_addr
         self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # Reassembles packets received over tcp_socket
+        self.tcp_framer = PacketFramer()
         # Set in stage C, used in stage D
         self.tcp_port = None
 
+    def exchange(self, exchange: Exchange, resend: Callable[[], None]) -> Packet:
+        """
+        Receives UDP packets until `exchange` accepts one, calling `resend`
+        whenever it times out.
+
+        :raises TimeoutError: If no packet is accepted after self.retries
+                    resends.
+        """
+        while True:
+            self.udp_socket.settimeout(max(exchange.deadline - time.monotonic(), 0))
+            try:
+                packet = Packet.from_raw(self.udp_socket.recv(1024))
+            except socket.timeout:
+                exchange.timeout(time.monotonic())
+                resend()
+                continue
+            if exchange.receive(packet, time.monotonic()):
+                return packet
+
     def stage_a(self, port: int = START_PORT) -> Packet:
-        packet = Packet(
-            payload=b'hello world\0',
-            p_secret=0,
-            step=self.step,
-            student_id=self.student_id
-        )
-        logger.info(f"[Stage A] Sending packet {packet} to {self.ip_addr}:{port}")
-        self.udp_socket.sendto(packet.bytes, (self.ip_addr, port))
-        packet = Packet.from_raw(self.udp_socket.recv(1024))
-        secret = struct.unpack("!I", packet.payload[-4:])[0]
-        self.secrets['a'] = secret
-
-        logger.info("[Stage A] Finished.")
-        return packet
+        packet, exchange = self.hello(time.monotonic())
+
+        def send():
+            if sample():
+                logger.debug("[Stage A] Sending packet %r to %s:%d", packet, self.ip_addr, port)
+            self.udp_socket.sendto(packet.bytes, (self.ip_addr, port))
+
+        send()
+        response = self.exchange(exchange, send)
+        self.finish_stage_a(exchange, response)
+
+        logger.debug("[Stage A] Finished.")
+        return response
 
     def stage_b(self, response: Packet) -> Packet:
-        num, length, udp_port, secret_a = struct.unpack("!4I", response.payload)
-        # For stage b, unacknowledged packets should be re-sent
-        # after 0.5 seconds.
-        self.udp_socket.settimeout(0.5)
-
-        for packet_id in range(num):
-            while True:
-                payload = struct.pack(f"!I{length}s", packet_id, b'\0' * length)
-                packet = Packet(
-                    payload=payload,
-                    p_secret=secret_a,
-                    step=self.step,
-                    student_id=self.student_id
-                )
-                logger.info(f"[Stage B] Sending packet {packet} to {self.ip_addr}:{udp_port}")
-                self.udp_socket.sendto(packet.bytes, (self.ip_addr, udp_port))
-                try:
-                    response_packet = Packet.from_raw(self.udp_socket.recv(1024))
-                    ack = struct.unpack("!I", response_packet.payload)[0]
-
-                    if ack == packet_id:
-                        logger.info(f"[Stage B] Packet acknowledged (id: {packet_id})")
-                        break
-                    else:
-                        logger.info(f"[Stage B] Packet (id: {packet_id}) not acknowledged: "
-                                    f"expected payload {packet_id}, got {ack}. Retrying.")
-                except socket.timeout:
-                    logger.info(f"[Stage B] Packet dropped (id: {packet_id}). Retrying.")
+        stage_b = self.start_stage_b(response)
+        address = (self.ip_addr, stage_b.port)
+
+        def send(packets: Iterable[Packet]):
+            for packet in packets:
+                if sample():
+                    logger.debug("[Stage B] Sending packet %r to %s:%d", packet, *address)
+                self.udp_socket.sendto(packet.bytes, address)
+
+        while not stage_b.done:
+            send(stage_b.to_send(time.monotonic()))
+            self.udp_socket.settimeout(max(stage_b.deadline - time.monotonic(), 0))
+            try:
+                packet = Packet.from_raw(self.udp_socket.recv(1024))
+            except socket.timeout:
+                continue
+            stage_b.receive(packet, time.monotonic())
+
+        exchange = None
+        response = stage_b.response
+        if response is None:
+            exchange = stage_b.exchange(time.monotonic())
+            response = self.exchange(exchange, lambda: send(stage_b.packets))
         self.udp_socket.settimeout(None)
-        packet = Packet.from_raw(self.udp_socket.recv(1024))
-        secret = struct.unpack("!I", packet.payload[-4:])[0]
-        self.secrets['b'] = secret
+        self.finish_stage_b(stage_b, response, exchange)
 
-        logger.info("[Stage B] Finished.")
-        return packet
+        logger.debug("[Stage B] Finished.")
+        return response
 
     def stage_c(self, response: Packet) -> Packet:
-        tcp_port, secret_b = struct.unpack("!II", response.payload)
+        tcp_port = self.stage_c_port(response)
         self.tcp_socket.connect((self.ip_addr, tcp_port))
         self.tcp_port = tcp_port
 
-        logger.info(f"[Stage C] Connected to TCP socket at {self.ip_addr}:{tcp_port}")
-        packet = Packet.from_raw(self.tcp_socket.recv(1024))
-
-        secret = struct.unpack("!I", packet.payload[-4:])[0]
-        self.secrets['c'] = secret
+        logger.debug("[Stage C] Connected to TCP socket at %s:%d", self.ip_addr, tcp_port)
+        packet = self.tcp_framer.read_packets(self.tcp_socket)[0]
+        self.finish_stage_c(packet)
 
-        logger.info("[Stage C] Finished.")
+        logger.debug("[Stage C] Finished.")
         return packet
 
     def stage_d(self, response: Packet):
-        num2, len2, secret_c, char = struct.unpack("!3I4s", response.payload)
-        packet = Packet(
-            payload=bytes([char[0]]) * len2,
-            p_secret=secret_c,
-            step=self.step,
-            student_id=self.student_id
-        )
+        batch = self.stage_d_packets(response)
 
-        logger.info(f"[Stage D] Sending {num2} packets with data {packet.bytes} "
-                    f"to {self.ip_addr}:{self.tcp_port}")
-        self.tcp_socket.sendall(packet.bytes * num2)
+        if sample():
+            logger.debug("[Stage D] Sending %d packets with data %r to %s:%d",
+                         len(batch), batch[0].bytes, self.ip_addr, self.tcp_port)
+        self.tcp_socket.sendall(batch.buffer)
 
-        packet = Packet.from_raw(self.tcp_socket.recv(1024))
-        secret = struct.unpack("!I", packet.payload[-4:])[0]
-        self.secrets['d'] = secret
+        packet = self.tcp_framer.read_packets(self.tcp_socket)[0]
+        self.finish_stage_d(packet)
 
-        logger.info("[Stage D] Finished.")
+        logger.debug("[Stage D] Finished.")
 
     def start(self, port=START_PORT):
-        logger.info(f"[Start] Starting protocol. Connecting to server at {self.ip_addr}.")
+        logger.debug("[Start] Starting protocol. Connecting to server at %s.", self.ip_addr)
+        started = time.monotonic()
         resp = self.stage_a(port)
         resp = self.stage_b(resp)
         resp = self.stage_c(resp)
         self.stage_d(resp)
 
-        logger.info(f"[Complete] Acquired secrets: {self.secrets}")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("[Complete] Acquired secrets %s from %s:%d in %.3f seconds "
+                        "(%d retransmissions, RTT stats: %s).", self.secrets, self.ip_addr,
+                        port, time.monotonic() - started, self.retransmissions,
+                        self.rtt.stats())
         return self.secrets
 
     def stop(self):
@@ -1,4 +1,7 @@
-__all__ = ['SERVER_ADDR', 'CLIENT_ADDR', 'START_PORT', 'STUDENT_ID', 'TIMEOUT']
+__all__ = ['SERVER_ADDR', 'CLIENT_ADDR', 'START_PORT', 'STUDENT_ID', 'TIMEOUT',
+           'SESSION_TTL', 'MAX_SESSIONS', 'PORT_RANGE', 'WORKER_THREADS',
+           'WORKER_QUEUE_SIZE', 'LOG_SAMPLE_RATE', 'STAGE_B_WINDOW', 'RTO_INITIAL',
+           'RTO_MIN', 'RTO_MAX', 'MAX_RETRIES', 'CLOCK_SKEW']
 
 SERVER_ADDR = 'localhost'
 CLIENT_ADDR = 'localhost'
@@ -6,3 +9,29 @@ CLIENT_ADDR = 'localhost'
 START_PORT = 12235
 STUDENT_ID = 592
 TIMEOUT = 3
+# Seconds a server session may stay in one stage before it is discarded
+SESSION_TTL = 2 * TIMEOUT
+# Seconds by which the clocks of servers sharing a stateless token key
+# may differ
+CLOCK_SKEW = 1
+# Maximum number of server sessions kept in memory
+MAX_SESSIONS = 100_000
+# Ports (inclusive) that stage B and C servers may be started on
+PORT_RANGE = (1024, 49151)
+# Maximum number of threads handling server requests
+WORKER_THREADS = 64
+# Maximum number of server requests waiting for a thread
+WORKER_QUEUE_SIZE = 1024
+# Log one in this many packets at DEBUG level
+LOG_SAMPLE_RATE = 100
+# Maximum number of stage B packets a client keeps in flight
+STAGE_B_WINDOW = 4
+# Seconds a client waits for a UDP response before sending its request
+# again: until it has measured a round trip time, at least, and at most
+# (after backing off)
+RTO_INITIAL = 0.5
+RTO_MIN = 0.2
+RTO_MAX = 2
+# Number of times in a row a client sends a UDP request again without a
+# response before giving up
+MAX_RETRIES = 8
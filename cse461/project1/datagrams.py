@@ -0,0 +1,153 @@
+import socket
+import struct
+
+from typing import Any, Iterator, Tuple
+
+__all__ = ['DatagramBatch', 'DatagramRequest', 'encapsulate', 'decapsulate']
+
+# Receive without blocking, even on a blocking socket
+MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0)
+Address = Tuple[str, int]
+# Client address (IPv4 address and port) prepended to datagrams relayed
+# by a Balancer
+PROXY_HEADER = struct.Struct('!4sH')
+
+
+def encapsulate(client_address: Address, data: bytes) -> bytes:
+    """Prepends `client_address` to `data`, for relaying between a
+    Balancer and a server."""
+    return PROXY_HEADER.pack(socket.inet_aton(client_address[0]), client_address[1]) + data
+
+
+def decapsulate(data: memoryview) -> Tuple[Address, memoryview]:
+    """
+    Splits a datagram built by encapsulate().
+
+    :return: The client address and the original datagram.
+    :raises ValueError: If `data` is too short to hold a client address.
+    """
+    if len(data) < PROXY_HEADER.size:
+        raise ValueError(f"Relayed datagram must be at least {PROXY_HEADER.size} bytes long")
+    ip, port = PROXY_HEADER.unpack_from(data)
+    return (socket.inet_ntoa(ip), port), data[PROXY_HEADER.size:]
+
+
+class DatagramRequest:
+    """A datagram received as part of a DatagramBatch. Replies are queued on
+    the batch and sent when the batch is flushed.
+
+    `data` is a view of the batch's buffer, so it is only valid until the
+    batch is reused. Copy it (e.g. with bytes()) to keep it longer.
+
+    If the datagram was relayed by a Balancer, `via` is the Balancer's
+    address, and replies are relayed back through it.
+    """
+    __slots__ = ('data', 'client_address', 'server', 'batch', 'via')
+
+    def __init__(self, data: memoryview, client_address: Address, server: Any,
+                 batch: 'DatagramBatch', via: Address = None):
+        self.data = data
+        self.client_address = client_address
+        self.server = server
+        self.batch = batch
+        self.via = via
+
+    def reply(self, data: bytes):
+        """Queues `data` to be sent back to the client when the batch is flushed."""
+        if self.via is None:
+            self.batch.replies.append((data, self.client_address))
+        else:
+            self.batch.replies.append((encapsulate(self.client_address, data), self.via))
+
+
+class DatagramBatch:
+    """Preallocated buffers for receiving up to `size` datagrams of up to
+    `bufsize` bytes each in one go.
+
+    recv() drains every datagram that is ready on a socket (up to `size`)
+    into the buffers with recvfrom_into(), without blocking and without
+    allocating a buffer per datagram. Replies queued while processing the
+    batch are sent together by flush(). Batches are meant to be reused:
+    >>> batch = DatagramBatch()
+    >>> while True:
+    ...     for request in batch.recv(sock, server):
+    ...         request.reply(b'ack')
+    ...     batch.flush(sock)
+
+    Datagrams longer than `bufsize` are truncated.
+
+    If `proxied` is True, the datagrams are expected to be relayed by a
+    Balancer (see encapsulate()): each request's client_address is the
+    address the Balancer relayed it for, and replies go back through the
+    Balancer. Relayed datagrams without a valid client address are skipped.
+    """
+    __slots__ = ('buffer', 'views', 'lengths', 'addresses', 'count', 'replies', 'proxied')
+
+    def __init__(self, size: int = 64, bufsize: int = 1024, proxied: bool = False):
+        self.proxied = proxied
+        self.buffer = bytearray(size * bufsize)
+        view = memoryview(self.buffer)
+        self.views = [view[i * bufsize:(i + 1) * bufsize] for i in range(size)]
+        self.lengths = [0] * size
+        self.addresses = [None] * size
+        # Number of datagrams received by the last call to recv()
+        self.count = 0
+        # (data, address) pairs to send on flush()
+        self.replies = []
+
+    def recv(self, sock: socket.socket, server: Any = None) -> Iterator[DatagramRequest]:
+        """
+        Receives every datagram that is ready on `sock`, up to the size of
+        the batch, replacing the previous contents of the batch.
+
+        :param server: Server the datagrams were received by, passed on to
+                    each DatagramRequest.
+        :return: The received datagrams.
+        """
+        count = 0
+        size = len(self.views)
+        while count < size:
+            try:
+                nbytes, address = sock.recvfrom_into(self.views[count], 0, MSG_DONTWAIT)
+            except (BlockingIOError, InterruptedError):
+                break
+            self.lengths[count] = nbytes
+            self.addresses[count] = address
+            count += 1
+            if not MSG_DONTWAIT:
+                # Without MSG_DONTWAIT, any further receive could block
+                break
+        self.count = count
+        return self.requests(server)
+
+    def requests(self, server: Any = None) -> Iterator[DatagramRequest]:
+        for i in range(self.count):
+            data = self.views[i][:self.lengths[i]]
+            if not self.proxied:
+                yield DatagramRequest(data, self.addresses[i], server, self)
+                continue
+            try:
+                client_address, data = decapsulate(data)
+            except ValueError:
+                continue
+            yield DatagramRequest(data, client_address, server, self, via=self.addresses[i])
+
+    def flush(self, sock: socket.socket) -> int:
+        """
+        Sends every queued reply on `sock`.
+
+        :return: The number of replies sent.
+        """
+        replies, self.replies = self.replies, []
+        sent = 0
+        for data, address in replies:
+            try:
+                sock.sendto(data, address)
+                sent += 1
+            except OSError:
+                # Don't let one unreachable client hold up the other replies
+                continue
+        return sent
+
+    def __len__(self):
+        return self.count
@@ -0,0 +1,140 @@
+import socket
+from typing import Iterator, List, Optional
+
+from cse461.project1.packet import Packet, HEADER
+
+__all__ = ['PacketFramer']
+
+
+class PacketFramer:
+    """Incremental framer that reassembles Packets from a byte stream
+    (e.g. a TCP connection), which may split or coalesce packets arbitrarily.
+
+    Incoming data is stored in a single growable buffer with separate read
+    and write positions. Consumed bytes are reclaimed by shifting the
+    unread bytes to the front only when the buffer runs out of room at the
+    end, and the buffer only grows (by doubling) when it is actually full,
+    so feeding a stream costs time linear in its length.
+
+    Usage:
+    >>> framer = PacketFramer()
+    >>> for packet in framer.feed(chunk):
+    ...     # Do stuff with packet
+
+    Or read directly from a socket:
+    >>> packets = framer.read_packets(sock, count=3)
+    """
+
+    def __init__(self, capacity: int = 4096, max_payload_len: int = 1 << 16):
+        """
+        Constructor.
+
+        :param capacity: Initial size of the buffer in bytes.
+        :param max_payload_len: Largest payload_len accepted in a packet
+                    header. Guards against buffering forever on a corrupt
+                    header.
+        """
+        self._buffer = bytearray(max(capacity, HEADER.size))
+        self._start = 0
+        self._end = 0
+        self.max_payload_len = max_payload_len
+
+    def __len__(self):
+        """Number of buffered bytes that have not been consumed yet."""
+        return self._end - self._start
+
+    def _reserve(self, nbytes: int) -> memoryview:
+        """Returns a writable view of at least `nbytes` free bytes at the end
+        of the buffer, compacting or growing the buffer if needed."""
+        if len(self._buffer) - self._end < nbytes:
+            unread = self._end - self._start
+            if len(self._buffer) < unread + nbytes:
+                capacity = len(self._buffer)
+                while capacity < unread + nbytes:
+                    capacity *= 2
+                buffer = bytearray(capacity)
+                buffer[:unread] = self._buffer[self._start:self._end]
+                self._buffer = buffer
+            else:
+                self._buffer[:unread] = self._buffer[self._start:self._end]
+            self._start, self._end = 0, unread
+        return memoryview(self._buffer)[self._end:]
+
+    def _next_size(self) -> Optional[int]:
+        """Returns the size of the next packet in the buffer, or None if its
+        header has not been received yet."""
+        if self._end - self._start < HEADER.size:
+            return None
+        payload_len = HEADER.unpack_from(self._buffer, self._start)[0]
+        if payload_len > self.max_payload_len:
+            raise ValueError(f"payload_len {payload_len} exceeds maximum "
+                             f"payload length {self.max_payload_len}.")
+        return HEADER.size + payload_len + (-payload_len % 4)
+
+    def packets(self) -> Iterator[Packet]:
+        """Yields (and consumes) every complete Packet in the buffer."""
+        while True:
+            size = self._next_size()
+            if size is None or self._end - self._start < size:
+                return
+            packet = Packet.unpack_from(self._buffer, self._start)
+            self._start += size
+            if self._start == self._end:
+                self._start = self._end = 0
+            yield packet
+
+    def feed(self, data: bytes) -> List[Packet]:
+        """
+        Appends `data` to the buffer.
+
+        :return: Every Packet completed by `data`.
+        :raises: ValueError if a packet header is invalid.
+        """
+        self._reserve(len(data))[:len(data)] = data
+        self._end += len(data)
+        return list(self.packets())
+
+    def recv(self, sock: socket.socket, bufsize: int = 4096) -> int:
+        """
+        Receives up to `bufsize` bytes from `sock` straight into the buffer.
+
+        :return: Number of bytes received.
+        :raises: ConnectionError if the peer closed the connection.
+        """
+        nbytes = sock.recv_into(self._reserve(bufsize), bufsize)
+        if nbytes == 0:
+            raise ConnectionError("Connection closed by peer.")
+        self._end += nbytes
+        return nbytes
+
+    def read_packets(self, sock: socket.socket, count: int = 1) -> List[Packet]:
+        """
+        Receives from `sock` until `count` complete Packets are available.
+        Any further data stays buffered for the next call.
+
+        :raises: ConnectionError if the peer closes the connection first,
+                    socket.timeout if `sock` times out first and ValueError
+                    if a packet header is invalid.
+        """
+        packets = []
+        while True:
+            for packet in self.packets():
+                packets.append(packet)
+                if len(packets) == count:
+                    return packets
+            self.recv(sock)
+
+    def read_exact(self, sock: socket.socket, nbytes: int, consume: bool = True) -> bytes:
+        """
+        Receives from `sock` until `nbytes` raw bytes are available.
+
+        :param consume: If False, the bytes are left in the buffer.
+        :raises: ConnectionError if the peer closes the connection first and
+                    socket.timeout if `sock` times out first.
+        """
+        while self._end - self._start < nbytes:
+            self.recv(sock, max(4096, nbytes - len(self)))
+        data = bytes(self._buffer[self._start:self._start + nbytes])
+        if consume:
+            self._start += nbytes
+        return data
@@ -0,0 +1,39 @@
+import itertools
+import logging
+
+from cse461.project1.consts import LOG_SAMPLE_RATE
+
+__all__ = ['LogSampler']
+
+
+class LogSampler:
+    """Picks one in every `rate` calls to log, so that messages about every
+    packet can be logged without flooding the log or paying for
+    formatting them.
+
+    Calling the sampler returns False without counting the call when
+    `logger` is not enabled for `level`, so guarding a log call with it
+    costs almost nothing when the level is turned down:
+    >>> sample = LogSampler(logger, rate=100)
+    >>> if sample():
+    ...     logger.debug("Received packet %r", packet)
+    """
+    __slots__ = ('logger', 'level', 'rate', 'calls')
+
+    def __init__(self, logger: logging.Logger, level: int = logging.DEBUG,
+                 rate: int = LOG_SAMPLE_RATE):
+        """
+        :param logger: Logger whose level is checked.
+        :param level: Level of the sampled messages.
+        :param rate: Sample one in every `rate` calls. 1 samples every call.
+        """
+        self.logger = logger
+        self.level = level
+        self.rate = max(rate, 1)
+        # next() on a count is atomic, so samplers can be shared by threads
+        self.calls = itertools.count()
+
+    def __call__(self) -> bool:
+        if not self.logger.isEnabledFor(self.level):
+            return False
+        return next(self.calls) % self.rate == 0
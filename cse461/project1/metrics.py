@@ -0,0 +1,218 @@
+import collections
+import threading
+import logging
+import json
+
+from http.server import BaseHTTPRequestHandler
+from typing import Callable, Dict, Union
+
+__all__ = ['Histogram', 'MetricsRegistry', 'stats_handler']
+logger = logging.getLogger(__name__)
+
+Number = Union[int, float]
+
+
+class Histogram:
+    """Latency histogram with HDR-style buckets: exact up to SUB_BUCKETS
+    microseconds, then SUB_BUCKETS buckets per power of two, so every
+    recorded value is within 1/SUB_BUCKETS of its bucket's bounds no
+    matter how large it is. Recording is a few integer operations on a
+    preallocated list.
+
+    Usage:
+    >>> histogram = Histogram()
+    >>> histogram.record(0.0025)
+    >>> histogram.record(0.004)
+    >>> histogram.quantile(0.5)
+    0.002559
+    """
+    SUB_BUCKETS = 16
+
+    def __init__(self, max_value: float = 3600):
+        """
+        :param max_value: Largest value in seconds that can be told apart
+                    from larger ones. Larger values are recorded as
+                    `max_value`.
+        """
+        self.max_micros = int(max_value * 1e6)
+        self.counts = [0] * (self.index(self.max_micros) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.lock = threading.Lock()
+
+    @classmethod
+    def index(cls, micros: int) -> int:
+        """Returns the index of the bucket that `micros` falls in."""
+        if micros < cls.SUB_BUCKETS:
+            return micros
+        # Keep the highest 5 bits of the value (for 16 sub-buckets)
+        shift = micros.bit_length() - cls.SUB_BUCKETS.bit_length()
+        return (shift + 1) * cls.SUB_BUCKETS + (micros >> shift) - cls.SUB_BUCKETS
+
+    @classmethod
+    def highest_value(cls, index: int) -> int:
+        """Returns the largest value in microseconds in bucket `index`."""
+        if index < cls.SUB_BUCKETS:
+            return index
+        shift = index // cls.SUB_BUCKETS - 1
+        sub_bucket = index % cls.SUB_BUCKETS + cls.SUB_BUCKETS
+        return ((sub_bucket + 1) << shift) - 1
+
+    def record(self, seconds: float):
+        """Records a duration of `seconds` seconds."""
+        micros = min(max(int(seconds * 1e6), 0), self.max_micros)
+        index = self.index(micros)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += micros
+            if self.min is None or micros < self.min:
+                self.min = micros
+            if self.max is None or micros > self.max:
+                self.max = micros
+
+    def quantile(self, q: float) -> float:
+        """Returns the value in seconds below which a fraction `q` of the
+        recorded values fall, or 0 if nothing was recorded."""
+        with self.lock:
+            return self._quantile(q)
+
+    def _quantile(self, q: float) -> float:
+        if not self.count:
+            return 0
+        rank = max(q * self.count, 1)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.highest_value(index), self.max) / 1e6
+        return self.max / 1e6
+
+    def summary(self) -> Dict[str, Number]:
+        """Returns the number of recorded values and their minimum, mean,
+        maximum and 50th, 90th, 99th and 99.9th percentiles in seconds."""
+        with self.lock:
+            if not self.count:
+                return {'count': 0}
+            return {
+                'count': self.count,
+                'min': self.min / 1e6,
+                'mean': self.total / self.count / 1e6,
+                'max': self.max / 1e6,
+                'p50': self._quantile(0.5),
+                'p90': self._quantile(0.9),
+                'p99': self._quantile(0.99),
+                'p999': self._quantile(0.999)
+            }
+
+    def __len__(self):
+        return self.count
+
+
+class MetricsRegistry:
+    """Named counters, gauges and latency histograms.
+
+    Counters are incremented with inc(). Gauges are callables registered
+    with gauge() and read whenever a snapshot is taken, so they cost
+    nothing in between. Histograms are created by the first observe()
+    of their name.
+
+    Usage:
+    >>> metrics = MetricsRegistry()
+    >>> metrics.inc('started')
+    >>> metrics.gauge('sessions', lambda: len(sessions))
+    >>> metrics.observe('stage_a', 0.0002)
+    >>> metrics.snapshot()
+    {'counters': {'started': 1}, 'gauges': {'sessions': 0},
+     'histograms': {'stage_a': {'count': 1, ...}}}
+    """
+
+    def __init__(self):
+        self.counters = collections.Counter()
+        self.gauges = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def inc(self, name: str, n: int = 1):
+        """Adds `n` to the counter `name`."""
+        with self.lock:
+            self.counters[name] += n
+
+    def gauge(self, name: str, read: Callable[[], Union[Number, Dict[str, Number]]]):
+        """
+        Registers a gauge, replacing any gauge with the same name.
+
+        :param read: Returns the gauge's current value. If it returns a
+                    dict, each of its items is reported as a gauge named
+                    `name`_`key`.
+        """
+        with self.lock:
+            self.gauges[name] = read
+
+    def histogram(self, name: str) -> Histogram:
+        """Returns the histogram `name`, creating it if needed."""
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        return histogram
+
+    def observe(self, name: str, seconds: float):
+        """Records a duration of `seconds` seconds in the histogram `name`."""
+        self.histogram(name).record(seconds)
+
+    def read_counters(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.counters)
+
+    def read_gauges(self) -> Dict[str, Number]:
+        with self.lock:
+            gauges = list(self.gauges.items())
+        values = {}
+        for name, read in gauges:
+            value = read()
+            if isinstance(value, dict):
+                values.update({f"{name}_{key}": n for key, n in value.items()})
+            else:
+                values[name] = value
+        return values
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Returns the current value of every counter and gauge, and a
+        summary of every histogram (see Histogram.summary())."""
+        with self.lock:
+            histograms = list(self.histograms.items())
+        return {
+            'counters': self.read_counters(),
+            'gauges': self.read_gauges(),
+            'histograms': {name: histogram.summary() for name, histogram in histograms}
+        }
+
+
+def stats_handler(routes: Dict[str, Callable[[], dict]]):
+    """
+    Returns a request handler class that answers HTTP GET requests for
+    each path in `routes` with the JSON encoding of what the path's
+    callable returns, e.g.
+    >>> stats_handler({'/metrics': registry.snapshot})
+    """
+
+    class StatsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            read = routes.get(self.path)
+            if read is None:
+                self.send_error(404, f"Known paths: {', '.join(routes)}")
+                return
+            body = json.dumps(read()).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug("[Stats] %s - " + format, self.address_string(), *args)
+
+    return StatsHandler
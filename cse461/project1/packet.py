@@ -1,10 +1,28 @@
 import struct
-from typing import Optional
+from typing import Optional, Union
 
-__all__ = ['Packet']
+__all__ = ['Packet', 'PacketView', 'HEADER', 'UINT32',
+           'STAGE_A_RESPONSE', 'STAGE_B_RESPONSE', 'STAGE_C_RESPONSE']
+
+# Precompiled codecs for the 12-byte packet header and the fixed
+# payload shapes used by each stage of the protocol.
+HEADER = struct.Struct("!IIHH")
+# A single field: stage B packet ids/acks and the stage D secret
+UINT32 = struct.Struct("!I")
+# num, len, udp_port, secretA
+STAGE_A_RESPONSE = struct.Struct("!4I")
+# tcp_port, secretB
+STAGE_B_RESPONSE = struct.Struct("!II")
+# num2, len2, secretC, c
+STAGE_C_RESPONSE = struct.Struct("!3I4s")
+
+# Enough zero bytes to 4-byte align any payload
+_PADDING = (b'', b'\0\0\0', b'\0\0', b'\0')
 
 
 class Packet:
+    __slots__ = ('bytes', 'payload_len', 'p_secret', 'step', 'student_id')
+
     def __init__(self,
                  payload: Optional[bytes],
                  p_secret: int,
@@ -17,6 +35,7 @@ class Packet:
 
         :param payload: Payload to include in the constructed packet. If None,
                     returns an uninitialized Packet (all attributes are None).
+                    Any bytes-like object is accepted.
         :param p_secret: Secret for previous stage of protocol (0 for stage a,
                     randomly generated for successive stages)
         :param step: Stage step of protocol (e.g. for step a1, `step` is 1)
@@ -26,8 +45,6 @@ class Packet:
         """
         if payload is None:
             self.bytes = None
-            self.header = None
-            self.payload = None
             self.payload_len = None
             self.p_secret = None
             self.step = None
@@ -36,35 +53,85 @@ class Packet:
 
         if payload_len is None:
             payload_len = len(payload)
-        # Byte-align the payload.
-        payload = struct.pack(f"{payload_len}s0I", payload)
+        # Truncate or zero-extend the payload to payload_len bytes,
+        # then byte-align it.
+        if len(payload) > payload_len:
+            payload = memoryview(payload)[:payload_len]
+        padding = b'\0' * (payload_len - len(payload)) + _PADDING[payload_len % 4]
         # Build the packet in network byte order
-        _bytes = struct.pack(f"!IIHH{len(payload)}s",
-                             payload_len,
-                             p_secret,
-                             step,
-                             student_id,
-                             payload)
-
-        self.bytes = _bytes
-        self.header = _bytes[:12]
-        self.payload = payload
+        self.bytes = b''.join((HEADER.pack(payload_len, p_secret, step, student_id),
+                               payload,
+                               padding))
         self.payload_len = payload_len
         self.p_secret = p_secret
         self.step = step
         self.student_id = student_id
 
+    @property
+    def header(self) -> Optional[bytes]:
+        return None if self.bytes is None else self.bytes[:HEADER.size]
+
+    @property
+    def payload(self) -> Optional[bytes]:
+        return None if self.bytes is None else self.bytes[HEADER.size:]
+
+    def __len__(self):
+        return len(self.bytes)
+
     def __str__(self):
         return str(self.bytes)
 
     def __repr__(self):
         # Dump all attributes in a pretty printed string
-        attrs = ",\n\t".join(f"{k}={v}" for k, v in sorted(self.__dict__.items()))
+        attrs = ",\n\t".join(f"{k}={getattr(self, k)}" for k in
+                              sorted(self.__slots__ + ('header', 'payload')))
         return f"Packet(\n\t{attrs}\n)"
 
     def __eq__(self, other):
         return self.bytes == other.bytes
 
+    def pack_into(self, buffer: Union[bytearray, memoryview], offset: int = 0) -> int:
+        """
+        Writes this Packet into the writable `buffer` at `offset`.
+
+        :param buffer: Writable buffer to write this Packet into.
+        :param offset: Position in `buffer` to start writing at.
+        :return: Number of bytes written.
+        """
+        end = offset + len(self.bytes)
+        memoryview(buffer)[offset:end] = self.bytes
+        return end - offset
+
+    @classmethod
+    def unpack_from(cls, buffer: Union[bytes, bytearray, memoryview], offset: int = 0):
+        """
+        Constructs a Packet from the bytes in `buffer` starting at `offset`.
+        The packet size is taken from the payload_len field of the header, so
+        `buffer` may hold further data after the packet.
+
+        :param buffer: Buffer to read a Packet from.
+        :param offset: Position in `buffer` of the start of the Packet.
+        :raises: ValueError if `buffer` does not hold a complete Packet at `offset`.
+        :rtype: Packet
+        """
+        try:
+            payload_len, p_secret, step, student_id = HEADER.unpack_from(buffer, offset)
+        except struct.error:
+            raise ValueError("`data` must have a 12-byte header.") from None
+        end = offset + HEADER.size + payload_len + (-payload_len % 4)
+        data = buffer[offset:end]
+        if len(data) < end - offset:
+            raise ValueError(f"`data` is truncated: expected {end - offset} bytes, "
+                             f"got {len(data)}.")
+
+        packet = cls.__new__(cls)
+        packet.bytes = data if type(data) is bytes else bytes(data)
+        packet.payload_len = payload_len
+        packet.p_secret = p_secret
+        packet.step = step
+        packet.student_id = student_id
+        return packet
+
     @classmethod
     def from_raw(cls, data: bytes):
         """
@@ -80,17 +147,97 @@ class Packet:
         if len(data) % 4 != 0:
             raise ValueError("`data` must be 4-byte aligned.")
 
-        header = data[:12]
-        payload = data[12:]
-        payload_len, p_secret, step, student_id = struct.unpack("!IIHH", header)
-
-        packet = cls(None, 0, 0, 0)
-        packet.bytes = data
-        packet.header = header
-        packet.payload = payload
-        packet.p_secret = p_secret
-        packet.step = step
-        packet.student_id = student_id
-        packet.payload_len = payload_len
+        packet = cls.__new__(cls)
+        packet.bytes = bytes(data)
+        (packet.payload_len,
+         packet.p_secret,
+         packet.step,
+         packet.student_id) = HEADER.unpack_from(data)
 
         return packet
+
+
+class PacketView:
+    """Read-only Packet backed directly by a buffer (bytes, bytearray,
+    memoryview or anything else supporting the buffer protocol).
+
+    Unlike Packet.from_raw, no data is copied when a PacketView is
+    constructed: `header` and `payload` are memoryview slices over the
+    original buffer and header fields are only decoded on first access.
+    The underlying buffer must not be modified while the view is in use.
+
+    Usage:
+    >>> data, addr = sock.recvfrom(1024)
+    >>> packet = PacketView(data)
+    >>> packet.p_secret, len(packet.payload)
+    """
+    __slots__ = ('buffer', '_header_fields')
+
+    def __init__(self, buffer: Union[bytes, bytearray, memoryview]):
+        """
+        Constructs a PacketView over `buffer`.
+
+        :param buffer: Buffer containing exactly one packet.
+        :raises: ValueError if `buffer` cannot be interpreted as a valid Packet.
+        """
+        view = memoryview(buffer)
+        # Sanity checks
+        if view.nbytes < 12:
+            raise ValueError("`data` must have a 12-byte header.")
+        if view.nbytes % 4 != 0:
+            raise ValueError("`data` must be 4-byte aligned.")
+
+        self.buffer = view.cast('B') if view.format != 'B' else view
+        # Decoded lazily by _fields()
+        self._header_fields = None
+
+    def _fields(self) -> tuple:
+        if self._header_fields is None:
+            self._header_fields = HEADER.unpack_from(self.buffer)
+        return self._header_fields
+
+    @property
+    def header(self) -> memoryview:
+        return self.buffer[:HEADER.size]
+
+    @property
+    def payload(self) -> memoryview:
+        return self.buffer[HEADER.size:]
+
+    @property
+    def payload_len(self) -> int:
+        return self._fields()[0]
+
+    @property
+    def p_secret(self) -> int:
+        return self._fields()[1]
+
+    @property
+    def step(self) -> int:
+        return self._fields()[2]
+
+    @property
+    def student_id(self) -> int:
+        return self._fields()[3]
+
+    @property
+    def bytes(self) -> bytes:
+        """Copy of the underlying packet data."""
+        return self.buffer.tobytes()
+
+    def to_packet(self) -> Packet:
+        """Returns an independent Packet with a copy of this view's data."""
+        return Packet.from_raw(self.bytes)
+
+    def __str__(self):
+        return str(self.bytes)
+
+    def __repr__(self):
+        return (f"PacketView(payload_len={self.payload_len}, p_secret={self.p_secret}, "
+                f"step={self.step}, student_id={self.student_id}, "
+                f"nbytes={self.buffer.nbytes})")
+
+    def __eq__(self, other):
+        if isinstance(other, PacketView):
+            return self.buffer == other.buffer
+        return self.buffer == other.bytes
@@ -0,0 +1,148 @@
+import collections
+import threading
+import logging
+import socket
+import random
+import errno
+
+from typing import Iterable
+from cse461.project1.wrappers import synchronized
+
+__all__ = ['PortAllocator']
+logger = logging.getLogger(__name__)
+
+
+class PortAllocator:
+    """Hands out bound sockets on ports from a fixed range.
+
+    Free ports are kept in a shuffled free list and allocated ports are
+    marked in a bitmap, so allocating and releasing a port are O(1)
+    regardless of how many ports are in use. Every port is validated by
+    binding it before it is handed out; ports that fail to bind (e.g.
+    because another process owns them) are moved to the back of the free
+    list and the next port is tried.
+
+    Optionally, a warm pool of `warm` sockets of each type is kept bound
+    ahead of time, so allocations don't wait for bind():
+    >>> ports = PortAllocator('localhost', warm=16)
+    >>> ports.warm_up()
+    >>> sock = ports.allocate(socket.SOCK_DGRAM)
+    >>> port = sock.getsockname()[1]
+    >>> ...
+    >>> sock.close()
+    >>> ports.release(port)
+    """
+    ALLOCATED = 1
+    EXCLUDED = 2
+
+    def __init__(self, ip_addr: str, low: int = 1024, high: int = 49151,
+                 warm: int = 0, exclude: Iterable[int] = ()):
+        """
+        Constructor.
+
+        :param ip_addr: IP address to bind sockets to.
+        :param low: Lowest port in the range (inclusive).
+        :param high: Highest port in the range (inclusive).
+        :param warm: Number of pre-bound sockets of each type to keep ready.
+                    Call warm_up() to bind them.
+        :param exclude: Ports in the range that are never allocated.
+        """
+        if not 0 < low <= high <= 65535:
+            raise ValueError(f"Invalid port range: {low}-{high}")
+        self.ip_addr = ip_addr
+        self.low = low
+        self.high = high
+        self.warm = warm
+        # One byte per port in the range: ALLOCATED, EXCLUDED or 0 if free
+        self.in_use = bytearray(high - low + 1)
+        for port in exclude:
+            if low <= port <= high:
+                self.in_use[port - low] = self.EXCLUDED
+        self.excluded = self.in_use.count(self.EXCLUDED)
+        ports = [port for port in range(low, high + 1) if not self.in_use[port - low]]
+        # Shuffle so that the ports handed to clients are hard to predict
+        random.shuffle(ports)
+        self.free = collections.deque(ports)
+        # Pre-bound sockets for each socket type
+        self.warm_sockets = {socket.SOCK_DGRAM: collections.deque(),
+                             socket.SOCK_STREAM: collections.deque()}
+        self.lock = threading.Lock()
+
+        self.allocate = synchronized(self.allocate, lock=self.lock)
+        self.release = synchronized(self.release, lock=self.lock)
+        self.warm_up = synchronized(self.warm_up, lock=self.lock)
+        self.close = synchronized(self.close, lock=self.lock)
+
+    def _bind(self, kind: int) -> socket.socket:
+        """Binds a socket of type `kind` to the next free port that can be bound."""
+        for _ in range(len(self.free)):
+            port = self.free.popleft()
+            sock = socket.socket(socket.AF_INET, kind)
+            if kind == socket.SOCK_STREAM:
+                # Allow rebinding ports whose old connections are in TIME_WAIT
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            try:
+                sock.bind((self.ip_addr, port))
+            except OSError as e:
+                sock.close()
+                if e.errno != errno.EADDRINUSE:
+                    self.free.appendleft(port)
+                    raise
+                # Try this port again once every other port has been tried
+                logger.info(f"Port {port} is already in use. Trying the next free port.")
+                self.free.append(port)
+                continue
+            self.in_use[port - self.low] = self.ALLOCATED
+            return sock
+        raise OSError(errno.EADDRINUSE,
+                      f"No free ports in range {self.low}-{self.high}")
+
+    def allocate(self, kind: int = socket.SOCK_DGRAM) -> socket.socket:
+        """
+        Returns a new socket of type `kind` (SOCK_DGRAM or SOCK_STREAM)
+        bound to a free port. Release the port with release() once the
+        socket is closed.
+
+        :raises OSError: If no port in the range can be bound.
+        """
+        warm = self.warm_sockets[kind]
+        if warm:
+            return warm.popleft()
+        return self._bind(kind)
+
+    def release(self, port: int):
+        """Returns `port` to the free list, and uses it to refill the warm
+        pool if it is not full."""
+        index = port - self.low
+        if not 0 <= index < len(self.in_use) or self.in_use[index] != self.ALLOCATED:
+            return
+        self.in_use[index] = 0
+        self.free.append(port)
+        self._refill()
+
+    def warm_up(self):
+        """Binds sockets until the warm pool of each type is full."""
+        self._refill()
+
+    def _refill(self):
+        for kind, warm in self.warm_sockets.items():
+            while len(warm) < self.warm and self.free:
+                try:
+                    warm.append(self._bind(kind))
+                except OSError:
+                    return
+
+    def close(self):
+        """Closes and releases every socket in the warm pool."""
+        for warm in self.warm_sockets.values():
+            while warm:
+                sock = warm.popleft()
+                port = sock.getsockname()[1]
+                sock.close()
+                self.in_use[port - self.low] = 0
+                self.free.append(port)
+
+    def __len__(self):
+        """Number of ports that are currently allocated, including ports in
+        the warm pool."""
+        return len(self.in_use) - len(self.free) - self.excluded
@@ -0,0 +1,190 @@
+import multiprocessing
+import threading
+import logging
+import secrets
+import os
+
+from collections import Counter
+from multiprocessing.connection import Connection
+from typing import Dict, List, Tuple
+from cse461.project1.server import Server
+from cse461.project1.wrappers import Stoppable, synchronized
+from cse461.project1.consts import *
+
+__all__ = ['PreforkServer']
+logger = logging.getLogger(__name__)
+
+
+def split_range(low: int, high: int, parts: int) -> List[Tuple[int, int]]:
+    """Splits the inclusive range `low`-`high` into `parts` contiguous,
+    non-overlapping inclusive ranges of (nearly) equal size."""
+    size = (high - low + 1) // parts
+    if size == 0:
+        raise ValueError(f"Cannot split ports {low}-{high} between {parts} workers")
+    bounds = [low + i * size for i in range(parts)] + [high + 1]
+    return [(bounds[i], bounds[i + 1] - 1) for i in range(parts)]
+
+
+def serve_worker(conn: Connection, port: int, server_kwargs: dict):
+    """Entry point of a PreforkServer worker process. Runs a Server sharing
+    `port` with the other workers until told to stop, answering requests
+    from the parent process on `conn`."""
+    server = Server(reuse_port=True, **server_kwargs)
+
+    def answer():
+        server.started.wait()
+        conn.send('ready')
+        while True:
+            try:
+                command = conn.recv()
+            except EOFError:
+                # The parent process exited
+                command = 'stop'
+            if command == 'stats':
+                conn.send(server.stats())
+            elif command == 'stop':
+                server.request_stop()
+                return
+
+    threading.Thread(target=answer, daemon=True).start()
+    server.run(port=port)
+
+
+class PreforkServer(Stoppable):
+    """Runs a Server in each of several worker processes, all listening for
+    stage A packets on the same port with SO_REUSEPORT.
+
+    The kernel spreads hellos across the workers (by client address), and
+    each worker serves its sessions from start to finish on stage B/C
+    ports from its own slice of port_range, so workers share no state and
+    stage A handling scales across cores.
+
+    Usage:
+    >>> server = PreforkServer(workers=4, ip_addr='localhost')
+    >>> server.run()
+    >>> # Run until SIGINT or SIGTERM...
+
+    Keyword arguments other than those below are passed to each worker's
+    Server:
+    >>> server = PreforkServer(workers=4, udp_pool_size=2)
+    >>> server.start()
+    >>> server.stats()
+    {'started': 10, 'completed': 10, ..., 'workers': 4}
+    >>> server.stop()
+    """
+
+    def __init__(self, workers: int = None, ip_addr: str = SERVER_ADDR,
+                 port_range: Tuple[int, int] = PORT_RANGE, **server_kwargs):
+        """
+        Constructor. Initializes the server but does not start it.
+        To start the server, call start() or run().
+
+        :param workers: Number of worker processes. Defaults to the number
+                    of CPUs.
+        :param ip_addr: IP Address for this server. Defaults to consts.SERVER_ADDR.
+        :param port_range: Range of ports (inclusive) to split between the
+                    workers for stage B and C servers. Defaults to
+                    consts.PORT_RANGE.
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.ip_addr = ip_addr
+        self.port_ranges = split_range(*port_range, self.workers)
+        if server_kwargs.get('stateless') and server_kwargs.get('token_key') is None:
+            # Workers must share a key to verify each other's secrets
+            server_kwargs['token_key'] = secrets.token_bytes(32)
+        self.server_kwargs = server_kwargs
+        self.processes = []
+        # Parent ends of the pipes to each worker
+        self.conns = []
+        self.stop_requested = threading.Event()
+        self.lock = threading.RLock()
+
+        # Only one request may be in flight on each pipe
+        self.stats = synchronized(self.stats, lock=self.lock)
+        self.stop = synchronized(self.stop, lock=self.lock)
+
+    def start(self, port: int = START_PORT, timeout: float = 10):
+        """Starts the worker processes and waits up to `timeout` seconds for
+        each of them to start listening."""
+        for port_range in self.port_ranges:
+            conn, child_conn = multiprocessing.Pipe()
+            kwargs = dict(self.server_kwargs, ip_addr=self.ip_addr, port_range=port_range)
+            process = multiprocessing.Process(target=serve_worker,
+                                              args=(child_conn, port, kwargs))
+            process.start()
+            child_conn.close()
+            self.processes.append(process)
+            self.conns.append(conn)
+
+        for process, conn in zip(self.processes, self.conns):
+            try:
+                ready = conn.poll(timeout) and conn.recv() == 'ready'
+            except EOFError:
+                # The worker exited, e.g. because it could not bind its ports
+                ready = False
+            if not ready:
+                self.stop()
+                raise RuntimeError(f"Worker process {process.pid} failed to start")
+        logger.info(f"[Start] Started {self.workers} worker processes "
+                    f"listening at {self.ip_addr}:{port}.")
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the sum of every worker's Server.stats(), plus the number
+        of workers that answered."""
+        totals = Counter()
+        workers = 0
+        for conn in self.conns:
+            try:
+                conn.send('stats')
+                totals.update(conn.recv())
+                workers += 1
+            except (EOFError, OSError):
+                # The worker exited
+                continue
+        stats = dict(totals)
+        stats['workers'] = workers
+        return stats
+
+    def stop(self, timeout: float = 3 * TIMEOUT):
+        """Tells every worker to drain and stop, and waits up to `timeout`
+        seconds for each of them to exit before terminating it."""
+        for conn in self.conns:
+            try:
+                conn.send('stop')
+            except OSError:
+                pass
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.info(f"[Stop] Worker process {process.pid} did not stop. Terminating.")
+                process.terminate()
+                process.join()
+        for conn in self.conns:
+            conn.close()
+        self.processes.clear()
+        self.conns.clear()
+
+    def run(self, seconds: float = None, port: int = START_PORT):
+        """Runs the workers until `seconds` seconds have passed (forever if
+        None), SIGINT or SIGTERM is received, or request_stop() is called."""
+        with self.stop_on_signals():
+            try:
+                self.start(port)
+                self.stop_requested.wait(seconds)
+                logger.info(f"[Stop] Aggregated stats: {self.stats()}")
+            finally:
+                self.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def main():
+    PreforkServer().run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+import logging
+
+from typing import Callable, List, Tuple
+from cse461.project1.packet import (Packet, UINT32, STAGE_A_RESPONSE, STAGE_B_RESPONSE,
+                                    STAGE_C_RESPONSE)
+from cse461.project1.batch import PacketBatch
+from cse461.project1.logs import LogSampler
+from cse461.project1.window import SendWindow
+from cse461.project1.rtt import RttEstimator
+from cse461.project1.consts import STUDENT_ID, STAGE_B_WINDOW, MAX_RETRIES
+
+__all__ = ['Exchange', 'StageB', 'ClientProtocol']
+logger = logging.getLogger(__name__)
+# Decides which packets to log at DEBUG level, across all clients
+sample = LogSampler(logger)
+
+
+class Exchange:
+    """Waits for the response to a UDP request that is sent again every
+    RTO (see RttEstimator) until a packet for which `accept(packet)` is
+    true arrives. Decides when to send the request again, but doesn't
+    send or receive anything itself.
+
+    Usage:
+    >>> exchange = Exchange(accept, rtt, now=time.monotonic())
+    >>> sock.sendto(request, address)
+    >>> while True:
+    ...     sock.settimeout(max(exchange.deadline - time.monotonic(), 0))
+    ...     try:
+    ...         packet = Packet.from_raw(sock.recv(1024))
+    ...     except socket.timeout:
+    ...         exchange.timeout(time.monotonic())
+    ...         sock.sendto(request, address)
+    ...         continue
+    ...     if exchange.receive(packet, time.monotonic()):
+    ...         break
+    """
+    __slots__ = ('accept', 'rtt', 'retries', 'size', 'measure', 'sent', 'attempts')
+
+    def __init__(self, accept: Callable[[Packet], bool], rtt: RttEstimator, now: float,
+                 retries: int = MAX_RETRIES, size: int = 1, measure: bool = True):
+        """
+        :param accept: Returns True for the response.
+        :param rtt: Sets how long to wait for the response. Backs off on
+                    every timeout.
+        :param now: Time (in time.monotonic() seconds) the request was sent.
+        :param retries: Number of times the request may be sent again
+                    before giving up. Defaults to consts.MAX_RETRIES.
+        :param size: Number of packets sent every time the request is sent.
+        :param measure: Whether the response's round trip time is an RTT
+                    sample for `rtt`, if the request was only sent once.
+        """
+        self.accept = accept
+        self.rtt = rtt
+        self.retries = retries
+        self.size = size
+        self.measure = measure
+        self.sent = now
+        # Number of times the request was sent again
+        self.attempts = 0
+
+    @property
+    def deadline(self) -> float:
+        """Time (in time.monotonic() seconds) when the request times out."""
+        return self.sent + self.rtt.rto
+
+    @property
+    def retransmissions(self) -> int:
+        """Number of packets that were sent more than once."""
+        return self.attempts * self.size
+
+    def receive(self, packet: Packet, now: float) -> bool:
+        """Returns True if `packet`, received at `now`, is the response."""
+        if not self.accept(packet):
+            return False
+        if self.measure and self.attempts == 0:
+            self.rtt.sample(now - self.sent)
+        return True
+
+    def timeout(self, now: float):
+        """
+        Records that the request timed out and is sent again at `now`.
+
+        :raises TimeoutError: If the request was already sent again
+                 `retries` times.
+        """
+        self.attempts += 1
+        if self.attempts > self.retries:
+            raise TimeoutError(f"No response after {self.retries} retries")
+        self.rtt.backoff()
+        self.sent = now
+
+
+class StageB:
+    """Sends the packets of stage B through a SendWindow and recognizes
+    the server's acks and response among the packets received. Doesn't
+    send or receive anything itself.
+
+    Usage:
+    >>> stage_b = StageB(response, student_id=123, step=1)
+    >>> while not stage_b.done:
+    ...     for packet in stage_b.to_send(time.monotonic()):
+    ...         sock.sendto(packet.bytes, (ip_addr, stage_b.port))
+    ...     sock.settimeout(max(stage_b.deadline - time.monotonic(), 0))
+    ...     stage_b.receive(Packet.from_raw(sock.recv(1024)), time.monotonic())
+    """
+    __slots__ = ('port', 'packets', 'window', 'response')
+
+    def __init__(self, response: Packet, student_id: int, step: int, size: int = 1,
+                 rtt: RttEstimator = None, retries: int = MAX_RETRIES):
+        """
+        :param response: Server's response to stage A.
+        :param size: Maximum number of packets in flight (see SendWindow).
+        :param rtt: Estimates how long to wait for acks.
+        :param retries: Number of times in a row a packet may time out
+                    before giving up.
+        """
+        num, length, self.port, secret_a = STAGE_A_RESPONSE.unpack(response.payload)
+        self.packets = [Packet(
+            payload=UINT32.pack(packet_id) + b'\0' * length,
+            p_secret=secret_a,
+            step=step,
+            student_id=student_id
+        ) for packet_id in range(num)]
+        self.window = SendWindow(num, size=size, rtt=rtt, retries=retries)
+        # The server only responds once it has counted every packet, so
+        # stage B is done once the response arrives, even if acks
+        # arrived out of order.
+        self.response = None
+
+    @property
+    def done(self) -> bool:
+        """True once every packet was acknowledged or the response arrived.
+        If no response arrived, wait for it with exchange()."""
+        return self.window.done or self.response is not None
+
+    @property
+    def deadline(self) -> float:
+        """Time (in time.monotonic() seconds) to wait for packets until.
+        Only valid after to_send()."""
+        return self.window.deadline
+
+    @property
+    def retransmissions(self) -> int:
+        return self.window.retransmissions
+
+    def to_send(self, now: float) -> List[Packet]:
+        """
+        Returns the packets to send now, in order.
+
+        :raises TimeoutError: If a packet timed out too many times in a row.
+        """
+        base, resent = self.window.base, self.window.retransmissions
+        packet_ids = self.window.to_send(now)
+        if self.window.retransmissions != resent and sample():
+            logger.debug("[Stage B] Packet dropped (id: %d). Retrying.", base)
+        return [self.packets[packet_id] for packet_id in packet_ids]
+
+    def receive(self, packet: Packet, now: float):
+        """Handles `packet`, received at `now`."""
+        if packet.payload_len == STAGE_B_RESPONSE.size:
+            self.response = packet
+            return
+        if packet.payload_len != UINT32.size:
+            # e.g. a response to an earlier copy of the hello
+            return
+        ack = UINT32.unpack(packet.payload)[0]
+        if self.window.ack(ack, now):
+            if sample():
+                logger.debug("[Stage B] Packet acknowledged (id: %d)", ack)
+        elif sample():
+            logger.debug("[Stage B] Packet (id: %d) not acknowledged: "
+                         "expected payload %d, got %d.",
+                         self.window.base, self.window.base, ack)
+
+    def exchange(self, now: float) -> Exchange:
+        """
+        Returns an Exchange that waits for the response if every packet
+        was acknowledged without one arriving. Every packet must be sent
+        again on each timeout: a packet acknowledged out of order was not
+        counted by the server (see SendWindow), which then never responds.
+        """
+        return Exchange(lambda packet: packet.payload_len == STAGE_B_RESPONSE.size,
+                        self.window.rtt, now, retries=self.window.retries,
+                        size=len(self.packets), measure=False)
+
+
+class ClientProtocol:
+    """Client side of the protocol outlined in CSE 461 SPR 2020 Project 1
+    (Sockets API), without any I/O: builds the packets the client sends,
+    recognizes the server's responses and records the secrets in them.
+
+    Client and AsyncClient extend it with the socket and transport calls
+    that send and receive its packets:
+    >>> packet, exchange = self.hello(time.monotonic())
+    >>> # Send packet until exchange accepts a response...
+    >>> self.finish_stage_a(exchange, response)
+    >>> stage_b = self.start_stage_b(response)
+    >>> # Send stage_b's packets until it is done...
+    >>> self.finish_stage_b(stage_b, response)
+    >>> # Connect to self.stage_c_port(response) and receive the stage C response...
+    >>> self.finish_stage_c(response)
+    >>> # Send self.stage_d_packets(response) and receive the stage D response...
+    >>> self.finish_stage_d(response)
+    """
+
+    def __init__(self, student_id: int = STUDENT_ID, window: int = STAGE_B_WINDOW,
+                 retries: int = MAX_RETRIES):
+        """
+        :param student_id: Last 3 digits of student ID to include in all
+                        packet headers. Defaults to consts.STUDENT_ID.
+        :param window: Maximum number of stage B packets in flight (see
+                        SendWindow). Defaults to consts.STAGE_B_WINDOW.
+        :param retries: Number of times in a row a UDP request (a hello or
+                        a stage B packet) is sent again without a response
+                        before giving up with a TimeoutError. Defaults to
+                        consts.MAX_RETRIES.
+        """
+        self.step = 1
+        self.secrets = {}
+        self.student_id = student_id
+        self.window = window
+        self.retries = retries
+        # Round trip times of this session's UDP requests, which set how
+        # long to wait for their responses
+        self.rtt = RttEstimator()
+        # Number of UDP packets that were sent more than once
+        self.retransmissions = 0
+
+    def hello(self, now: float) -> Tuple[Packet, Exchange]:
+        """Returns the stage A packet, and the Exchange that waits for its
+        response if it is sent at `now`."""
+        packet = Packet(
+            payload=b'hello world\0',
+            p_secret=0,
+            step=self.step,
+            student_id=self.student_id
+        )
+        # Responses to earlier copies of the hello may arrive in stage B,
+        # so later stages tell packets apart by their payload length.
+        exchange = Exchange(lambda packet: packet.payload_len == STAGE_A_RESPONSE.size,
+                            self.rtt, now, retries=self.retries)
+        return packet, exchange
+
+    def finish_stage_a(self, exchange: Exchange, response: Packet):
+        """Records the stage A response accepted by `exchange`."""
+        self.retransmissions += exchange.retransmissions
+        self.secrets['a'] = UINT32.unpack(response.payload[-4:])[0]
+
+    def start_stage_b(self, response: Packet) -> StageB:
+        """Returns the StageB that sends the packets the stage A response
+        asks for."""
+        return StageB(response, self.student_id, self.step, size=self.window,
+                      rtt=self.rtt, retries=self.retries)
+
+    def finish_stage_b(self, stage_b: StageB, response: Packet, exchange: Exchange = None):
+        """Records the stage B response, received by `stage_b` or accepted
+        by `exchange`."""
+        self.retransmissions += stage_b.retransmissions
+        if exchange is not None:
+            self.retransmissions += exchange.retransmissions
+        self.secrets['b'] = UINT32.unpack(response.payload[-4:])[0]
+
+    @staticmethod
+    def stage_c_port(response: Packet) -> int:
+        """Returns the port of the TCP server in the stage B response."""
+        return STAGE_B_RESPONSE.unpack(response.payload)[0]
+
+    def finish_stage_c(self, response: Packet):
+        """Records the stage C response."""
+        # The stage C payload ends with the character c, not secretC
+        self.secrets['c'] = STAGE_C_RESPONSE.unpack(response.payload)[2]
+
+    def stage_d_packets(self, response: Packet) -> PacketBatch:
+        """Returns the packets that the stage C response asks for."""
+        num2, len2, secret_c, char = STAGE_C_RESPONSE.unpack(response.payload)
+        packet = Packet(
+            payload=bytes([char[0]]) * len2,
+            p_secret=secret_c,
+            step=self.step,
+            student_id=self.student_id
+        )
+        return PacketBatch.repeat(packet, num2)
+
+    def finish_stage_d(self, response: Packet):
+        """Records the stage D response."""
+        self.secrets['d'] = UINT32.unpack(response.payload[-4:])[0]
@@ -0,0 +1,102 @@
+from typing import Dict, Union
+
+from cse461.project1.consts import RTO_INITIAL, RTO_MIN, RTO_MAX
+
+__all__ = ['RttEstimator']
+
+
+class RttEstimator:
+    """Retransmission timeout (RTO) for a client's requests, adapted to
+    the round trip times (RTTs) measured so far, as in TCP (Jacobson and
+    Karels, see RFC 6298):
+        RTTVAR = 3/4 * RTTVAR + 1/4 * |SRTT - RTT|
+        SRTT = 7/8 * SRTT + 1/8 * RTT
+        RTO = SRTT + 4 * RTTVAR
+    The first RTT sets SRTT = RTT and RTTVAR = RTT / 2, and until then the
+    RTO is `initial`.
+
+    Every timeout doubles the RTO, up to `maximum`, until the next RTT
+    is measured. Callers must only measure RTTs of requests that were
+    sent once (Karn's rule), since the response to a request that was
+    sent again may answer either copy.
+
+    Usage:
+    >>> rtt = RttEstimator()
+    >>> sock.settimeout(rtt.rto)
+    >>> # On a response to a request sent once:
+    >>> rtt.sample(time.monotonic() - sent)
+    >>> # On a timeout:
+    >>> rtt.backoff()
+    """
+    __slots__ = ('initial', 'minimum', 'maximum', 'srtt', 'rttvar', 'backoffs',
+                 'samples', 'timeouts', 'min_rtt', 'max_rtt')
+
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+    K = 4
+
+    def __init__(self, initial: float = RTO_INITIAL, minimum: float = RTO_MIN,
+                 maximum: float = RTO_MAX):
+        """
+        :param initial: RTO in seconds before any RTT is measured.
+                    Defaults to consts.RTO_INITIAL.
+        :param minimum: Smallest RTO in seconds. Defaults to consts.RTO_MIN.
+        :param maximum: Largest RTO in seconds, including after backing
+                    off. Defaults to consts.RTO_MAX.
+        """
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        # Smoothed RTT and its mean deviation, None until the first sample
+        self.srtt = None
+        self.rttvar = None
+        # Number of timeouts since the last sample
+        self.backoffs = 0
+        self.samples = 0
+        self.timeouts = 0
+        self.min_rtt = None
+        self.max_rtt = None
+
+    @property
+    def rto(self) -> float:
+        """Seconds to wait for a response before sending a request again."""
+        if self.srtt is None:
+            rto = self.initial
+        else:
+            rto = self.srtt + self.K * self.rttvar
+        rto = max(rto, self.minimum) * (1 << self.backoffs)
+        return min(rto, self.maximum)
+
+    def sample(self, rtt: float):
+        """Records the RTT of a request that was sent once."""
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar += self.BETA * (abs(self.srtt - rtt) - self.rttvar)
+            self.srtt += self.ALPHA * (rtt - self.srtt)
+        self.backoffs = 0
+        self.samples += 1
+        if self.min_rtt is None or rtt < self.min_rtt:
+            self.min_rtt = rtt
+        if self.max_rtt is None or rtt > self.max_rtt:
+            self.max_rtt = rtt
+
+    def backoff(self):
+        """Doubles the RTO (up to `maximum`) after a timeout."""
+        self.timeouts += 1
+        if self.rto < self.maximum:
+            self.backoffs += 1
+
+    def stats(self) -> Dict[str, Union[int, float, None]]:
+        """Returns the number of RTT samples and timeouts, the smallest
+        and largest RTT, SRTT, RTTVAR and the current RTO, in seconds."""
+        return {
+            'samples': self.samples,
+            'timeouts': self.timeouts,
+            'min': self.min_rtt,
+            'max': self.max_rtt,
+            'srtt': self.srtt,
+            'rttvar': self.rttvar,
+            'rto': self.rto
+        }
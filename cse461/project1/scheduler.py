@@ -0,0 +1,166 @@
+import selectors
+import threading
+import logging
+import socket
+import heapq
+import time
+
+from typing import Callable
+
+__all__ = ['Scheduler', 'Timer']
+logger = logging.getLogger(__name__)
+
+
+class Timer:
+    """Handle for a callback scheduled by Scheduler.call_later()."""
+    __slots__ = ('deadline', 'callback', 'args', 'cancelled')
+
+    def __init__(self, deadline: float, callback: Callable, args: tuple):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        """Prevents the callback from running if it has not run yet."""
+        self.cancelled = True
+
+    def __lt__(self, other: 'Timer') -> bool:
+        return self.deadline < other.deadline
+
+
+class Scheduler:
+    """Runs timers and socket callbacks for many servers on a single thread.
+
+    Deadlines are kept in a binary heap, so scheduling a timer costs
+    O(log n) and cancelling one costs O(1) (cancelled timers are skipped
+    when they reach the top of the heap). The scheduler's thread sleeps in
+    select() until the earliest deadline or until a registered socket
+    becomes readable, so any number of idle servers and pending timeouts
+    share one thread.
+
+    Callbacks run on the scheduler's thread and must not block; hand
+    long-running work off to another thread.
+
+    Usage:
+    >>> scheduler = Scheduler()
+    >>> scheduler.start()
+    >>> timer = scheduler.call_later(3, print, "timed out")
+    >>> timer.cancel()
+    >>> scheduler.stop()
+    """
+
+    def __init__(self):
+        self._timers = []
+        self._lock = threading.Lock()
+        self._selector = selectors.DefaultSelector()
+        # Writing to this socket wakes the scheduler up from select()
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._wakeup_recv.setblocking(False)
+        self._wakeup_send.setblocking(False)
+        self._selector.register(self._wakeup_recv, selectors.EVENT_READ, self._drain_wakeup)
+        self._running = False
+        self.thread = None
+
+    def start(self):
+        """Starts the scheduler's thread."""
+        self._running = True
+        self.thread = threading.Thread(target=self._run, name="Scheduler")
+        self.thread.start()
+
+    def stop(self):
+        """Stops the scheduler and waits for its thread to exit. Timers that
+        have not fired yet are discarded."""
+        self._running = False
+        self._wakeup()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def in_scheduler_thread(self) -> bool:
+        return self.thread is threading.current_thread()
+
+    def call_later(self, delay: float, callback: Callable, *args) -> Timer:
+        """
+        Schedules `callback(*args)` to run on the scheduler's thread after
+        `delay` seconds. Safe to call from any thread.
+
+        :return: A Timer that can be used to cancel the callback.
+        """
+        timer = Timer(time.monotonic() + delay, callback, args)
+        with self._lock:
+            heapq.heappush(self._timers, timer)
+            earliest = self._timers[0] is timer
+        # The scheduler only needs to wake up early if this timer fires
+        # before any timer it is already waiting for.
+        if earliest and not self.in_scheduler_thread():
+            self._wakeup()
+        return timer
+
+    def call_soon(self, callback: Callable, *args) -> Timer:
+        """Schedules `callback(*args)` to run on the scheduler's thread as
+        soon as possible."""
+        return self.call_later(0, callback, *args)
+
+    def add_reader(self, sock: socket.socket, callback: Callable):
+        """Calls `callback()` on the scheduler's thread whenever `sock` is
+        readable. Safe to call from any thread."""
+        if self.in_scheduler_thread():
+            self._selector.register(sock, selectors.EVENT_READ, callback)
+        else:
+            self.call_soon(self._selector.register, sock, selectors.EVENT_READ, callback)
+
+    def remove_reader(self, sock: socket.socket):
+        """Stops watching `sock`. Call from the scheduler's thread (e.g. from
+        a callback) before closing `sock`."""
+        try:
+            self._selector.unregister(sock)
+        except (KeyError, ValueError):
+            # Not registered, or already closed
+            pass
+
+    def _wakeup(self):
+        try:
+            self._wakeup_send.send(b'\0')
+        except (BlockingIOError, OSError):
+            # A wakeup is already pending, or the scheduler is closed
+            pass
+
+    def _drain_wakeup(self):
+        try:
+            while self._wakeup_recv.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _run_due_timers(self):
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                if not self._timers or self._timers[0].deadline > now:
+                    return
+                timer = heapq.heappop(self._timers)
+            if timer.cancelled:
+                continue
+            try:
+                timer.callback(*timer.args)
+            except Exception:
+                logger.exception(f"Timer callback {timer.callback!r} raised an exception.")
+
+    def _run(self):
+        try:
+            while self._running:
+                with self._lock:
+                    timeout = (max(0.0, self._timers[0].deadline - time.monotonic())
+                               if self._timers else None)
+                for key, _ in self._selector.select(timeout):
+                    try:
+                        key.data()
+                    except Exception:
+                        logger.exception(f"Reader callback {key.data!r} raised an exception.")
+                self._run_due_timers()
+        finally:
+            with self._lock:
+                self._timers.clear()
+            self._selector.close()
+            self._wakeup_recv.close()
+            self._wakeup_send.close()
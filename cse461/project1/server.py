@@ -1,13 +1,28 @@
 import socketserver
+import collections
 import threading
 import logging
+import socket
 import secrets
 import random
 import struct
-
-from typing import Callable
-from cse461.project1.packet import Packet
-from cse461.project1.wrappers import synchronized
+import time
+
+from typing import Any, Callable, Dict, Optional, Tuple
+from cse461.project1.packet import (Packet, PacketView, HEADER, UINT32, STAGE_A_RESPONSE,
+                                    STAGE_B_RESPONSE, STAGE_C_RESPONSE)
+from cse461.project1.batch import PacketBatch
+from cse461.project1.framer import PacketFramer
+from cse461.project1.datagrams import DatagramBatch, DatagramRequest
+from cse461.project1.sessions import SessionStore, Session, Stage
+from cse461.project1.tokens import SessionTokens
+from cse461.project1.admission import AdmissionControl
+from cse461.project1.scheduler import Scheduler
+from cse461.project1.workers import WorkerPool
+from cse461.project1.logs import LogSampler
+from cse461.project1.metrics import MetricsRegistry, stats_handler
+from cse461.project1.ports import PortAllocator
+from cse461.project1.wrappers import Stoppable, synchronized
 from cse461.project1.consts import *
 
 __all__ = ['Server']
@@ -24,53 +39,157 @@ class HookedHandler(socketserver.BaseRequestHandler):
         self.callback(self, *self.callback_args)
 
 
-class ServerTimeout(Exception):
-    """Exception indicating that a TimeoutThreadingServer timed out."""
-
-
 class TimeoutThreadingServer(socketserver.ThreadingTCPServer):
+    """Server whose socket is watched by a Scheduler instead of a thread of
+    its own. Each request is still handled on a new thread."""
+    # Handler threads are not joined on close, since servers are closed
+    # from the scheduler's thread.
+    block_on_close = False
+    # Connections wait to be accepted while the scheduler's thread serves
+    # other sockets, so allow more than socketserver's default of 5.
+    request_queue_size = socket.SOMAXCONN
+
     def __init__(self, *args,
                  timeout: float = None,
                  after_close: Callable = lambda: None,
+                 sock: socket.socket = None,
+                 workers: WorkerPool = None,
                  **kwargs):
+        """
+        :param sock: If given, serve on this already bound socket instead
+                    of binding a new one.
+        :param workers: Pool of threads to handle requests on.
+        """
         self.timeout = timeout
         self.after_close = after_close
-        super().__init__(*args, **kwargs)
-
-    def serve_until_timeout(self):
-        """Override in subclass."""
+        self.workers = workers if workers is not None else WorkerPool()
+        self.scheduler = None
+        self.timer = None
+        if sock is None:
+            super().__init__(*args, **kwargs)
+        else:
+            super().__init__(*args, bind_and_activate=False, **kwargs)
+            self.socket.close()
+            self.socket = sock
+            self.server_address = sock.getsockname()
+            self.server_activate()
+
+    def serve(self, scheduler: Scheduler):
+        """Starts handling requests on `scheduler`'s thread. If this server
+        has a timeout, it is closed once it times out."""
+        self.scheduler = scheduler
+        scheduler.add_reader(self.socket, self.handle_ready)
+        if self.timeout is not None:
+            self.timer = scheduler.call_later(self.timeout, self.check_timeout)
+
+    def handle_ready(self):
+        """Called by the scheduler when the socket is readable. Override in subclass."""
+
+    def process_request(self, request, client_address):
+        if not self.workers.submit(self.process_request_thread, request, client_address):
+            logger.error("Too many requests are waiting to be handled. Dropping connection "
+                         "from %s:%d.", *client_address)
+            self.shutdown_request(request)
+
+    def check_timeout(self):
+        """Called by the scheduler once this server's timeout has elapsed."""
+        if self.fileno() != -1:
+            self.handle_timeout()
+            self.close()
+
+    def close(self):
+        """Closes the server and calls after_close. Call from the scheduler's
+        thread, or after the scheduler has stopped."""
+        if self.fileno() == -1:
+            return
+        if self.timer is not None:
+            self.timer.cancel()
+        if self.scheduler is not None:
+            self.scheduler.remove_reader(self.socket)
+        self.server_close()
+        self.after_close()
 
 
 class TimeoutThreadingUDPServer(socketserver.ThreadingUDPServer, TimeoutThreadingServer):
+    """UDP server that receives datagrams in batches. Each time the socket
+    is readable, every ready datagram is received into a DatagramBatch,
+    and the batch is handled on one thread, which calls `callback` with
+    each datagram and then sends all of their replies."""
+
+    def __init__(self, server_address: Tuple[str, int],
+                 callback: Callable[[DatagramRequest], Any], *args,
+                 batches: collections.deque = None, proxied: bool = False, **kwargs):
+        """
+        :param callback: Called with a DatagramRequest for each datagram.
+        :param batches: Free DatagramBatches, which may be shared by servers
+                    with the same `proxied`.
+        :param proxied: If True, datagrams are relayed by a Balancer (see
+                    DatagramBatch).
+        """
+        super().__init__(server_address, None, *args, **kwargs)
+        self.callback = callback
+        self.batches = batches if batches is not None else collections.deque()
+        self.proxied = proxied
+        self.last_active = time.monotonic()
+
     def handle_timeout(self):
-        logger.info(f"UDP server at {self.server_address[0]}:{self.server_address[1]} "
-                    f"timed out. Shutting down.")
-        raise ServerTimeout
+        logger.debug("UDP server at %s:%d timed out. Shutting down.", *self.server_address)
 
-    def serve_until_timeout(self):
-        # If the file descriptor is -1, the socket is closed.
-        while self.fileno() != -1:
-            try:
-                self.handle_request()
-            except ServerTimeout:
-                self.server_close()
-                self.after_close()
-                return
+    def handle_ready(self):
+        self.last_active = time.monotonic()
+        try:
+            batch = self.batches.pop()
+        except IndexError:
+            batch = DatagramBatch(proxied=self.proxied)
+        batch.recv(self.socket)
+        if not batch.count:
+            self.batches.append(batch)
+        elif not self.workers.submit(self.process_batch, batch):
+            logger.error("Too many requests are waiting to be handled. Dropping %d "
+                         "datagrams received by UDP server at %s:%d.",
+                         batch.count, *self.server_address)
+            self.batches.append(batch)
+
+    def process_batch(self, batch: DatagramBatch):
+        try:
+            for request in batch.requests(self):
+                try:
+                    self.callback(request)
+                except Exception:
+                    self.handle_error(request, request.client_address)
+            batch.flush(self.socket)
+        finally:
+            self.batches.append(batch)
+
+    def check_timeout(self):
+        # UDP servers time out after `timeout` seconds without a packet.
+        # Rather than rescheduling the timer on every packet, check when
+        # the last packet arrived once the timer fires.
+        idle = time.monotonic() - self.last_active
+        if self.fileno() != -1 and idle < self.timeout:
+            self.timer = self.scheduler.call_later(self.timeout - idle, self.check_timeout)
+        else:
+            super().check_timeout()
 
 
 class TimeoutThreadingTCPServer(TimeoutThreadingServer):
     def handle_timeout(self):
-        logger.info(f"TCP server at {self.server_address[0]}:{self.server_address[1]} "
-                    f"timed out. Shutting down.")
+        logger.debug("TCP server at %s:%d timed out. Shutting down.", *self.server_address)
 
-    def serve_until_timeout(self):
+    def handle_ready(self):
         # TCP only handles a single request
-        self.handle_request()
-        self.server_close()
-        self.after_close()
+        self._handle_request_noblock()
+        self.close()
+
+
+class PooledThreadingTCPServer(TimeoutThreadingServer):
+    def handle_ready(self):
+        # Shared TCP servers handle requests until closed. Each connection
+        # is handled on its own thread.
+        self._handle_request_noblock()
 
 
-class Server:
+class Server(Stoppable):
     """Multithreaded server implementation for protocol
     outlined in CSE 461 SPR 2020 Project 1 (Sockets API).
 
@@ -90,61 +209,359 @@ class Server:
 
     Timeouts for UDP/TCP servers started by this Server
     (excluding the first UDP server) can also be configured in
-    consts.py.
+    consts.py. All servers are served, and all timeouts fired, by
+    a single Scheduler thread; only requests get threads of their own.
+
+    Serve stage B for all sessions from 4 long-lived UDP servers
+    instead of starting a new UDP server per session:
+    >>> server = Server(udp_pool_size=4)
+
+    Likewise, accept stage C connections on 4 long-lived TCP servers:
+    >>> server = Server(tcp_pool_size=4)
     """
 
-    def __init__(self, ip_addr: str = SERVER_ADDR):
+    def __init__(self, ip_addr: str = SERVER_ADDR, udp_pool_size: int = 0,
+                 tcp_pool_size: int = 0, session_ttl: Dict[str, float] = None,
+                 max_sessions: int = MAX_SESSIONS, port_range: Tuple[int, int] = PORT_RANGE,
+                 warm_ports: int = 0, reuse_port: bool = False,
+                 worker_threads: int = WORKER_THREADS,
+                 worker_queue_size: int = WORKER_QUEUE_SIZE,
+                 reject_policy: str = WorkerPool.DISCARD,
+                 log_sample_rate: int = LOG_SAMPLE_RATE,
+                 stats_port: int = None, stateless: bool = False,
+                 token_key: bytes = None, node_id: int = 0, node_bits: int = 0,
+                 balancer_port: int = None, session_limit: int = None,
+                 session_limit_per_ip: int = None, hello_rate: float = None,
+                 hello_burst: int = None):
         """
         Constructor. Initializes the server but does not start it.
         To start the server, call start() or run().
 
         :param ip_addr: IP Address for this server. Defaults to consts.SERVER_ADDR.
+        :param udp_pool_size: If nonzero, stage B packets for every session are
+                    received by a fixed pool of this many UDP servers (started
+                    by start()) and demultiplexed by their secret, rather than
+                    by a new UDP server per session. Sessions then time out
+                    individually after session_ttl['a'] seconds without a
+                    packet.
+        :param tcp_pool_size: If nonzero, stage C connections for every session
+                    are accepted by a fixed pool of this many TCP servers
+                    (started by start()), rather than by a new TCP server per
+                    session. Each connection is matched with a session waiting
+                    on the port it connected to (see pop_pending()).
+        :param session_ttl: Maps each stage ('a', 'b' or 'c') to the number of
+                    seconds a session that finished that stage is kept without
+                    progress before it is discarded. Stages default to
+                    consts.SESSION_TTL. Sessions are also discarded as soon
+                    as they move on to the next stage.
+        :param max_sessions: Maximum number of sessions to keep. Once reached,
+                    the least recently used sessions are discarded. Defaults
+                    to consts.MAX_SESSIONS.
+        :param port_range: Range of ports (inclusive) to start stage B and C
+                    servers on. Defaults to consts.PORT_RANGE.
+        :param warm_ports: Number of UDP and TCP sockets to keep bound ahead
+                    of time, so that starting a server for a session doesn't
+                    wait for bind().
+        :param reuse_port: If True, bind the stage A port with SO_REUSEPORT so
+                    that several servers (e.g. the processes of a
+                    PreforkServer) can share it.
+        :param worker_threads: Maximum number of threads handling requests
+                    (batches of datagrams and TCP connections). Defaults to
+                    consts.WORKER_THREADS.
+        :param worker_queue_size: Maximum number of requests waiting for a
+                    thread. Defaults to consts.WORKER_QUEUE_SIZE.
+        :param reject_policy: What to do with requests that arrive while the
+                    queue is full (see WorkerPool). By default, they are
+                    dropped. WorkerPool.CALLER_RUNS can't be combined with
+                    tcp_pool_size: connections would then be handled on the
+                    scheduler's thread, which blocks every server while it
+                    waits for a client's stage D packets.
+        :param log_sample_rate: Log one in this many packets at DEBUG level.
+                    Finished sessions are each summarized at INFO level.
+                    Defaults to consts.LOG_SAMPLE_RATE.
+        :param stats_port: If given, start() also serves stats() at
+                    /stats and metrics.snapshot() at /metrics as JSON over
+                    HTTP on this port (0 for any free port; see
+                    stats_address).
+        :param stateless: If True, session secrets are SessionTokens: every
+                    session parameter is derived from its secret with a
+                    keyed MAC, so any Server with the same `token_key` can
+                    serve the session's later stages. Only stage B's
+                    progress is stored, by the server receiving its
+                    packets, and the secrets that finished stage B, until
+                    they expire. Requires udp_pool_size, since the stage B
+                    port is derived from the secret.
+        :param token_key: Key for stateless secrets, shared by every
+                    server that may serve a session. Defaults to a random
+                    key.
+        :param node_id: ID of this server among the nodes behind a
+                    Balancer, stored in the top `node_bits` bits of every
+                    secret it issues.
+        :param node_bits: Number of bits of each secret holding node_id.
+                    Must match the Balancer's.
+        :param balancer_port: If given, this server is a node behind a
+                    Balancer listening on this port. Datagrams to the
+                    stage A port are then relayed by the Balancer, stage B
+                    packets are received there too, and clients are told
+                    to send stage B packets to balancer_port. Stage C and
+                    D connect to this server's own TCP port, so it must
+                    listen on the Balancer's IP address.
+        :param session_limit: If given, hellos are dropped while this many
+                    sessions are in progress.
+        :param session_limit_per_ip: If given, hellos are dropped while
+                    this many sessions from the same IP address are in
+                    progress.
+        :param hello_rate: If given, at most this many sessions are started
+                    per second on average. Other hellos are dropped.
+        :param hello_burst: Number of sessions that may be started at once
+                    when hello_rate is given. Defaults to hello_rate.
         """
+        if stateless and not udp_pool_size and balancer_port is None:
+            raise ValueError("Stateless sessions require a udp_pool_size or balancer_port")
+        if tcp_pool_size and reject_policy == WorkerPool.CALLER_RUNS:
+            raise ValueError("The caller_runs reject_policy can't be used with a tcp_pool_size")
         self.ip_addr = ip_addr
-        self.secrets = {}
+        self.session_ttl = {stage: SESSION_TTL for stage in "abc"}
+        self.session_ttl.update(session_ttl or {})
+        # Session state for every secret, locked per shard
+        self.secrets = SessionStore(max_size=max_sessions, node_id=node_id, node_bits=node_bits)
+        # Issues and verifies secrets in stateless mode
+        self.tokens = None
+        # Stage A secrets of stateless sessions that finished stage B on
+        # this server. Kept until the secrets no longer verify (on any
+        # server's clock) so that they can't start stage B again.
+        self.finished = None
+        if stateless:
+            self.tokens = SessionTokens(token_key, lifetime=max(self.session_ttl.values()),
+                                        node_id=node_id, node_bits=node_bits)
+            self.finished = SessionStore(ttl=self.tokens.max_lifetime + CLOCK_SKEW,
+                                         max_size=max_sessions)
+        self.balancer_port = balancer_port
+        # Decides which hellos start sessions. Sessions that never finish
+        # stop counting once they could no longer have.
+        self.admission = AdmissionControl(max_sessions=session_limit,
+                                          max_per_ip=session_limit_per_ip,
+                                          rate=hello_rate, burst=hello_burst,
+                                          lease=sum(self.session_ttl.values()))
+        # Port of the stage A server, set by start()
+        self.port = None
         self.tcp_servers = {}
         self.udp_servers = {}
+        # Hands out ports for stage B and C servers
+        self.ports = PortAllocator(ip_addr, *port_range, warm=warm_ports, exclude=(START_PORT,))
+        self.udp_pool_size = udp_pool_size
+        # Ports of the shared stage B UDP servers
+        self.udp_pool = []
+        self.tcp_pool_size = tcp_pool_size
+        # Ports of the shared stage C/D TCP servers
+        self.tcp_pool = []
+        # Maps each shared TCP server's port to the sessions waiting to
+        # connect to it, as (stage B response, client ip, deadline) tuples.
+        self.tcp_pending = {}
+        # Runs every server's socket callbacks and owns all session
+        # deadlines. Created by start().
+        self.scheduler = None
+        # Threads handling requests for every server
+        self.worker_config = {'size': worker_threads, 'queue_size': worker_queue_size,
+                              'policy': reject_policy}
+        self.workers = WorkerPool(**self.worker_config)
+        # Free buffers for receiving datagrams, shared by every UDP server
+        self.batches = collections.deque()
+        # Set to make run() return (e.g. on SIGINT or SIGTERM)
+        self.stop_requested = threading.Event()
+        # Set once the server stops accepting new sessions (see drain())
+        self.draining = threading.Event()
+        # Set once start() has bound every port
+        self.started = threading.Event()
+        self.reuse_port = reuse_port
+        # Decides which packets to log at DEBUG level
+        self.sample = LogSampler(logger, rate=log_sample_rate)
+        # Counters (session outcomes, dropped packets and rejections by
+        # reason), gauges and per-stage latency histograms. See stats().
+        self.metrics = MetricsRegistry()
+        self.metrics.gauge('sessions', lambda: self.secrets.stats())
+        self.metrics.gauge('servers', lambda: len(self.udp_servers) + len(self.tcp_servers))
+        self.metrics.gauge('ports_allocated', lambda: len(self.ports))
+        self.metrics.gauge('pool', lambda: self.workers.stats())
+        self.metrics.gauge('admitted', lambda: self.admission.stats())
+        self.stats_port = stats_port
+        # HTTP server for stats and metrics, if stats_port was given
+        self.stats_server = None
+        # Guards the server and port tables above. Session state is
+        # guarded by self.secrets, so stage handlers only take this lock
+        # briefly to start or look up servers.
         self.rlock = threading.RLock()
 
         # Wrap critical methods with re-entrant locks
-        self.handle_stage_a = synchronized(self.handle_stage_a, lock=self.rlock)
-        self.handle_stage_b = synchronized(self.handle_stage_b, lock=self.rlock)
-        self.handle_stage_c = synchronized(self.handle_stage_c, lock=self.rlock)
-        self.handle_stage_d = synchronized(self.handle_stage_d, lock=self.rlock)
         self.start = synchronized(self.start, lock=self.rlock)
-        self.stop = synchronized(self.stop, lock=self.rlock)
-        self.generate_secret = synchronized(self.generate_secret, lock=self.rlock)
-        self.random_port = synchronized(self.random_port, lock=self.rlock)
+        self.pop_pending = synchronized(self.pop_pending, lock=self.rlock)
 
     def start(self, port=START_PORT):
+        if self.workers.closed:
+            # Restarting after stop()
+            self.workers = WorkerPool(**self.worker_config)
+        # Accept sessions again after drain() or run()
+        self.draining.clear()
+        self.stop_requested.clear()
+        self.scheduler = Scheduler()
+        self.scheduler.start()
+        self.port = port
+        sock = None
+        if self.reuse_port:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind((self.ip_addr, port))
+        proxied = self.balancer_port is not None
         server = TimeoutThreadingUDPServer(
             (self.ip_addr, port),
-            self.handler_factory(callback=self.handle_stage_a),
-            after_close=synchronized(lambda: self.udp_servers.pop(port), lock=self.rlock)
+            self.handle_relayed if proxied else self.handle_stage_a,
+            sock=sock,
+            workers=self.workers,
+            # Relayed datagrams need batches of their own
+            batches=collections.deque() if proxied else self.batches,
+            proxied=proxied,
+            after_close=lambda: self.release_server(self.udp_servers, port)
         )
         self.udp_servers[port] = server
         self.start_server(server)
         logger.info(f"[Start] Started new UDP server at {self.ip_addr}:{port}.")
+        self.ports.warm_up()
+
+        for _ in range(self.udp_pool_size):
+            udp_port = self.start_udp_server(timeout=None)
+            self.udp_pool.append(udp_port)
+            logger.info(f"[Start] Started new shared stage B UDP server "
+                        f"at {self.ip_addr}:{udp_port}.")
+
+        for _ in range(self.tcp_pool_size):
+            tcp_port = self.start_pooled_tcp_server()
+            self.tcp_pool.append(tcp_port)
+            logger.info(f"[Start] Started new shared stage C TCP server "
+                        f"at {self.ip_addr}:{tcp_port}.")
+
+        if self.stats_port is not None:
+            self.start_stats_server(self.stats_port)
+            logger.info(f"[Start] Serving stats at http://{self.ip_addr}:"
+                        f"{self.stats_address[1]}/stats.")
+        self.started.set()
 
     def stop(self):
         logger.info(f"[Stop] Received stop request. Shutting down servers "
-                    f"(count: {threading.active_count() - 1}) and cleaning up.")
-        # Copy tcp/udp server lists so we don't run into data race issues
-        # (after timeout, tcp/udp servers execute a callback that deletes
-        # the server from self.tcp_servers or self.udp_servers respectively).
-        # It is possible that some servers in the copied lists have already
-        # been closed; however, server_close() being called twice on the
-        # same server is ok because under the hood it calls socket.close(),
-        # which just exits without raising an error if the socket is already closed.
-        for tcp_server in list(self.tcp_servers.values()):
-            tcp_server.server_close()
-        for udp_server in list(self.udp_servers.values()):
-            udp_server.server_close()
+                    f"(count: {len(self.tcp_servers) + len(self.udp_servers)}) and cleaning up.")
+        # Stop the scheduler first so that no server is closed while the
+        # scheduler is using it. This must not hold self.rlock, which the
+        # scheduler's thread acquires when a server closes.
+        if self.scheduler is not None:
+            self.scheduler.stop()
+        with self.rlock:
+            # Closing a server removes it from self.tcp_servers or
+            # self.udp_servers, so iterate over copies.
+            for tcp_server in list(self.tcp_servers.values()):
+                tcp_server.close()
+            for udp_server in list(self.udp_servers.values()):
+                udp_server.close()
+            if self.stats_server is not None:
+                self.stats_server.close()
+        # Let the pool's threads exit once they finish their requests
+        self.workers.shutdown(timeout=0)
+        self.ports.close()
         logger.info("[Stop] Successfully shut down all servers. Exiting.")
 
-    @staticmethod
-    def start_server(server: TimeoutThreadingServer):
-        threading.Thread(target=server.serve_until_timeout).start()
+    def start_udp_server(self, timeout: float = None) -> int:
+        """
+        Starts a UDP server on a free port that handles stage B packets.
+
+        :return: The server's port.
+        """
+        sock = self.ports.allocate(socket.SOCK_DGRAM)
+        port = sock.getsockname()[1]
+        server = TimeoutThreadingUDPServer(
+            (self.ip_addr, port),
+            self.handle_stage_b,
+            workers=self.workers,
+            batches=self.batches,
+            sock=sock,
+            timeout=timeout,
+            after_close=lambda: self.release_server(self.udp_servers, port)
+        )
+        with self.rlock:
+            self.udp_servers[port] = server
+        self.start_server(server)
+        return port
+
+    def start_tcp_server(self, p_secret: int, student_id: int) -> Tuple[int, Packet]:
+        """
+        Starts a TCP server on a free port that handles stages C and D for
+        the session with stage B secret `p_secret`.
+
+        :return: The server's port and the stage B response advertising
+                 the server to the client.
+        """
+        sock = self.ports.allocate(socket.SOCK_STREAM)
+        port = sock.getsockname()[1]
+        payload = STAGE_B_RESPONSE.pack(port, p_secret)
+        response = Packet(
+            payload=payload,
+            p_secret=p_secret,
+            step=2,
+            student_id=student_id
+        )
+        server = TimeoutThreadingTCPServer(
+            (self.ip_addr, port),
+            self.handler_factory(callback=self.handle_stage_c, callback_args=(response,)),
+            workers=self.workers,
+            sock=sock,
+            timeout=TIMEOUT,
+            after_close=lambda: self.release_server(self.tcp_servers, port)
+        )
+        with self.rlock:
+            self.tcp_servers[port] = server
+        self.start_server(server)
+        return port, response
+
+    def start_pooled_tcp_server(self) -> int:
+        """
+        Starts a shared TCP server on a free port that handles stages C
+        and D for any session waiting on that port.
+
+        :return: The server's port.
+        """
+        sock = self.ports.allocate(socket.SOCK_STREAM)
+        port = sock.getsockname()[1]
+        server = PooledThreadingTCPServer(
+            (self.ip_addr, port),
+            self.handler_factory(callback=self.accept_stage_c),
+            workers=self.workers,
+            sock=sock,
+            after_close=lambda: self.release_server(self.tcp_servers, port)
+        )
+        with self.rlock:
+            self.tcp_servers[port] = server
+            self.tcp_pending[port] = collections.deque()
+        self.start_server(server)
+        return port
+
+    def release_server(self, servers: Dict[int, TimeoutThreadingServer], port: int):
+        """Removes the closed server on `port` from `servers` and frees its port."""
+        with self.rlock:
+            servers.pop(port)
+        self.ports.release(port)
+
+    def start_stats_server(self, port: int):
+        """Starts an HTTP server on `port` that answers GET /stats with
+        stats() and GET /metrics with metrics.snapshot(), as JSON."""
+        handler = stats_handler({'/stats': self.stats, '/metrics': self.metrics.snapshot})
+        self.stats_server = PooledThreadingTCPServer((self.ip_addr, port), handler,
+                                                     workers=self.workers)
+        self.start_server(self.stats_server)
+
+    @property
+    def stats_address(self) -> Tuple[str, int]:
+        """Address of the HTTP stats server, if it was started."""
+        return self.stats_server.server_address if self.stats_server else None
+
+    def start_server(self, server: TimeoutThreadingServer):
+        server.serve(self.scheduler)
 
     @staticmethod
     def handler_factory(callback: Callable, callback_args: tuple = ()):
@@ -153,178 +570,332 @@ class Server:
 
         return handler
 
-    def handle_stage_a(self, handler: HookedHandler):
-        data, sock = handler.request
-
-        logger.info(f"[Stage A] Received packet {data} from "
-                    f"{handler.client_address[0]}:{handler.client_address[1]}")
+    def handle_stage_a(self, request: DatagramRequest):
+        received = time.monotonic()
+        data = request.data
+        # Log every message about this packet, or none of them
+        sampled = self.sample()
+
+        if sampled:
+            logger.debug("[Stage A] Received packet %r from %s:%d",
+                         data.tobytes(), *request.client_address)
+        if self.draining.is_set():
+            if sampled:
+                logger.debug("[Stage A] Server is shutting down. Ignoring packet from %s:%d.",
+                             *request.client_address)
+            self.metrics.inc('rejected_draining')
+            return
         try:
-            packet = Packet.from_raw(data)
+            packet = PacketView(data)
         except ValueError as e:
             # Packet is malformed
-            logger.error(e)
+            logger.error("%s", e)
+            self.metrics.inc('rejected_malformed')
             return
 
-        if (packet.payload.lower() != b'hello world\0' or
+        # Check payload_len first so that the payload is only copied
+        # (to lowercase it) when it is the expected 12 bytes long.
+        if (packet.payload_len != 12 or
                 packet.p_secret != 0 or
                 packet.step != 1 or
-                packet.payload_len != 12):
-            logger.error(f"[Stage A] Packet does not conform to protocol. "
-                         f"Packet info: {packet!r}")
+                packet.payload.tobytes().lower() != b'hello world\0'):
+            logger.error("[Stage A] Packet does not conform to protocol. "
+                         "Packet info: %r", packet)
+            self.metrics.inc('rejected_bad_hello')
             return
 
-        num_packets = random.randint(5, 10)
-        # Guarantee that packet_len is a multiple of 4.
-        packet_len = random.randint(1, 10) * 4
-        secret_a = self.generate_secret()
-        udp_port = self.random_port()
+        # Shed load before anything is stored or started for the session.
+        # Its lease follows it to each new secret, until stage D.
+        if self.tokens is not None:
+            secret_a = self.tokens.issue(Stage.A)
+        else:
+            secret_a = self.secrets.new_secret()
+        reason = self.admission.admit(secret_a, request.client_address[0], received)
+        if reason is not None:
+            if sampled:
+                logger.debug("[Stage A] Session limit (%s) reached. Dropping hello from %s:%d.",
+                             reason, *request.client_address)
+            self.metrics.inc('shed')
+            self.metrics.inc(f'shed_{reason}')
+            return
 
-        server = TimeoutThreadingUDPServer(
-            (self.ip_addr, udp_port),
-            self.handler_factory(callback=self.handle_stage_b),
-            timeout=TIMEOUT,
-            after_close=synchronized(lambda: self.udp_servers.pop(udp_port), lock=self.rlock)
-        )
-        assert udp_port not in self.udp_servers
-        self.udp_servers[udp_port] = server
-        self.start_server(server)
-        logger.info(f"[Stage A] Started new UDP server at {self.ip_addr}:{udp_port}.")
-
-        # For stage B, don't acknowledge one packet
-        # ack_fails = set()
-        ack_fails = {random.choice(range(num_packets))}
-        # ack_fails = set(random.sample(
-        #     range(num_packets),
-        #     k=random.randint(1, num_packets))
-        # )
-        # Store relevant data for stage B
-        self.secrets[secret_a] = {
-            'prev_stage': "a",
-            "num_packets": num_packets,
-            # Number of packets that the server is still expecting to receive
-            "remaining_packets": num_packets,
-            # Packets that we should drop once
-            "ack_fails": ack_fails,
-            "packet_len": packet_len
-        }
-
-        payload = struct.pack("!4I", num_packets, packet_len, udp_port, secret_a)
+        if self.tokens is not None:
+            # Nothing is stored. Whichever server receives the session's
+            # stage B packets recovers it from its secret.
+            session = self.tokens.session(secret_a, Stage.A)
+            num_packets, packet_len = session.num_packets, session.packet_len
+        else:
+            num_packets = random.randint(5, 10)
+            # Guarantee that packet_len is a multiple of 4.
+            packet_len = random.randint(1, 10) * 4
+
+            # For stage B, don't acknowledge one packet (a bitmask of packet IDs)
+            ack_fails = 1 << random.randrange(num_packets)
+            # Store relevant data for stage B
+            session = Session(Stage.A, started=received, last_seen=received,
+                              num_packets=num_packets, ack_fails=ack_fails,
+                              packet_len=packet_len)
+            self.secrets.add(session, ttl=self.session_ttl["a"], secret=secret_a)
+            self.scheduler.call_later(self.session_ttl["a"], self.expire_session, secret_a)
+        self.metrics.inc('started')
+
+        if self.balancer_port is not None or self.udp_pool:
+            udp_port = self.stage_b_port(secret_a)
+        else:
+            udp_port = self.start_udp_server(timeout=TIMEOUT)
+            if sampled:
+                logger.debug("[Stage A] Started new UDP server at %s:%d.", self.ip_addr, udp_port)
+        # Port that stage B packets must be sent to. The client cannot send
+        # stage B packets before receiving the response below.
+        session.udp_port = udp_port
+
+        # Behind a Balancer, stage B packets reach this server through it
+        advertised_port = udp_port if self.balancer_port is None else self.balancer_port
+        payload = STAGE_A_RESPONSE.pack(num_packets, packet_len, advertised_port, secret_a)
         response = Packet(
             payload=payload,
             p_secret=0,
             step=2,
             student_id=packet.student_id
         )
-        logger.info(f"[Stage A] Sending packet {response} "
-                    f"to {handler.client_address[0]}:{handler.client_address[1]}")
-        sock.sendto(response.bytes, handler.client_address)
-
-    def handle_stage_b(self, handler: HookedHandler):
-        if handler.server.fileno() == -1:
-            client_ip, client_port = handler.client_address
-            server_ip, server_port = handler.server.server_address
-            logger.error(f"[Stage B] Received data from {client_ip}:{client_port} "
-                         f"but the server at {server_ip}:{server_port} is already closed.")
+        if sampled:
+            logger.debug("[Stage A] Sending packet %r to %s:%d",
+                         response, *request.client_address)
+        request.reply(response.bytes)
+        now = time.monotonic()
+        # Stage B starts once the client has the response
+        session.stage_started = now
+        self.metrics.observe('stage_a', now - received)
+
+    def stage_b_port(self, secret: int) -> int:
+        """Returns the port of the long-lived server that receives stage B
+        packets for `secret`."""
+        if self.balancer_port is not None:
+            return self.port
+        return self.udp_pool[secret % len(self.udp_pool)]
+
+    def handle_relayed(self, request: DatagramRequest):
+        """Handles a datagram relayed by a Balancer, which sends stage A and
+        B packets to the same port."""
+        if len(request.data) >= HEADER.size and HEADER.unpack_from(request.data)[1] != 0:
+            self.handle_stage_b(request)
+        else:
+            self.handle_stage_a(request)
+
+    def handle_stage_b(self, request: DatagramRequest):
+        if request.server.fileno() == -1:
+            client_ip, client_port = request.client_address
+            server_ip, server_port = request.server.server_address
+            logger.error("[Stage B] Received data from %s:%d "
+                         "but the server at %s:%d is already closed.",
+                         client_ip, client_port, server_ip, server_port)
+            self.metrics.inc('rejected_server_closed')
             return
 
-        data, sock = handler.request
-        logger.info(f"[Stage B] Received packet {data} from "
-                    f"{handler.client_address[0]}:{handler.client_address[1]}")
+        data = request.data
+        # Log every message about this packet, or none of them
+        sampled = self.sample()
+        if sampled:
+            logger.debug("[Stage B] Received packet %r from %s:%d",
+                         data.tobytes(), *request.client_address)
         try:
-            packet = Packet.from_raw(data)
+            packet = PacketView(data)
         except ValueError as e:
             # Malformed packet
-            logger.error(e)
-            return
-        try:
-            prev_stage = self.secrets[packet.p_secret]['prev_stage']
-            num_packets = self.secrets[packet.p_secret]["num_packets"]
-            remaining_packets = self.secrets[packet.p_secret]["remaining_packets"]
-            ack_fails = self.secrets[packet.p_secret]["ack_fails"]
-            packet_len = self.secrets[packet.p_secret]['packet_len']
-
-            packet_id = struct.unpack("!I", packet.payload[:4])[0]
-        except KeyError:
-            logger.error(f"Unrecognized secret: {packet.p_secret}")
-            return
-        except struct.error:
-            logger.error("Packet payload must be at least 4 bytes long")
-            return
-        assert prev_stage == "a"
-        # Ensure that this packet is a valid packet for step b1
-        if (packet.step != 1 or
-                packet_len + 4 != len(packet.payload)):
-            logger.error(f"[Stage B] Packet does not conform to protocol. "
-                         f"Packet info: {packet!r}\n"
-                         f"packet.step: {packet.step}, expected: 1\n"
-                         f"len(packet.payload): {len(packet.payload)}, "
-                         f"expected: {packet_len + 4}\n"
-                         f"packet_id: {packet_id}, expected: {num_packets - remaining_packets}, "
-                         f"num_packets: {num_packets}, remaining_packets: {remaining_packets}")
+            logger.error("%s", e)
+            self.metrics.inc('rejected_malformed')
             return
 
-        if packet_id in ack_fails:
-            logger.info(f"[Stage B] Dropping packet with id {packet_id}")
-            ack_fails.remove(packet_id)
-            return
-        else:
-            logger.info(f"[Stage B] Acknowledging packet with id {packet_id}")
+        # Only hold the session's lock while checking and updating its state.
+        with self.secrets.lock(packet.p_secret):
+            session = self.secrets.get(packet.p_secret)
+            if session is None and self.tokens is not None:
+                if packet.p_secret in self.finished:
+                    logger.error("[Stage B] Session with secret %d already finished stage B.",
+                                 packet.p_secret)
+                    self.metrics.inc('rejected_replay')
+                    return
+                session = self.recover_stage_b(packet.p_secret)
+            if session is None or session.stage != Stage.A:
+                logger.error("Unrecognized secret: %d", packet.p_secret)
+                self.metrics.inc('rejected_unknown_secret')
+                return
+            try:
+                packet_id = UINT32.unpack_from(packet.payload)[0]
+            except struct.error:
+                logger.error("Packet payload must be at least 4 bytes long")
+                self.metrics.inc('rejected_short_payload')
+                return
+            num_packets = session.num_packets
+            remaining_packets = session.remaining_packets
+            packet_len = session.packet_len
+
+            if request.server.server_address[1] != session.udp_port:
+                logger.error("[Stage B] Received packet for secret %d on port %d, expected: %d",
+                             packet.p_secret, request.server.server_address[1],
+                             session.udp_port)
+                self.metrics.inc('rejected_wrong_port')
+                return
+            now = time.monotonic()
+            if now - session.last_seen > self.session_ttl["a"]:
+                # Shared UDP servers stay open, so time out the session itself
+                logger.info("[Stage B] Session with secret %d timed out.", packet.p_secret)
+                del self.secrets[packet.p_secret]
+                self.admission.release(packet.p_secret)
+                self.metrics.inc('timed_out')
+                return
+            session.last_seen = now
+            self.secrets.touch(packet.p_secret, ttl=self.session_ttl["a"])
+            # Ensure that this packet is a valid packet for step b1
+            if (packet.step != 1 or
+                    packet_len + 4 != len(packet.payload)):
+                logger.error("[Stage B] Packet does not conform to protocol. "
+                             "Packet info: %r\n"
+                             "packet.step: %d, expected: 1\n"
+                             "len(packet.payload): %d, expected: %d\n"
+                             "packet_id: %d, expected: %d, "
+                             "num_packets: %d, remaining_packets: %d",
+                             packet, packet.step, len(packet.payload), packet_len + 4,
+                             packet_id, num_packets - remaining_packets,
+                             num_packets, remaining_packets)
+                self.metrics.inc('rejected_bad_packet')
+                return
+
+            if session.ack_fails >> packet_id & 1:
+                if sampled:
+                    logger.debug("[Stage B] Dropping packet with id %d", packet_id)
+                session.ack_fails ^= 1 << packet_id
+                self.metrics.inc('ack_fails_dropped')
+                return
+            # Only decrement remaining_packets if this is not a resent packet.
+            # Stage C is started once, by the packet that completes stage B.
+            completed = False
             if num_packets - remaining_packets == packet_id:
-                # Only decrement remaining_packets if this is not a resent packet
-                self.secrets[packet.p_secret]["remaining_packets"] -= 1
-            ack = Packet(
-                payload=packet.payload[:4],
-                p_secret=packet.p_secret,
-                step=2,
-                student_id=packet.student_id
-            )
-
-            sock.sendto(ack.bytes, handler.client_address)
-
-        if self.secrets[packet.p_secret]["remaining_packets"] == 0:
-            secret_b = self.generate_secret()
-            self.secrets[secret_b] = {'prev_stage': "b"}
-
-            tcp_port = self.random_port()
-            payload = struct.pack("!II", tcp_port, secret_b)
-            response = Packet(
-                payload=payload,
-                p_secret=secret_b,
-                step=2,
-                student_id=packet.student_id
-            )
-            server = TimeoutThreadingTCPServer(
-                (self.ip_addr, tcp_port),
-                self.handler_factory(callback=self.handle_stage_c, callback_args=(response,)),
-                timeout=TIMEOUT,
-                after_close=synchronized(lambda: self.tcp_servers.pop(tcp_port), lock=self.rlock)
-            )
-            assert tcp_port not in self.tcp_servers
-            self.tcp_servers[tcp_port] = server
-            self.start_server(server)
-
-            logger.info(f"[Stage B] Started new TCP server at {self.ip_addr}:{tcp_port}.")
-            logger.info(f"[Stage B] Sending packet {response} "
-                        f"to {handler.client_address[0]}:{handler.client_address[1]}")
-            sock.sendto(response.bytes, handler.client_address)
+                session.remaining_packets -= 1
+                completed = session.remaining_packets == 0
+            else:
+                self.metrics.inc('retransmissions')
+            if completed:
+                started = session.started
+                del self.secrets[packet.p_secret]
+                if self.tokens is not None:
+                    # Its secret still verifies, so remember that it was used
+                    self.finished.add(Stage.B, secret=packet.p_secret)
+                self.metrics.observe('stage_b', now - session.stage_started)
+
+        if sampled:
+            logger.debug("[Stage B] Acknowledging packet with id %d", packet_id)
+        ack = Packet(
+            payload=UINT32.pack(packet_id),
+            p_secret=packet.p_secret,
+            step=2,
+            student_id=packet.student_id
+        )
+        request.reply(ack.bytes)
+
+        if completed:
+            if self.tokens is not None:
+                secret_b = self.tokens.issue(Stage.B)
+            else:
+                now = time.monotonic()
+                secret_b = self.secrets.add(Session(Stage.B, started=started,
+                                                    stage_started=now, last_seen=now),
+                                            ttl=self.session_ttl["b"])
+                self.scheduler.call_later(self.session_ttl["b"], self.expire_session, secret_b)
+            self.admission.transfer(packet.p_secret, secret_b)
+
+            if self.tcp_pool:
+                with self.rlock:
+                    # Advertise the shared TCP server with the fewest waiting sessions
+                    tcp_port = min(self.tcp_pool, key=lambda port: len(self.tcp_pending[port]))
+                    payload = STAGE_B_RESPONSE.pack(tcp_port, secret_b)
+                    response = Packet(
+                        payload=payload,
+                        p_secret=secret_b,
+                        step=2,
+                        student_id=packet.student_id
+                    )
+                    self.tcp_pending[tcp_port].append(
+                        (response, request.client_address[0], time.monotonic() + TIMEOUT))
+            else:
+                tcp_port, response = self.start_tcp_server(secret_b, packet.student_id)
+                if sampled:
+                    logger.debug("[Stage B] Started new TCP server at %s:%d.",
+                                 self.ip_addr, tcp_port)
+
+            if sampled:
+                logger.debug("[Stage B] Sending packet %r to %s:%d",
+                             response, *request.client_address)
+            request.reply(response.bytes)
+
+    def accept_stage_c(self, handler: HookedHandler):
+        """Handles a connection to a shared TCP server by matching it with
+        a session waiting for stage C on that port."""
+        port = handler.server.server_address[1]
+        response = self.pop_pending(port, handler.client_address[0])
+        if response is None:
+            logger.error("[Stage C] No session is waiting for a connection from %s:%d "
+                         "on port %d.", *handler.client_address, port)
+            self.metrics.inc('rejected_no_session')
+            return
+        self.handle_stage_c(handler, response)
+
+    def pop_pending(self, port: int, client_ip: str):
+        """
+        Removes and returns the stage B response of the session that a new
+        connection from `client_ip` to the shared TCP server on `port` belongs to.
+
+        Sessions are matched in the order they finished stage B, preferring
+        sessions whose stage B packets came from `client_ip`. Stage C state
+        is generated when the connection is accepted, so any waiting session
+        on the port is a valid match. Sessions waiting longer than TIMEOUT
+        are discarded.
+
+        :return: The session's stage B response, or None if no session is waiting.
+        """
+        pending = self.tcp_pending[port]
+        now = time.monotonic()
+        while pending and pending[0][2] < now:
+            response, _, _ = pending.popleft()
+            logger.info("[Stage C] Session with secret %d timed out.", response.p_secret)
+            if self.secrets.pop(response.p_secret, None) is not None:
+                self.metrics.inc('timed_out')
+        live = [entry for entry in pending if entry[2] >= now]
+        if not live:
+            return None
+        entry = next((entry for entry in live if entry[1] == client_ip), live[0])
+        pending.remove(entry)
+        return entry[0]
 
     def handle_stage_c(self, handler: HookedHandler, packet: Packet):
-        assert self.secrets[packet.p_secret]["prev_stage"] == "b"
+        if self.tokens is not None:
+            session = self.tokens.session(packet.p_secret, Stage.B)
+        else:
+            session = self.secrets.pop(packet.p_secret, None)
+        if session is None:
+            logger.error("[Stage C] Session with secret %d expired.", packet.p_secret)
+            self.metrics.inc('rejected_expired')
+            return
+        assert session.stage == Stage.B
+        if session.stage_started is not None:
+            self.metrics.observe('stage_c', time.monotonic() - session.stage_started)
 
         sock = handler.request
 
-        num2 = random.randint(1, 10)
-        len2 = random.randint(1, 10) * 4
-        secret_c = self.generate_secret()
-        char = secrets.token_bytes(1)
+        if self.tokens is not None:
+            secret_c = self.tokens.issue(Stage.C)
+            session_c = self.tokens.session(secret_c, Stage.C)
+            num2, len2, char = session_c.num2, session_c.len2, session_c.char
+        else:
+            num2 = random.randint(1, 10)
+            len2 = random.randint(1, 10) * 4
+            char = secrets.token_bytes(1)
 
-        self.secrets[secret_c] = {
-            "prev_stage": "c",
-            "num2": num2,
-            "len2": len2,
-            "char": char
-        }
-        payload = struct.pack("!3I4s", num2, len2, secret_c, char * 4)
+            secret_c = self.secrets.add(Session(Stage.C, started=session.started,
+                                                num2=num2, len2=len2, char=char),
+                                        ttl=self.session_ttl["c"])
+        self.admission.transfer(packet.p_secret, secret_c)
+        payload = STAGE_C_RESPONSE.pack(num2, len2, secret_c, char * 4)
 
         response = Packet(
             payload=payload,
@@ -332,53 +903,151 @@ class Server:
             step=2,
             student_id=packet.student_id
         )
-        logger.info(f"[Stage C] Sending packet {response} "
-                    f"to {handler.client_address[0]}:{handler.client_address[1]}")
+        if self.sample():
+            logger.debug("[Stage C] Sending packet %r to %s:%d",
+                         response, *handler.client_address)
         sock.sendall(response.bytes)
-        self.handle_stage_d(handler)
+        stage_started = time.monotonic()
+        try:
+            self.handle_stage_d(handler, stage_started)
+        finally:
+            # Discard stage C state and the session's lease even if the
+            # client never sends stage D packets
+            self.secrets.pop(secret_c, None)
+            self.admission.release(secret_c)
 
-    def handle_stage_d(self, handler: HookedHandler):
+    def handle_stage_d(self, handler: HookedHandler, stage_started: float):
         sock = handler.request
+        # The client's packets may arrive split across or coalesced into
+        # any number of segments, so reassemble them with a framer.
+        sock.settimeout(TIMEOUT)
+        framer = PacketFramer()
 
-        data = sock.recv(2048)
-        logger.info(f"[Stage D] Received data {data} from "
-                    f"{handler.client_address[0]}:{handler.client_address[1]}")
-
-        payload_len, secret_c, step, student_id = struct.unpack("!IIHH", data[:12])
         try:
-            prev_stage = self.secrets[secret_c]['prev_stage']
-            num2 = self.secrets[secret_c]["num2"]
-            len2 = self.secrets[secret_c]["len2"]
-            char = self.secrets[secret_c]["char"]
-        except KeyError:
-            logger.error(f"Unrecognized secret: {secret_c}")
+            # Peek at the first header to find the session
+            header = framer.read_exact(sock, HEADER.size, consume=False)
+        except (ConnectionError, socket.timeout) as e:
+            logger.error("[Stage D] Failed to receive data from %s:%d: %r",
+                         *handler.client_address, e)
+            self.metrics.inc('rejected_incomplete')
             return
-        assert prev_stage == "c"
 
-        for i in range(num2):
-            start, end = i * (len2 + 12), (i + 1) * (len2 + 12)
-            try:
-                packet = Packet.from_raw(data[start:end])
-            except ValueError as e:
-                # Malformed packet
-                logger.info(e)
-                return
-            if packet.payload != char * len2:
-                logger.error(f"[Stage D] Packet does not conform to protocol. "
-                             f"Packet info: {packet!r}\n"
-                             f"packet.payload: {packet.payload}, expected: {char * len2}")
-                return
+        payload_len, secret_c, step, student_id = HEADER.unpack(header)
+        if self.tokens is not None:
+            session = self.tokens.session(secret_c, Stage.C)
+        else:
+            session = self.secrets.pop(secret_c, None)
+        if session is None:
+            logger.error("Unrecognized secret: %d", secret_c)
+            self.metrics.inc('rejected_unknown_secret')
+            return
+        assert session.stage == Stage.C
+        # Sessions are complete after stage D, whether or not it succeeds
+        self.admission.release(secret_c)
+        num2, len2, char, started = session.num2, session.len2, session.char, session.started
+        # Every packet must be a copy of the first, with the session's
+        # secret and payload, so the whole burst is checked at once.
+        expected = PacketBatch.repeat(Packet(payload=char * len2, p_secret=secret_c,
+                                             step=step, student_id=student_id), num2)
+
+        try:
+            data = framer.read_exact(sock, num2 * (HEADER.size + len2))
+        except (ConnectionError, socket.timeout) as e:
+            logger.error("[Stage D] Failed to receive %d packets from %s:%d: %r",
+                         num2, *handler.client_address, e)
+            self.metrics.inc('failed')
+            self.metrics.inc('rejected_incomplete')
+            self.log_session("failed", student_id, handler.client_address, started)
+            return
+        sampled = self.sample()
+        if sampled:
+            logger.debug("[Stage D] Received data %r from %s:%d",
+                         data, *handler.client_address)
+
+        batch = PacketBatch(data, payload_len=len2, count=num2)
+        index = batch.compare(expected)
+        if index is not None:
+            logger.error("[Stage D] Packet %d does not conform to protocol. "
+                         "Packet info: %r, expected: %r",
+                         index, batch[index], expected[index])
+            self.metrics.inc('failed')
+            self.metrics.inc('rejected_bad_packet')
+            self.log_session("failed", student_id, handler.client_address, started)
+            return
 
-        payload = struct.pack("!I", self.generate_secret())
+        payload = UINT32.pack(self.generate_secret())
         response = Packet(
             payload=payload,
             p_secret=secret_c,
             step=2,
             student_id=student_id
         )
-        logger.info(f"[Stage D] Sending packet {response} "
-                    f"to {handler.client_address[0]}:{handler.client_address[1]}")
+        if sampled:
+            logger.debug("[Stage D] Sending packet %r to %s:%d",
+                         response, *handler.client_address)
+        self.metrics.inc('completed')
+        now = time.monotonic()
+        self.metrics.observe('stage_d', now - stage_started)
+        if started is not None:
+            self.metrics.observe('session', now - started)
         sock.sendall(response.bytes)
+        self.log_session("completed", student_id, handler.client_address, started)
+
+    @staticmethod
+    def log_session(outcome: str, student_id: int, client_address: Tuple[str, int],
+                    started: Optional[float]):
+        """Logs a one-line summary of a session that finished stage D."""
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        if started is None:
+            # Stateless sessions don't record when they started
+            logger.info("[Session] Student %d at %s:%d %s.", student_id, *client_address,
+                        outcome)
+        else:
+            logger.info("[Session] Student %d at %s:%d %s in %.3f seconds.",
+                        student_id, *client_address, outcome, time.monotonic() - started)
+
+    def recover_stage_b(self, secret: int) -> Optional[Session]:
+        """
+        Recovers a stateless session from the first stage B packet this
+        server receives for it, and stores it to track the session's
+        progress through stage B. Call with the secret's lock held.
+
+        :return: The session, or None if `secret` is not a valid stage A
+                 secret (see SessionTokens.verify()).
+        """
+        session = self.tokens.session(secret, Stage.A)
+        if session is None:
+            return None
+        session.udp_port = self.stage_b_port(secret)
+        session.stage_started = session.last_seen = time.monotonic()
+        self.secrets.add(session, ttl=self.session_ttl["a"], secret=secret)
+        self.scheduler.call_later(self.session_ttl["a"], self.expire_session, secret)
+        return session
+
+    def expire_session(self, secret: int):
+        """
+        Discards the session for `secret` if it has made no progress in
+        the last session_ttl seconds of the stage it finished, and
+        otherwise checks again once it could have. Runs on the
+        scheduler's thread.
+        """
+        with self.secrets.lock(secret):
+            session = self.secrets.get(secret)
+            if session is None:
+                # Already finished or discarded
+                return
+            ttl = self.session_ttl[session.stage.name.lower()]
+            idle = time.monotonic() - session.last_seen
+            if idle < ttl:
+                self.scheduler.call_later(ttl - idle, self.expire_session, secret)
+                return
+            del self.secrets[secret]
+        self.admission.release(secret)
+        logger.info("Session with secret %d timed out.", secret)
+        self.metrics.inc('timed_out')
+        # drain() may be waiting for this session
+        self.workers.notify()
 
     def generate_secret(self) -> int:
         """Returns a unique, cryptographically secure secret."""
@@ -387,28 +1056,69 @@ class Server:
             if secret not in self.secrets:
                 return secret
 
-    def random_port(self) -> int:
-        """Returns a unique random port."""
-        while True:
-            port = random.randint(1024, 49151)
-            if port not in self.udp_servers and port not in self.tcp_servers:
-                return port
-
-    def run(self, seconds: float = None, port: int = START_PORT):
-        """Convenience function target for testing. Runs this server for
-        a maximum of `seconds` seconds. If `seconds` is None, runs until this
-        server is not listening to any ports (all timed out or closed)."""
-        try:
-            import time
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns every counter and gauge in self.metrics: the number of
+        sessions that were started, completed, failed and timed out,
+        packets rejected by reason (rejected_*), hellos shed by admission
+        control (shed, and shed_* by limit reached), stage B packets dropped
+        on purpose and retransmitted, the number of sessions that are
+        live, expired or were evicted (see SessionStore.stats()), open
+        servers, allocated ports, admitted sessions in progress
+        (admitted_*) and the worker pool's stats (pool_*).
+
+        Latency histograms for each stage (stage_a to stage_d) and whole
+        sessions are reported by self.metrics.snapshot().
+        """
+        stats = {'started': 0, 'completed': 0, 'failed': 0, 'timed_out': 0, 'shed': 0}
+        stats.update(self.metrics.read_counters())
+        stats.update(self.metrics.read_gauges())
+        return stats
 
-            start = time.time()
-            self.start(port)
+    def drain(self, timeout: float = None) -> bool:
+        """
+        Stops accepting new sessions and waits for sessions in progress to
+        finish or time out.
 
-            while threading.active_count() > 1 and (
-                    seconds is None or time.time() < start + seconds):
-                pass
-        finally:
-            self.stop()
+        :param timeout: Maximum number of seconds to wait. If None, waits
+                    until every session is done.
+        :return: False if some sessions were still in progress after `timeout` seconds.
+        """
+        self.draining.set()
+        logger.info(f"[Stop] Draining {len(self.secrets)} sessions in progress.")
+        return self.workers.wait_for(lambda: not self.secrets and not self.workers, timeout)
+
+    def join(self, timeout: float = None) -> bool:
+        """
+        Waits for the threads handling requests to finish. Call after stop().
+
+        :return: False if some threads were still running after `timeout` seconds.
+        """
+        return self.workers.shutdown(timeout)
+
+    def run(self, seconds: float = None, port: int = START_PORT,
+            drain_timeout: float = 2 * TIMEOUT):
+        """
+        Runs this server on the current thread until `seconds` seconds
+        have passed (forever if None), SIGINT or SIGTERM is received, or
+        request_stop() is called. Then gives sessions in progress up to
+        `drain_timeout` seconds to finish before stopping the server and
+        waiting (for up to TIMEOUT seconds) for its threads to exit.
+
+        The calling thread sleeps until it is time to stop.
+        """
+        with self.stop_on_signals():
+            try:
+                self.start(port)
+                if not self.stop_requested.wait(seconds):
+                    logger.info(f"[Stop] Server ran for {seconds} seconds.")
+                if not self.drain(drain_timeout):
+                    logger.info(f"[Stop] {len(self.secrets)} sessions did not finish "
+                                f"within {drain_timeout} seconds.")
+            finally:
+                self.stop()
+                if not self.join(TIMEOUT):
+                    logger.info(f"[Stop] {len(self.workers.threads)} threads are still running.")
 
     def __enter__(self):
         return self
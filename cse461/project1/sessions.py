@@ -0,0 +1,301 @@
+import threading
+import secrets
+import enum
+import time
+
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional
+
+__all__ = ['SessionStore', 'Session', 'Stage']
+
+_MISSING = object()
+
+
+class Stage(enum.IntEnum):
+    """The last stage of the protocol that a session finished."""
+    A = 1
+    B = 2
+    C = 3
+
+
+class Session:
+    """State of one server session, kept from the stage that created it
+    until the next stage. Fields that a stage doesn't use are left at
+    their defaults.
+
+    Stage B drops each packet whose ID is set in the `ack_fails` bitmask
+    once, clearing its bit.
+    """
+    __slots__ = ('stage', 'started', 'stage_started', 'last_seen', 'num_packets',
+                 'remaining_packets', 'ack_fails', 'packet_len', 'udp_port',
+                 'num2', 'len2', 'char')
+
+    def __init__(self, stage: Stage, started: Optional[float], stage_started: float = None,
+                 last_seen: float = 0.0, num_packets: int = 0, ack_fails: int = 0,
+                 packet_len: int = 0, udp_port: int = 0, num2: int = 0, len2: int = 0,
+                 char: bytes = b''):
+        """
+        :param stage: Last stage the session finished.
+        :param started: Time (time.monotonic()) the session started, or
+                    None if it is unknown (see SessionTokens).
+        :param stage_started: Time the session's current stage started.
+                    Defaults to `started`.
+        :param last_seen: Time the session last made progress: when it
+                    finished its stage, or received its last stage B packet.
+        :param num_packets: Number of stage B packets the client must send.
+        :param ack_fails: Bitmask of stage B packet IDs to drop once.
+        :param packet_len: Length of the stage B packets' data.
+        :param udp_port: Port that stage B packets must be sent to.
+        :param num2: Number of stage D packets the client must send.
+        :param len2: Length of the stage D packets' payloads.
+        :param char: Byte that stage D payloads must consist of.
+        """
+        self.stage = stage
+        self.started = started
+        self.stage_started = started if stage_started is None else stage_started
+        self.last_seen = last_seen
+        self.num_packets = num_packets
+        # Number of stage B packets that the server is still expecting
+        self.remaining_packets = num_packets
+        self.ack_fails = ack_fails
+        self.packet_len = packet_len
+        self.udp_port = udp_port
+        self.num2 = num2
+        self.len2 = len2
+        self.char = char
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"Session({fields})"
+
+
+class SessionStore:
+    """Thread-safe map from secrets to session state.
+
+    Sessions are split across `shards` dicts, each guarded by its own lock
+    and selected by the session's secret, so threads handling independent
+    sessions rarely contend for the same lock. Secrets are random, which
+    spreads sessions evenly across shards.
+
+    Sessions may be given a time to live, after which they are treated as
+    missing and removed, and the store may be bounded to `max_size`
+    sessions, in which case adding a session to a full shard evicts that
+    shard's least recently used session. stats() reports how many sessions
+    are live and how many have expired or been evicted.
+
+    Individual operations are atomic. To read and update a session
+    atomically, hold the lock returned by lock() for its secret:
+    >>> store = SessionStore(ttl=30, max_size=100_000)
+    >>> secret = store.add({'remaining_packets': 5})
+    >>> with store.lock(secret):
+    ...     store[secret]['remaining_packets'] -= 1
+
+    Never acquire another shard's lock (e.g. by calling add()) while
+    holding one, as two threads doing so in opposite orders deadlock.
+    """
+
+    def __init__(self, shards: int = 64, ttl: float = None, max_size: int = None,
+                 node_id: int = 0, node_bits: int = 0):
+        """
+        Constructor.
+
+        :param shards: Number of independently locked shards.
+        :param ttl: Default number of seconds a session lives after it is
+                    added or touched. If None, sessions never expire.
+        :param max_size: Maximum number of sessions to store. If None, the
+                    store is unbounded.
+        :param node_id: Stored in the top `node_bits` bits of every new
+                    secret, so that a Balancer can tell which server a
+                    secret belongs to.
+        :param node_bits: Number of bits of each secret holding node_id.
+        """
+        if not 0 <= node_id < 1 << node_bits:
+            raise ValueError(f"Node ID {node_id} does not fit in {node_bits} bits")
+        self.ttl = ttl
+        self.node_bits = node_bits
+        self._node_prefix = node_id << (32 - node_bits)
+        self.max_size = max_size
+        # Sessions are evicted per shard, so each shard gets an equal share
+        self._capacity = None if max_size is None else max(1, -(-max_size // shards))
+        # Each shard maps secrets to [session, deadline] in least to most
+        # recently used order.
+        self._shards = [OrderedDict() for _ in range(shards)]
+        self._locks = [threading.RLock() for _ in range(shards)]
+        self._expired = [0] * shards
+        self._evicted = [0] * shards
+
+    def _index(self, secret: int) -> int:
+        return secret % len(self._shards)
+
+    def _entry(self, index: int, secret: int, now: float) -> Optional[list]:
+        """Returns the [session, deadline] entry for `secret`, removing it
+        if it has expired. Call with the shard's lock held."""
+        shard = self._shards[index]
+        entry = shard.get(secret)
+        if entry is not None and entry[1] is not None and entry[1] <= now:
+            del shard[secret]
+            self._expired[index] += 1
+            return None
+        return entry
+
+    def _expire_oldest(self, index: int, now: float):
+        """Removes expired sessions from the least recently used end of a
+        shard. Call with the shard's lock held."""
+        shard = self._shards[index]
+        while shard:
+            secret, (_, deadline) = next(iter(shard.items()))
+            if deadline is None or deadline > now:
+                return
+            del shard[secret]
+            self._expired[index] += 1
+
+    def _deadline(self, ttl: Optional[float], now: float) -> Optional[float]:
+        ttl = self.ttl if ttl is None else ttl
+        return None if ttl is None else now + ttl
+
+    def lock(self, secret: int) -> threading.RLock:
+        """Returns the re-entrant lock guarding the session for `secret`."""
+        return self._locks[self._index(secret)]
+
+    def _random_secret(self) -> int:
+        while True:
+            secret = self._node_prefix | secrets.randbits(32 - self.node_bits)
+            # 0 is reserved for stage A packets
+            if secret != 0:
+                return secret
+
+    def new_secret(self) -> int:
+        """Returns a new unique, cryptographically secure secret without
+        storing anything under it. Store the session with add(secret=...)."""
+        while True:
+            secret = self._random_secret()
+            if secret not in self:
+                return secret
+
+    def add(self, session: Any, ttl: float = None, secret: int = None) -> int:
+        """
+        Stores `session` under a new unique, cryptographically secure secret.
+
+        :param ttl: Seconds until the session expires. Defaults to the
+                    store's ttl.
+        :param secret: Store the session under this secret instead,
+                    replacing any session stored under it.
+        :return: The session's secret.
+        """
+        while True:
+            key = self._random_secret() if secret is None else secret
+            index = self._index(key)
+            with self._locks[index]:
+                now = time.monotonic()
+                if self._entry(index, key, now) is not None:
+                    if secret is None:
+                        continue
+                    del self._shards[index][key]
+                shard = self._shards[index]
+                self._expire_oldest(index, now)
+                if self._capacity is not None:
+                    while len(shard) >= self._capacity:
+                        shard.popitem(last=False)
+                        self._evicted[index] += 1
+                shard[key] = [session, self._deadline(ttl, now)]
+                return key
+
+    def touch(self, secret: int, ttl: float = None) -> bool:
+        """
+        Marks the session for `secret` as recently used and restarts its
+        time to live.
+
+        :param ttl: Seconds until the session expires. Defaults to the
+                    store's ttl.
+        :return: False if there is no live session for `secret`.
+        """
+        index = self._index(secret)
+        with self._locks[index]:
+            now = time.monotonic()
+            entry = self._entry(index, secret, now)
+            if entry is None:
+                return False
+            entry[1] = self._deadline(ttl, now)
+            self._shards[index].move_to_end(secret)
+            return True
+
+    def get(self, secret: int, default: Any = None) -> Any:
+        index = self._index(secret)
+        with self._locks[index]:
+            entry = self._entry(index, secret, time.monotonic())
+            if entry is None:
+                return default
+            self._shards[index].move_to_end(secret)
+            return entry[0]
+
+    def pop(self, secret: int, default: Any = _MISSING) -> Any:
+        index = self._index(secret)
+        with self._locks[index]:
+            entry = self._entry(index, secret, time.monotonic())
+            if entry is not None:
+                del self._shards[index][secret]
+                return entry[0]
+        if default is _MISSING:
+            raise KeyError(secret)
+        return default
+
+    def purge(self) -> int:
+        """
+        Removes every expired session.
+
+        :return: Number of sessions removed.
+        """
+        removed = 0
+        for index, shard in enumerate(self._shards):
+            with self._locks[index]:
+                now = time.monotonic()
+                expired = [secret for secret, (_, deadline) in shard.items()
+                           if deadline is not None and deadline <= now]
+                for secret in expired:
+                    del shard[secret]
+                self._expired[index] += len(expired)
+                removed += len(expired)
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the number of live sessions and the total number of
+        sessions that have expired or been evicted to make room.
+        """
+        self.purge()
+        return {
+            'live': len(self),
+            'expired': sum(self._expired),
+            'evicted': sum(self._evicted)
+        }
+
+    def __getitem__(self, secret: int) -> Any:
+        session = self.get(secret, _MISSING)
+        if session is _MISSING:
+            raise KeyError(secret)
+        return session
+
+    def __setitem__(self, secret: int, session: Any):
+        index = self._index(secret)
+        with self._locks[index]:
+            self._shards[index][secret] = [session, self._deadline(None, time.monotonic())]
+            self._shards[index].move_to_end(secret)
+
+    def __delitem__(self, secret: int):
+        self.pop(secret)
+
+    def __contains__(self, secret: int) -> bool:
+        index = self._index(secret)
+        with self._locks[index]:
+            return self._entry(index, secret, time.monotonic()) is not None
+
+    def __len__(self):
+        """Number of stored sessions, including expired sessions that have
+        not been removed yet."""
+        return sum(len(shard) for shard in self._shards)
+
+    def __iter__(self) -> Iterator[int]:
+        for index, shard in enumerate(self._shards):
+            with self._locks[index]:
+                keys = list(shard)
+            yield from keys
@@ -0,0 +1,153 @@
+import itertools
+import secrets
+import hashlib
+import struct
+import hmac
+import time
+
+from typing import Optional, Tuple
+from cse461.project1.sessions import Session, Stage
+from cse461.project1.consts import SESSION_TTL
+
+__all__ = ['SessionTokens']
+
+# Stage, epoch and nonce that a token's tag authenticates
+_TAGGED = struct.Struct('!BQI')
+
+
+class SessionTokens:
+    """Issues and verifies stateless session secrets.
+
+    A token is a 32 bit secret made of the issuing server's node ID (see
+    SessionStore), the low bits of the epoch it was issued in, a nonce and
+    a truncated HMAC-SHA256 tag over the stage, full epoch and nonce:
+        | node ID (node_bits) | epoch (2) | nonce (18 - node_bits) | tag (12) |
+    A session's parameters (num_packets, packet_len, ack_fails, num2,
+    len2, char) are derived from a second HMAC of the token. Any server
+    with the same key can therefore check that a secret was issued for
+    a stage, and recover its session, without any shared state.
+
+    Epochs are `lifetime / 2` seconds of wall clock time, and tokens are
+    accepted until two epochs after the one they were issued in, so they
+    live for between `lifetime` and 1.5 * `lifetime` seconds. Servers
+    sharing a key should have synchronized clocks.
+
+    The protocol's secrets are only 32 bits, so tags are short: a guessed
+    secret passes verification with probability 1/4096. Nonces come from
+    a counter, so a server never issues the same token twice within its
+    lifetime unless it issues more than 2^(18 - node_bits) tokens per
+    lifetime.
+
+    Usage:
+    >>> tokens = SessionTokens(key=b'shared by every server')
+    >>> secret = tokens.issue(Stage.A)
+    >>> session = tokens.session(secret, Stage.A)
+    >>> 5 <= session.num_packets <= 10
+    True
+    """
+    EPOCH_BITS = 2
+    NONCE_BITS = 18
+    TAG_BITS = 12
+    # Number of epochs after the one a token was issued in that it is accepted
+    MAX_AGE = 2
+
+    def __init__(self, key: bytes = None, lifetime: float = SESSION_TTL,
+                 node_id: int = 0, node_bits: int = 0):
+        """
+        :param key: Secret key shared by every server that verifies the
+                    tokens. Defaults to a random key.
+        :param lifetime: Minimum number of seconds a token is accepted for.
+        :param node_id: ID of the server issuing tokens, stored in their
+                    top `node_bits` bits.
+        :param node_bits: Number of bits of each token holding node_id.
+                    Taken from the nonce.
+        """
+        if not 0 <= node_id < 1 << node_bits or node_bits >= self.NONCE_BITS:
+            raise ValueError(f"Node ID {node_id} does not fit in {node_bits} bits")
+        self.key = key if key is not None else secrets.token_bytes(32)
+        self.epoch_length = lifetime / 2
+        self.nonce_bits = self.NONCE_BITS - node_bits
+        # Node IDs are part of the nonce, so they are authenticated too
+        self.node_nonce = node_id << self.nonce_bits
+        # Start at a random nonce so that restarted servers don't reissue
+        # the same tokens, and step by a random odd number (which visits
+        # every nonce before repeating) so that consecutive tokens don't
+        # look alike.
+        self.nonces = itertools.count(secrets.randbits(self.nonce_bits),
+                                      secrets.randbits(self.nonce_bits) | 1)
+
+    @property
+    def max_lifetime(self) -> float:
+        """Longest number of seconds a token is accepted for after it is
+        issued: until the end of the MAX_AGE-th epoch after its own."""
+        return (self.MAX_AGE + 1) * self.epoch_length
+
+    def epoch(self, now: float = None) -> int:
+        return int((time.time() if now is None else now) // self.epoch_length)
+
+    def tag(self, stage: Stage, epoch: int, nonce: int) -> int:
+        digest = hmac.new(self.key, _TAGGED.pack(stage, epoch, nonce), hashlib.sha256).digest()
+        return int.from_bytes(digest[:2], 'big') & ((1 << self.TAG_BITS) - 1)
+
+    def issue(self, stage: Stage, now: float = None) -> int:
+        """Returns a new token for a session that finished `stage`."""
+        epoch = self.epoch(now)
+        nonce = self.node_nonce | next(self.nonces) & ((1 << self.nonce_bits) - 1)
+        return self.pack(epoch, nonce) | self.tag(stage, epoch, nonce)
+
+    def pack(self, epoch: int, nonce: int) -> int:
+        """Lays out a token, without its tag."""
+        node_id = nonce >> self.nonce_bits
+        nonce &= (1 << self.nonce_bits) - 1
+        epoch_bits = epoch & ((1 << self.EPOCH_BITS) - 1)
+        return ((node_id << self.EPOCH_BITS | epoch_bits) << self.nonce_bits
+                | nonce) << self.TAG_BITS
+
+    def unpack(self, token: int) -> Tuple[int, int, int]:
+        """Returns a token's low epoch bits, nonce (including the node ID)
+        and tag."""
+        tag = token & ((1 << self.TAG_BITS) - 1)
+        token >>= self.TAG_BITS
+        nonce = token & ((1 << self.nonce_bits) - 1)
+        token >>= self.nonce_bits
+        epoch_bits = token & ((1 << self.EPOCH_BITS) - 1)
+        node_id = token >> self.EPOCH_BITS
+        return epoch_bits, node_id << self.nonce_bits | nonce, tag
+
+    def verify(self, token: int, stage: Stage, now: float = None) -> bool:
+        """Returns True if `token` was issued with this key for a session
+        that finished `stage`, and has not expired."""
+        epoch = self.epoch(now)
+        epoch_bits, nonce, tag = self.unpack(token)
+        # The most recent epoch with the token's low bits
+        issued = epoch - ((epoch - epoch_bits) & ((1 << self.EPOCH_BITS) - 1))
+        if epoch - issued > self.MAX_AGE:
+            return False
+        return hmac.compare_digest(self.tag(stage, issued, nonce).to_bytes(2, 'big'),
+                                   tag.to_bytes(2, 'big'))
+
+    def session(self, token: int, stage: Stage, now: float = None) -> Optional[Session]:
+        """
+        Recovers the session for `token`.
+
+        :return: The session's parameters, or None if `token` does not
+                 verify (see verify()). The session's start is unknown, so
+                 its `started` is None.
+        """
+        if not self.verify(token, stage, now):
+            return None
+        digest = hmac.new(self.key, b'session' + token.to_bytes(4, 'big'),
+                          hashlib.sha256).digest()
+        num_packets = 5 + digest[0] % 6
+        return Session(
+            stage,
+            started=None,
+            num_packets=num_packets,
+            # For stage B, don't acknowledge one packet
+            ack_fails=1 << digest[1] % num_packets,
+            # Guarantee that packet_len and len2 are multiples of 4.
+            packet_len=(1 + digest[2] % 10) * 4,
+            num2=1 + digest[3] % 10,
+            len2=(1 + digest[4] % 10) * 4,
+            char=digest[5:6]
+        )
@@ -0,0 +1,135 @@
+from typing import List
+
+from cse461.project1.rtt import RttEstimator
+from cse461.project1.consts import MAX_RETRIES
+
+__all__ = ['SendWindow']
+
+
+class SendWindow:
+    """Sliding window over the packet IDs 0 to `count` - 1 of stage B,
+    keeping up to `size` packets in flight. Decides which packets to
+    send, but doesn't send or receive anything itself.
+
+    The server acknowledges every packet it doesn't drop, but only counts
+    a packet towards finishing stage B if every earlier packet was counted
+    first. An ack for a packet past the first unacknowledged one (`base`)
+    therefore doesn't mean it was counted, and means that `base` was
+    probably lost, since the server acks packets in the order it receives
+    them. `base` and every packet in flight after it are then sent again
+    in order (go-back-N), without waiting for a timeout. They are also
+    sent again if `base` isn't acknowledged within the RTO of `rtt`,
+    which backs off on every timeout. Acks of packets that were sent once
+    are RTT samples for `rtt`.
+
+    Usage:
+    >>> window = SendWindow(count=10, size=4, rtt=RttEstimator())
+    >>> while not window.done:
+    ...     for packet_id in window.to_send(time.monotonic()):
+    ...         sock.sendto(packets[packet_id], address)
+    ...     sock.settimeout(max(window.deadline - time.monotonic(), 0))
+    ...     window.ack(receive_ack(sock), time.monotonic())
+    """
+    __slots__ = ('count', 'size', 'rtt', 'retries', 'base', 'next_id', 'sent_at',
+                 'resent', 'resend', 'fast_resent', 'timeouts', 'retransmissions')
+
+    def __init__(self, count: int, size: int = 1, rtt: RttEstimator = None,
+                 retries: int = MAX_RETRIES):
+        """
+        :param count: Number of packets to send.
+        :param size: Maximum number of packets in flight. 1 to send each
+                    packet once the previous one is acknowledged.
+        :param rtt: Estimates how long to wait for an ack before sending a
+                    packet again. Defaults to a new RttEstimator.
+        :param retries: Number of times in a row `base` may time out
+                    before giving up. Defaults to consts.MAX_RETRIES.
+        """
+        if size < 1:
+            raise ValueError(f"Window size must be at least 1, got {size}")
+        self.count = count
+        self.size = size
+        self.rtt = rtt if rtt is not None else RttEstimator()
+        self.retries = retries
+        # Packets before base are acknowledged, and packets from base up
+        # to next_id are in flight
+        self.base = 0
+        self.next_id = 0
+        # When each packet in flight was last sent
+        self.sent_at = {}
+        # Packets in flight that were sent more than once, whose acks
+        # aren't RTT samples
+        self.resent = set()
+        # Set to send every packet in flight again
+        self.resend = False
+        # Last base that was sent again, after which later acks only
+        # trigger a timeout
+        self.fast_resent = None
+        # Number of times in a row base timed out
+        self.timeouts = 0
+        # Number of packets that were sent more than once
+        self.retransmissions = 0
+
+    @property
+    def done(self) -> bool:
+        return self.base >= self.count
+
+    @property
+    def deadline(self) -> float:
+        """Time (in time.monotonic() seconds) when `base` times out. Only
+        valid after to_send()."""
+        return self.sent_at[self.base] + self.rtt.rto
+
+    def to_send(self, now: float) -> List[int]:
+        """
+        Returns the IDs of the packets to send now, in order.
+
+        :raises TimeoutError: If `base` timed out more than `retries` times
+                 in a row.
+        """
+        if self.done:
+            return []
+        timed_out = self.base in self.sent_at and now >= self.deadline
+        if timed_out:
+            self.timeouts += 1
+            if self.timeouts > self.retries:
+                raise TimeoutError(f"Packet {self.base} was not acknowledged after "
+                                   f"{self.retries} retries")
+            self.rtt.backoff()
+        if self.resend or timed_out:
+            self.resend = False
+            # Later acks from before this are stale
+            self.fast_resent = self.base
+            packet_ids = list(range(self.base, self.next_id))
+            self.resent.update(packet_ids)
+            self.retransmissions += len(packet_ids)
+        else:
+            packet_ids = []
+        end = min(self.base + self.size, self.count)
+        packet_ids.extend(range(self.next_id, end))
+        self.next_id = max(self.next_id, end)
+        for packet_id in packet_ids:
+            self.sent_at[packet_id] = now
+        return packet_ids
+
+    def ack(self, packet_id: int, now: float) -> bool:
+        """
+        Records an ack received at `now`.
+
+        :return: True if the ack moved the window on, False if it was a
+                 duplicate or out of order.
+        """
+        if packet_id == self.base and not self.done:
+            sent_at = self.sent_at.pop(packet_id)
+            if packet_id in self.resent:
+                # Karn's rule: the ack may be for any of its copies
+                self.resent.discard(packet_id)
+            else:
+                self.rtt.sample(now - sent_at)
+            self.base += 1
+            self.timeouts = 0
+            return True
+        if self.base < packet_id < self.next_id and self.fast_resent != self.base:
+            # The packets before this one were probably lost
+            self.fast_resent = self.base
+            self.resend = True
+        return False
@@ -0,0 +1,188 @@
+import collections
+import itertools
+import threading
+import logging
+import queue
+
+from typing import Callable, Dict
+
+__all__ = ['WorkerPool']
+logger = logging.getLogger(__name__)
+
+
+class WorkerPool:
+    """Fixed-size pool of threads running tasks from a bounded queue.
+
+    Threads are started as tasks arrive, up to `size`, and then reused.
+    At most `queue_size` tasks wait for a thread; what happens to tasks
+    submitted while the queue is full depends on the pool's policy:
+        DISCARD:     the task is dropped and submit() returns False.
+        CALLER_RUNS: the task runs on the submitting thread, which slows
+                     the submitter down until the pool catches up.
+        ABORT:       submit() raises queue.Full.
+    stats() reports the queue depth (current and maximum) and how many
+    tasks were submitted, completed and rejected.
+
+    Usage:
+    >>> pool = WorkerPool(size=8, queue_size=100)
+    >>> pool.submit(print, "hello")
+    True
+    >>> pool.join()
+    >>> pool.shutdown()
+    """
+    DISCARD = 'discard'
+    CALLER_RUNS = 'caller_runs'
+    ABORT = 'abort'
+    POLICIES = (DISCARD, CALLER_RUNS, ABORT)
+
+    def __init__(self, size: int = 32, queue_size: int = 1024, policy: str = DISCARD,
+                 name: str = "Worker"):
+        """
+        Constructor.
+
+        :param size: Maximum number of threads.
+        :param queue_size: Maximum number of tasks waiting for a thread.
+        :param policy: What to do with tasks submitted while the queue is
+                    full: WorkerPool.DISCARD, CALLER_RUNS or ABORT.
+        :param name: Prefix of the threads' names.
+        """
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown policy {policy!r}, expected one of {self.POLICIES}")
+        self.size = size
+        self.queue_size = queue_size
+        self.policy = policy
+        self.name = name
+        self.tasks = collections.deque()
+        self.threads = set()
+        self.thread_ids = itertools.count()
+        self.lock = threading.Lock()
+        # Notified when a task is queued or the pool shuts down
+        self.task_available = threading.Condition(self.lock)
+        # Notified when a task finishes or a thread exits (see also notify())
+        self.task_done = threading.Condition(self.lock)
+        self.closed = False
+        # Threads waiting for a task, and tasks that are running
+        self.idle = 0
+        self.active = 0
+        self.max_queued = 0
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def submit(self, target: Callable, *args) -> bool:
+        """
+        Runs `target(*args)` on a pool thread.
+
+        :return: False if the task was discarded because the queue was full.
+        :raises queue.Full: If the queue is full and the policy is ABORT.
+        :raises RuntimeError: If the pool has been shut down.
+        """
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("Cannot submit tasks to a pool that has been shut down")
+            # Idle threads are about to take a task off the queue, and
+            # there may be room for more threads
+            if (len(self.tasks) >= self.idle + self.queue_size
+                    and len(self.threads) >= self.size):
+                self.rejected += 1
+                if self.policy == self.DISCARD:
+                    return False
+                if self.policy == self.ABORT:
+                    raise queue.Full(f"{self.name} pool queue is full "
+                                     f"({len(self.tasks)} tasks waiting)")
+            else:
+                self.tasks.append((target, args))
+                self.submitted += 1
+                self.max_queued = max(self.max_queued, len(self.tasks))
+                if len(self.tasks) > self.idle and len(self.threads) < self.size:
+                    thread = threading.Thread(target=self.work,
+                                              name=f"{self.name}-{next(self.thread_ids)}")
+                    self.threads.add(thread)
+                    self.idle += 1
+                    thread.start()
+                else:
+                    self.task_available.notify()
+                return True
+        # CALLER_RUNS
+        target(*args)
+        return True
+
+    def work(self):
+        # Counted as idle by submit() from the moment it is started
+        while True:
+            with self.lock:
+                while not self.tasks and not self.closed:
+                    self.task_available.wait()
+                self.idle -= 1
+                if not self.tasks:
+                    # Shut down and no work left
+                    self.threads.discard(threading.current_thread())
+                    self.task_done.notify_all()
+                    return
+                target, args = self.tasks.popleft()
+                self.active += 1
+            try:
+                target(*args)
+            except Exception:
+                logger.exception(f"Task {target!r} raised an exception.")
+            finally:
+                with self.lock:
+                    self.active -= 1
+                    self.completed += 1
+                    self.idle += 1
+                    self.task_done.notify_all()
+
+    def notify(self):
+        """Wakes up threads in wait_for(), e.g. after some state that
+        their predicate depends on changed."""
+        with self.lock:
+            self.task_done.notify_all()
+
+    def wait_for(self, predicate: Callable[[], bool], timeout: float = None) -> bool:
+        """
+        Waits until `predicate()` is true, checking it whenever a task
+        finishes or notify() is called.
+
+        :return: The last result of `predicate()`.
+        """
+        with self.lock:
+            return self.task_done.wait_for(predicate, timeout)
+
+    def join(self, timeout: float = None) -> bool:
+        """
+        Waits until no tasks are queued or running.
+
+        :return: False if tasks were still queued or running after `timeout` seconds.
+        """
+        return self.wait_for(lambda: not self.tasks and not self.active, timeout)
+
+    def shutdown(self, timeout: float = None) -> bool:
+        """
+        Stops accepting tasks and waits for the threads to finish the
+        queued tasks and exit.
+
+        :return: False if some threads were still running after `timeout` seconds.
+        """
+        with self.lock:
+            self.closed = True
+            self.task_available.notify_all()
+        return self.wait_for(lambda: not self.threads, timeout)
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the number of threads, running and queued tasks, the
+        maximum number of queued tasks so far, and the number of tasks
+        that were submitted, completed and rejected."""
+        with self.lock:
+            return {
+                'threads': len(self.threads),
+                'active': self.active,
+                'queued': len(self.tasks),
+                'max_queued': self.max_queued,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'rejected': self.rejected
+            }
+
+    def __len__(self):
+        """Number of tasks that are queued or running."""
+        return len(self.tasks) + self.active
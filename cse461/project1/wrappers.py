@@ -1,8 +1,12 @@
+import contextlib
+import threading
+import signal
+
 from typing import Callable, Union
 from threading import Lock, RLock
 from functools import wraps
 
-__all__ = ['synchronized']
+__all__ = ['synchronized', 'Stoppable']
 
 
 def synchronized(method: Callable, lock: Union[Lock, RLock]):
@@ -20,3 +24,32 @@ def synchronized(method: Callable, lock: Union[Lock, RLock]):
             return method(*args, **kwargs)
 
     return wrapped
+
+
+class Stoppable:
+    """
+    Mixin for servers whose run() blocks until request_stop() is called
+    or SIGINT or SIGTERM is received. Subclasses set `stop_requested` to
+    a threading.Event and wait on it within `with self.stop_on_signals():`.
+    """
+    stop_requested: threading.Event
+
+    def request_stop(self, *args):
+        """Makes run() return. Safe to call from any thread, and usable as
+        a signal handler."""
+        self.stop_requested.set()
+
+    @contextlib.contextmanager
+    def stop_on_signals(self):
+        """Calls request_stop() on SIGINT and SIGTERM until the block
+        exits, then restores the previous handlers. Does nothing off the
+        main thread, where signal handlers can't be installed."""
+        handlers = {}
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                handlers[signum] = signal.signal(signum, self.request_stop)
+        try:
+            yield
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
@@ -1,9 +1,11 @@
 import logging
-from .proxy import Proxy
-from .http import *
 
-# Log all messages as white text
+# Log all messages as white text. Configured before importing .proxy,
+# which imports cse461.project1 and its own logging configuration.
 WHITE = "\033[1m"
 logging.basicConfig(level=logging.INFO,
                     format=WHITE + "%(asctime)s - %(message)s",
                     datefmt='%Y-%m-%d %H:%M:%S')
+
+from .proxy import Proxy
+from .http import *
@@ -1,4 +1,5 @@
 from cse461.project3.http import HTTPRequest, HTTPResponse
+from cse461.project1.wrappers import Stoppable
 import threading
 import socket
 import logging
@@ -9,11 +10,16 @@ CHUNK_SIZE = 4096
 TIMEOUT = 10
 
 
-class Proxy:
+class Proxy(Stoppable):
     def __init__(self, host='127.0.0.1', port=8888):
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.socket.bind((host, port))
         self.socket.listen()
+        # Set to make run() return (e.g. on SIGINT or SIGTERM)
+        self.stop_requested = threading.Event()
+        # Threads handling clients, and a condition notified when one finishes
+        self.clients = set()
+        self.condition = threading.Condition()
         logger.info(f'Proxy listening on {host}:{port}')
 
     def __enter__(self):
@@ -107,19 +113,47 @@ class Proxy:
             else:
                 self.handle_request(client, remote, req, extra)
 
+    def _handle_client(self, client: socket.socket):
+        try:
+            self.handle_client(client)
+        finally:
+            with self.condition:
+                self.clients.discard(threading.current_thread())
+                self.condition.notify_all()
+
     def _run(self):
         while True:
-            client, addr = self.socket.accept()
-            threading.Thread(target=self.handle_client, args=(client,), daemon=True).start()
+            try:
+                client, addr = self.socket.accept()
+            except OSError:
+                # run() shut down the listening socket
+                return
+            t = threading.Thread(target=self._handle_client, args=(client,), daemon=True)
+            with self.condition:
+                self.clients.add(t)
+            t.start()
 
-    def run(self):
-        try:
+    def run(self, drain_timeout: float = TIMEOUT):
+        """Accepts clients until SIGINT or SIGTERM is received or
+        request_stop() is called, then stops accepting clients and waits
+        up to `drain_timeout` seconds for connected clients to finish."""
+        with self.stop_on_signals():
             t = threading.Thread(target=self._run, daemon=True)
             t.start()
-            while True:
-                pass
-        except KeyboardInterrupt:
-            logger.info("Received stop request. Exiting.")
+            try:
+                self.stop_requested.wait()
+                logger.info("Received stop request. Exiting.")
+            finally:
+                try:
+                    # Wakes up _run() from accept()
+                    self.socket.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                t.join()
+                with self.condition:
+                    if not self.condition.wait_for(lambda: not self.clients, drain_timeout):
+                        logger.info(f"{len(self.clients)} clients did not finish "
+                                    f"within {drain_timeout} seconds.")
 
 
 def main():
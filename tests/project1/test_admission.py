@@ -0,0 +1,127 @@
+import socket
+import time
+
+from cse461.project1 import AdmissionControl, Client, Packet, Server, TokenBucket
+
+PORT = 12243
+HELLO = Packet(payload=b'hello world\0', p_secret=0, step=1, student_id=461).bytes
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=10, burst=2)
+    assert bucket.take(now=0) and bucket.take(now=0)
+    assert not bucket.take(now=0)
+    # One token every 0.1 seconds, up to `burst`
+    assert bucket.take(now=0.1)
+    assert not bucket.take(now=0.1)
+    assert bucket.take(now=10) and bucket.take(now=10)
+    assert not bucket.take(now=10)
+
+
+def test_admission_limits():
+    admission = AdmissionControl(max_sessions=3, max_per_ip=2, lease=10)
+    assert admission.admit(1, '10.0.0.1', now=0) is None
+    assert admission.admit(2, '10.0.0.1', now=0) is None
+    assert admission.admit(3, '10.0.0.1', now=0) == AdmissionControl.IP
+    assert admission.admit(4, '10.0.0.2', now=0) is None
+    assert admission.admit(5, '10.0.0.3', now=0) == AdmissionControl.SESSIONS
+
+    admission.release(1)
+    # Releasing the same session again doesn't free another place
+    admission.release(1)
+    assert admission.admit(6, '10.0.0.3', now=0) is None
+    assert admission.admit(7, '10.0.0.3', now=0) == AdmissionControl.SESSIONS
+    # Neither do secrets that hold no lease
+    admission.release(3)
+    assert admission.admit(8, '10.0.0.1', now=0) == AdmissionControl.SESSIONS
+    # Leases of sessions that were never released run out
+    assert admission.admit(9, '10.0.0.1', now=10) is None
+    assert admission.stats()['active'] <= 1
+
+
+def test_admission_transfer():
+    admission = AdmissionControl(max_sessions=1, lease=10)
+    assert admission.admit(1, '10.0.0.1', now=0) is None
+    admission.transfer(1, 2)
+    # The lease moved to the session's new secret
+    admission.release(1)
+    assert admission.admit(3, '10.0.0.1', now=0) == AdmissionControl.SESSIONS
+    # A replayed secret can't take the lease again
+    admission.transfer(1, 4)
+    admission.release(4)
+    assert admission.admit(3, '10.0.0.1', now=0) == AdmissionControl.SESSIONS
+    admission.release(2)
+    assert admission.admit(3, '10.0.0.1', now=0) is None
+
+
+def test_admission_rate():
+    admission = AdmissionControl(rate=1, burst=1)
+    assert admission.admit(1, '10.0.0.1', now=0) is None
+    assert admission.admit(2, '10.0.0.2', now=0) == AdmissionControl.RATE
+    assert admission.admit(3, '10.0.0.2', now=1) is None
+
+
+def hello(sock: socket.socket) -> bool:
+    """Returns True if the server answered a hello."""
+    sock.sendto(HELLO, ('localhost', PORT))
+    try:
+        sock.recv(1024)
+        return True
+    except socket.timeout:
+        return False
+
+
+def test_server_sheds_hellos_per_ip():
+    server = Server(udp_pool_size=2, session_limit_per_ip=1)
+    server.start(PORT)
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(0.5)
+            assert hello(sock)
+            assert not hello(sock)
+            stats = server.stats()
+            assert stats['started'] == 1
+            assert stats['shed'] == stats['shed_ip'] == 1
+            # The first session is still in progress
+            assert len(server.secrets) == 1
+    finally:
+        server.stop()
+
+
+def test_server_admits_after_session_finishes():
+    server = Server(session_limit=1)
+    server.start(PORT)
+    try:
+        for _ in range(2):
+            with Client() as client:
+                client.start(PORT)
+        stats = server.stats()
+        assert stats['completed'] == 2
+        assert stats['shed'] == 0
+        assert stats['admitted_active'] == 0
+    finally:
+        server.stop()
+
+
+def test_shed_hellos_keep_admitted_sessions():
+    # One session per shard, so any hello that was stored would evict others
+    server = Server(udp_pool_size=1, max_sessions=64, session_limit=1)
+    server.start(PORT)
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(0.5)
+            assert hello(sock)
+            secret = next(iter(server.secrets))
+            for sent in range(50, 401, 50):
+                # In bursts small enough not to overflow the worker queue
+                for _ in range(50):
+                    sock.sendto(HELLO, ('localhost', PORT))
+                deadline = time.monotonic() + 5
+                while server.stats()['shed'] < sent and time.monotonic() < deadline:
+                    time.sleep(0.01)
+        stats = server.stats()
+        assert stats['shed'] == 400
+        assert stats['sessions_evicted'] == 0
+        assert secret in server.secrets
+    finally:
+        server.stop()
@@ -0,0 +1,42 @@
+from functools import partial
+import asyncio
+import pytest
+
+from cse461.project1 import AsyncClient, AsyncServer, Server
+
+PORT = 12244
+SERVERS = {
+    'Server': Server,
+    'AsyncServer': AsyncServer,
+    'Server-udp-pool': partial(Server, udp_pool_size=2, tcp_pool_size=2),
+}
+
+
+@pytest.fixture(params=list(SERVERS))
+def server(request):
+    server = SERVERS[request.param]()
+    server.start(PORT)
+    yield server
+    server.stop()
+
+
+def test_single(server):
+    async def run():
+        async with AsyncClient() as client:
+            return await client.start(PORT)
+
+    secrets = asyncio.run(run())
+    assert set(secrets) == {'a', 'b', 'c', 'd'}
+    assert all(isinstance(i, int) and i > 0 for i in secrets.values())
+
+
+def test_run_many(server):
+    results = asyncio.run(AsyncClient.run_many(200, port=PORT, concurrency=50, timeout=20))
+    assert len(results) == 200
+    assert all(isinstance(result, dict) and len(result) == 4 for result in results)
+
+
+def test_run_many_reports_failures():
+    # Nothing is listening, so every session times out waiting for stage A
+    results = asyncio.run(AsyncClient.run_many(3, port=PORT, concurrency=2, timeout=0.2))
+    assert all(isinstance(result, asyncio.TimeoutError) for result in results)
@@ -0,0 +1,77 @@
+import socket
+import time
+import pytest
+
+from cse461.project1 import AsyncServer, Client, Packet
+from cse461.project1.packet import STAGE_A_RESPONSE, STAGE_B_RESPONSE
+from cse461.project1.consts import TIMEOUT
+
+PORT = 12246
+HELLO = Packet(payload=b'hello world\0', p_secret=0, step=1, student_id=461).bytes
+
+
+@pytest.fixture
+def server():
+    server = AsyncServer(ip_addr='localhost')
+    server.start(PORT)
+    yield server
+    server.stop()
+
+
+def wait_for(condition, timeout: float = 1) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def receive_all(sock: socket.socket):
+    """Returns the packets received until `sock` times out."""
+    packets = []
+    while True:
+        try:
+            packets.append(Packet.from_raw(sock.recv(1024)))
+        except socket.timeout:
+            return packets
+
+
+def test_stage_c_starts_once(server):
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(0.5)
+        sock.sendto(HELLO, ('localhost', PORT))
+        num, length, udp_port, secret_a = STAGE_A_RESPONSE.unpack(
+            Packet.from_raw(sock.recv(1024)).payload)
+        packets = [Packet(payload=packet_id.to_bytes(4, 'big') + b'\0' * length,
+                          p_secret=secret_a, step=1, student_id=461).bytes
+                   for packet_id in range(num)]
+        # One packet isn't acknowledged the first time
+        for packet in packets:
+            sock.sendto(packet, ('localhost', udp_port))
+        for packet in packets:
+            sock.sendto(packet, ('localhost', udp_port))
+        # Copies of the last packet that arrive after stage B finished
+        for _ in range(3):
+            sock.sendto(packets[-1], ('localhost', udp_port))
+        sock.settimeout(0.2)
+        responses = [packet for packet in receive_all(sock)
+                     if packet.payload_len == STAGE_B_RESPONSE.size]
+    assert len(responses) == 1
+    assert len(server.tcp_servers) == 1
+
+
+def test_secrets_removed(server):
+    with Client(student_id=461, ip_addr='localhost') as client:
+        client.start(PORT)
+    assert wait_for(lambda: not server.secrets)
+
+
+def test_secrets_removed_on_timeout(server):
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(0.5)
+        sock.sendto(HELLO, ('localhost', PORT))
+        sock.recv(1024)
+    assert len(server.secrets) == 1
+    # The session's UDP server times out without receiving stage B packets
+    assert wait_for(lambda: not server.secrets, timeout=TIMEOUT + 1)
@@ -0,0 +1,75 @@
+import threading
+import random
+import pytest
+
+from cse461.project1 import Balancer, Client, HashRing, Server
+
+PORT = 12239
+NODE_BITS = 2
+
+
+def test_hash_ring_moves_few_keys():
+    ring = HashRing(range(4))
+    keys = [f"10.0.0.{i % 256}:{i}".encode() for i in range(10_000)]
+    before = {key: ring.lookup(key) for key in keys}
+    counts = [list(before.values()).count(node) for node in range(4)]
+    assert min(counts) > 10_000 / 4 / 2
+
+    ring.remove(3)
+    assert len(ring) == 3
+    moved = [key for key in keys if ring.lookup(key) != before[key]]
+    # Only the removed node's keys move
+    assert all(before[key] == 3 for key in moved)
+
+
+@pytest.fixture(params=[False, True], ids=['stateful', 'stateless'])
+def nodes(request):
+    servers = [Server(node_id=i, node_bits=NODE_BITS, balancer_port=PORT,
+                      stateless=request.param, token_key=b'key')
+               for i in range(3)]
+    for i, server in enumerate(servers):
+        server.start(PORT + 1 + i)
+    balancer = Balancer([('localhost', PORT + 1 + i) for i in range(3)], node_bits=NODE_BITS)
+    balancer.start(PORT)
+    yield servers, balancer
+    balancer.stop()
+    for server in servers:
+        server.stop()
+
+
+def test_sessions_through_balancer(nodes):
+    servers, balancer = nodes
+    results = []
+
+    def run_client():
+        with Client(student_id=random.randint(100, 999)) as client:
+            results.append(client.start(PORT))
+
+    threads = [threading.Thread(target=run_client) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 12
+    for secrets in results:
+        # Each secret belongs to the node that issued stage A
+        node = secrets['a'] >> (32 - NODE_BITS)
+        assert secrets['b'] >> (32 - NODE_BITS) == node
+    started = [server.stats()['started'] for server in servers]
+    assert sum(started) == sum(server.stats()['completed'] for server in servers) == 12
+    # Hellos were spread over more than one node
+    assert sum(1 for n in started if n) > 1
+
+    stats = balancer.stats()
+    assert stats['dropped'] == 0
+    assert stats['forwarded'] == sum(stats[f"node_{i}"] for i in range(3))
+    assert stats['replies'] > 0
+
+
+def test_nodes_share_balancer_address():
+    # Clients would connect to the node's TCP port at the balancer's address
+    node = Server(ip_addr='127.0.0.2', node_id=0, node_bits=NODE_BITS, balancer_port=PORT)
+    with pytest.raises(ValueError):
+        Balancer([(node.ip_addr, PORT + 1)], ip_addr='127.0.0.1', node_bits=NODE_BITS)
+    assert Balancer([('localhost', PORT + 1)], ip_addr='127.0.0.1').backends
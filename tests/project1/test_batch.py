@@ -0,0 +1,80 @@
+import pytest
+
+from cse461.project1 import Packet, PacketBatch
+from cse461.project1 import batch as batch_module
+
+
+@pytest.fixture(params=['numpy', 'struct'], autouse=True)
+def backend(request, monkeypatch):
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(batch_module, 'np', None)
+    return request.param
+
+
+def make_packet(payload: bytes, p_secret: int = 42) -> Packet:
+    return Packet(payload=payload, p_secret=p_secret, step=1, student_id=592)
+
+
+def test_repeat():
+    packet = make_packet(b'\x07' * 6)
+    batch = PacketBatch.repeat(packet, 5)
+
+    assert len(batch) == 5
+    assert batch.packet_size == len(packet)
+    assert batch.bytes == packet.bytes * 5
+    assert all(view == packet for view in batch)
+    assert batch[-1] == packet
+
+
+def test_find_mismatch():
+    good, bad = make_packet(b'\x07' * 8), make_packet(b'\x07' * 7 + b'\x08')
+    batch = PacketBatch.encode([good, good, bad, good, bad])
+
+    assert batch.find_mismatch(payload=b'\x07' * 8) == 2
+    assert batch.find_mismatch(payload=b'\x07' * 7 + b'\x08') == 0
+    assert batch.find_mismatch(p_secret=42, step=1, student_id=592) is None
+    assert batch.find_mismatch(step=2) == 0
+
+
+def test_find_mismatch_padding():
+    packet = make_packet(b'\x07' * 5)
+    batch = PacketBatch(packet.bytes * 3, payload_len=5)
+
+    assert len(batch) == 3
+    assert batch.find_mismatch(payload_len=5, payload=b'\x07' * 5) is None
+
+
+def test_records():
+    packets = [make_packet(bytes([i]) * 4, p_secret=i) for i in range(3)]
+    records = PacketBatch.encode(packets).records()
+
+    assert [int(record[1]) for record in records] == [0, 1, 2]
+    assert [bytes(record[4]) for record in records] == [packet.payload for packet in packets]
+
+
+def test_malformed():
+    packet = make_packet(b'\x07' * 8)
+
+    pytest.raises(ValueError, PacketBatch, packet.bytes * 2, 8, 3)
+    pytest.raises(ValueError, PacketBatch, packet.bytes + b'\0' * 4, 8)
+    pytest.raises(ValueError, PacketBatch.encode, [packet, make_packet(b'\x07' * 4)])
+    # Trailing data is ignored when count is given
+    assert len(PacketBatch(packet.bytes * 3, 8, 2)) == 2
+
+
+def test_compare():
+    packet = make_packet(b'\x07' * 6)
+    expected = PacketBatch.repeat(packet, 4)
+
+    assert PacketBatch(packet.bytes * 4, 6).compare(expected) is None
+    assert PacketBatch(packet.bytes * 4, 6).compare(expected.bytes) is None
+    data = bytearray(packet.bytes * 4)
+    data[2 * len(packet) + 5] ^= 1
+    assert PacketBatch(data, 6).compare(expected) == 2
+    # Header fields are compared too
+    other = make_packet(b'\x07' * 6, p_secret=43)
+    assert PacketBatch(packet.bytes * 3 + other.bytes, 6).compare(expected) == 3
+    # Missing packets
+    assert PacketBatch(packet.bytes * 3, 6).compare(expected) == 3
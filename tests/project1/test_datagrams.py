@@ -0,0 +1,68 @@
+import socket
+import select
+import pytest
+
+from cse461.project1 import DatagramBatch
+
+
+@pytest.fixture
+def sockets():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(('localhost', 0))
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.bind(('localhost', 0))
+    client.settimeout(1)
+    yield server, client
+    server.close()
+    client.close()
+
+
+def send_all(client: socket.socket, server: socket.socket, datagrams: list):
+    for datagram in datagrams:
+        client.sendto(datagram, server.getsockname())
+    select.select([server], [], [], 1)
+
+
+def test_recv_drains_ready_datagrams(sockets):
+    server, client = sockets
+    batch = DatagramBatch(size=8, bufsize=16)
+    datagrams = [bytes([i]) * (i + 1) for i in range(5)]
+    send_all(client, server, datagrams)
+
+    requests = list(batch.recv(server, server=None))
+
+    assert len(batch) == 5
+    assert [request.data.tobytes() for request in requests] == datagrams
+    assert all(request.client_address == client.getsockname() for request in requests)
+    # Nothing is left, and receiving again doesn't block
+    assert list(batch.recv(server)) == []
+
+
+def test_recv_limited_to_batch_size(sockets):
+    server, client = sockets
+    batch = DatagramBatch(size=2, bufsize=16)
+    send_all(client, server, [b'a', b'b', b'c'])
+
+    assert [request.data.tobytes() for request in batch.recv(server)] == [b'a', b'b']
+    assert [request.data.tobytes() for request in batch.recv(server)] == [b'c']
+
+
+def test_truncates_long_datagrams(sockets):
+    server, client = sockets
+    batch = DatagramBatch(size=1, bufsize=4)
+    send_all(client, server, [b'abcdefgh'])
+
+    assert [request.data.tobytes() for request in batch.recv(server)] == [b'abcd']
+
+
+def test_flush_replies(sockets):
+    server, client = sockets
+    batch = DatagramBatch()
+    send_all(client, server, [b'1', b'2', b'3'])
+
+    for request in batch.recv(server):
+        request.reply(b'ack ' + request.data.tobytes())
+    assert batch.flush(server) == 3
+    assert batch.flush(server) == 0
+
+    assert [client.recv(16) for _ in range(3)] == [b'ack 1', b'ack 2', b'ack 3']
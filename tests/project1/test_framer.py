@@ -0,0 +1,59 @@
+import socket
+import pytest
+
+from cse461.project1 import Packet, PacketFramer
+
+
+def make_packets(n: int):
+    return [Packet(payload=bytes([i]) * i, p_secret=i, step=1, student_id=592)
+            for i in range(n)]
+
+
+def test_feed_split():
+    packets = make_packets(10)
+    data = b''.join(packet.bytes for packet in packets)
+    framer = PacketFramer(capacity=16)
+
+    received = []
+    for i in range(len(data)):
+        received.extend(framer.feed(data[i:i + 1]))
+
+    assert received == packets
+    assert len(framer) == 0
+
+
+def test_feed_coalesced():
+    packets = make_packets(50)
+    data = b''.join(packet.bytes for packet in packets)
+    framer = PacketFramer(capacity=16)
+
+    # Leave a partial packet buffered
+    assert framer.feed(data + packets[3].bytes[:5]) == packets
+    assert len(framer) == 5
+    assert framer.feed(packets[3].bytes[5:]) == [packets[3]]
+
+
+def test_max_payload_len():
+    framer = PacketFramer(max_payload_len=8)
+    pytest.raises(ValueError, framer.feed, make_packets(10)[9].bytes)
+
+
+def test_read_packets():
+    packets = make_packets(5)
+    data = b''.join(packet.bytes for packet in packets)
+    framer = PacketFramer()
+
+    a, b = socket.socketpair()
+    with a, b:
+        b.settimeout(1)
+        a.sendall(data[:7])
+        a.sendall(data[7:])
+        assert framer.read_packets(b, count=2) == packets[:2]
+        assert framer.read_packets(b, count=3) == packets[2:]
+
+        a.sendall(data)
+        assert framer.read_exact(b, 12, consume=False) == data[:12]
+        assert framer.read_exact(b, len(data)) == data
+
+        a.close()
+        pytest.raises(ConnectionError, framer.read_packets, b)
@@ -0,0 +1,21 @@
+import logging
+
+from cse461.project1 import LogSampler
+
+logger = logging.getLogger(__name__)
+
+
+def test_samples_one_in_rate():
+    logger.setLevel(logging.DEBUG)
+    sample = LogSampler(logger, rate=10)
+    assert [i for i in range(100) if sample()] == list(range(0, 100, 10))
+
+
+def test_disabled_level_never_samples():
+    logger.setLevel(logging.INFO)
+    sample = LogSampler(logger, rate=1)
+    assert not any(sample() for _ in range(10))
+    # Calls made while the level was disabled aren't counted
+    logger.setLevel(logging.DEBUG)
+    sample.rate = 2
+    assert [sample() for _ in range(4)] == [True, False, True, False]
@@ -0,0 +1,83 @@
+import urllib.request
+import random
+import socket
+import json
+import pytest
+
+from cse461.project1 import Client, Server, Histogram, MetricsRegistry, Packet
+
+PORT = 12237
+
+
+def test_histogram_quantiles_within_bucket_precision():
+    histogram = Histogram()
+    values = [random.uniform(0.0001, 10) for _ in range(10_000)]
+    for value in values:
+        histogram.record(value)
+    values.sort()
+
+    for q in (0.5, 0.9, 0.99, 0.999):
+        exact = values[int(q * len(values)) - 1]
+        assert abs(histogram.quantile(q) - exact) <= exact / Histogram.SUB_BUCKETS + 1e-6
+    summary = histogram.summary()
+    assert summary['count'] == len(values)
+    assert summary['min'] == pytest.approx(values[0], abs=1e-6)
+    assert summary['max'] == pytest.approx(values[-1], abs=1e-6)
+
+
+def test_histogram_clamps_large_values():
+    histogram = Histogram(max_value=1)
+    histogram.record(100)
+    assert histogram.quantile(1) == 1
+
+
+def test_registry_snapshot():
+    metrics = MetricsRegistry()
+    metrics.inc('started')
+    metrics.inc('started', 2)
+    metrics.gauge('live', lambda: 5)
+    metrics.gauge('pool', lambda: {'threads': 2, 'queued': 0})
+    metrics.observe('stage_a', 0.001)
+
+    snapshot = metrics.snapshot()
+    assert snapshot['counters'] == {'started': 3}
+    assert snapshot['gauges'] == {'live': 5, 'pool_threads': 2, 'pool_queued': 0}
+    assert snapshot['histograms']['stage_a']['count'] == 1
+
+
+@pytest.fixture
+def server():
+    server = Server(stats_port=0)
+    server.start(PORT)
+    yield server
+    server.stop()
+
+
+def get_json(server: Server, path: str) -> dict:
+    with urllib.request.urlopen(f"http://localhost:{server.stats_address[1]}{path}") as response:
+        return json.load(response)
+
+
+def test_server_metrics(server):
+    # One rejected hello
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.sendto(Packet(payload=b'goodbye', p_secret=0, step=1, student_id=1).bytes,
+                    ('localhost', PORT))
+    with Client() as client:
+        client.start(PORT)
+
+    stats = get_json(server, '/stats')
+    assert stats['started'] == stats['completed'] == 1
+    assert stats['ack_fails_dropped'] == 1
+    assert 'pool_threads' in stats
+
+    metrics = get_json(server, '/metrics')
+    for stage in ('stage_a', 'stage_b', 'stage_c', 'stage_d', 'session'):
+        assert metrics['histograms'][stage]['count'] == 1
+    assert metrics['counters']['rejected_bad_hello'] == 1
+
+
+def test_stats_server_unknown_path(server):
+    with pytest.raises(urllib.error.HTTPError) as e:
+        get_json(server, '/nope')
+    assert e.value.code == 404
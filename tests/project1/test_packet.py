@@ -0,0 +1,84 @@
+import struct
+import pytest
+
+from cse461.project1 import Packet, PacketView
+
+
+def test_packet_view_fields():
+    packet = Packet(payload=b'hello world\0', p_secret=7, step=1, student_id=592)
+    view = PacketView(packet.bytes)
+
+    assert view.payload_len == 12
+    assert view.p_secret == 7
+    assert view.step == 1
+    assert view.student_id == 592
+    assert view.payload == b'hello world\0'
+    assert view == packet
+    assert packet == view
+
+
+def test_packet_view_zero_copy():
+    packet = Packet(payload=b'\0' * 8, p_secret=1, step=1, student_id=123)
+    buffer = bytearray(packet.bytes)
+    view = PacketView(buffer)
+
+    # Views share memory with the buffer they wrap
+    buffer[12] = 0xff
+    assert view.payload[0] == 0xff
+    assert view.payload.obj is buffer
+
+
+def test_packet_view_padding():
+    packet = Packet(payload=b'abcde', p_secret=0, step=1, student_id=1)
+    view = PacketView(memoryview(packet.bytes))
+
+    assert view.payload_len == 5
+    assert len(view.payload) == 8
+    assert view.to_packet() == packet
+
+
+@pytest.mark.parametrize("data", [b'', b'\0' * 11, b'\0' * 14])
+def test_packet_view_malformed(data):
+    pytest.raises(ValueError, PacketView, data)
+
+
+def test_packet_view_header():
+    packet = Packet(payload=struct.pack("!I", 3), p_secret=99, step=2, student_id=456)
+    view = PacketView(packet.bytes)
+
+    assert view.header == packet.header
+    assert struct.unpack_from("!I", view.payload)[0] == 3
+
+
+def test_packet_slots():
+    packet = Packet(payload=b'abc', p_secret=1, step=1, student_id=1)
+
+    assert not hasattr(packet, '__dict__')
+    assert packet.payload == b'abc\0'
+    assert packet.header == packet.bytes[:12]
+
+
+def test_packet_payload_len():
+    # Payloads are truncated or zero-extended to payload_len
+    assert Packet(b'abcdef', 0, 1, 1, payload_len=2).payload == b'ab\0\0'
+    assert Packet(b'ab', 0, 1, 1, payload_len=6).payload == b'ab\0\0\0\0\0\0'
+
+
+def test_packet_pack_unpack():
+    packets = [Packet(payload=bytes([i]) * i, p_secret=i, step=1, student_id=100)
+               for i in range(1, 6)]
+    buffer = bytearray(sum(len(packet) for packet in packets) + 3)
+
+    offset = 0
+    for packet in packets:
+        offset += packet.pack_into(buffer, offset)
+
+    offset = 0
+    for packet in packets:
+        unpacked = Packet.unpack_from(buffer, offset)
+        assert unpacked == packet
+        assert unpacked.p_secret == packet.p_secret
+        offset += len(unpacked)
+
+    pytest.raises(ValueError, Packet.unpack_from, buffer, offset)
+    pytest.raises(ValueError, Packet.unpack_from, packets[-1].bytes[:-4])
@@ -0,0 +1,76 @@
+import socket
+import pytest
+
+from cse461.project1 import PortAllocator
+
+
+@pytest.fixture
+def port_range():
+    # Find a short range of ports that are currently free
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    probe.bind(('localhost', 0))
+    low = probe.getsockname()[1]
+    probe.close()
+    return low, low + 3
+
+
+def test_allocate_release(port_range):
+    ports = PortAllocator('localhost', *port_range)
+    socks = [ports.allocate() for _ in range(4)]
+    allocated = {sock.getsockname()[1] for sock in socks}
+
+    assert allocated == set(range(port_range[0], port_range[1] + 1))
+    assert len(ports) == 4
+    with pytest.raises(OSError):
+        ports.allocate()
+
+    for sock in socks:
+        sock.close()
+    for port in allocated:
+        ports.release(port)
+    assert len(ports) == 0
+
+
+def test_release_reuses_port(port_range):
+    ports = PortAllocator('localhost', port_range[0], port_range[0])
+    sock = ports.allocate()
+    port = sock.getsockname()[1]
+    sock.close()
+    ports.release(port)
+
+    sock = ports.allocate(socket.SOCK_STREAM)
+    assert sock.getsockname()[1] == port
+    assert sock.type == socket.SOCK_STREAM
+    sock.close()
+
+
+def test_skips_bound_ports(port_range):
+    low, high = port_range
+    other = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    other.bind(('localhost', low))
+    ports = PortAllocator('localhost', low, high, exclude=(high,))
+
+    socks = [ports.allocate() for _ in range(2)]
+    assert {sock.getsockname()[1] for sock in socks} == {low + 1, low + 2}
+    with pytest.raises(OSError):
+        ports.allocate()
+
+    for sock in socks + [other]:
+        sock.close()
+
+
+def test_warm_pool(port_range):
+    ports = PortAllocator('localhost', *port_range, warm=1)
+    ports.warm_up()
+    assert len(ports) == 2
+
+    sock = ports.allocate(socket.SOCK_DGRAM)
+    assert len(ports) == 2
+    port = sock.getsockname()[1]
+    sock.close()
+    ports.release(port)
+    # The released port refills the warm pool
+    assert len(ports) == 2
+
+    ports.close()
+    assert len(ports) == 0
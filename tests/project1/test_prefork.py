@@ -0,0 +1,31 @@
+import threading
+import random
+
+from cse461.project1 import Client, PreforkServer
+from cse461.project1.prefork import split_range
+
+
+def test_split_range():
+    assert split_range(1000, 1009, 3) == [(1000, 1002), (1003, 1005), (1006, 1009)]
+    assert split_range(1000, 1000, 1) == [(1000, 1000)]
+
+
+def test_prefork_server():
+    with PreforkServer(workers=2) as server:
+        server.start()
+        results = []
+
+        def run_client():
+            with Client(student_id=random.randint(100, 999)) as client:
+                results.append(client.start())
+
+        threads = [threading.Thread(target=run_client) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(results) == 10
+        stats = server.stats()
+        assert stats['workers'] == 2
+        assert stats['started'] == stats['completed'] == 10
@@ -0,0 +1,49 @@
+import pytest
+
+from cse461.project1 import ClientProtocol, Exchange, Packet, RttEstimator
+from cse461.project1.packet import UINT32, STAGE_A_RESPONSE, STAGE_B_RESPONSE
+
+
+def response(payload: bytes, p_secret: int = 0) -> Packet:
+    return Packet(payload=payload, p_secret=p_secret, step=2, student_id=461)
+
+
+def test_exchange():
+    rtt = RttEstimator(initial=1, minimum=0.01)
+    exchange = Exchange(lambda packet: packet.payload_len == 8, rtt, now=0, retries=1, size=3)
+    assert exchange.deadline == 1
+    assert not exchange.receive(response(b'\0' * 4), now=0.5)
+    exchange.timeout(now=1)
+    # The RTO backed off, and responses to resent requests aren't RTT samples
+    assert exchange.deadline == 3
+    assert exchange.receive(response(b'\0' * 8), now=1.5)
+    assert rtt.samples == 0
+    assert exchange.retransmissions == 3
+    pytest.raises(TimeoutError, exchange.timeout, 3)
+
+
+def test_client_protocol():
+    protocol = ClientProtocol(student_id=461, window=2)
+    hello, exchange = protocol.hello(now=0)
+    assert hello.payload == b'hello world\0'
+    stage_a = response(STAGE_A_RESPONSE.pack(3, 4, 12345, 42))
+    assert exchange.receive(stage_a, now=0.1)
+    assert protocol.rtt.samples == 1
+    protocol.finish_stage_a(exchange, stage_a)
+    assert protocol.secrets == {'a': 42}
+
+    stage_b = protocol.start_stage_b(stage_a)
+    assert stage_b.port == 12345
+    packets = stage_b.to_send(now=0.1)
+    assert [UINT32.unpack(packet.payload[:4])[0] for packet in packets] == [0, 1]
+    assert all(packet.p_secret == 42 and packet.payload_len == 8 for packet in packets)
+    stage_b.receive(response(UINT32.pack(0), 42), now=0.2)
+    assert stage_b.window.base == 1
+    # A late response to the hello is ignored
+    stage_b.receive(stage_a, now=0.2)
+    assert not stage_b.done
+    stage_b.receive(response(STAGE_B_RESPONSE.pack(23456, 43), 43), now=0.2)
+    assert stage_b.done
+    protocol.finish_stage_b(stage_b, stage_b.response)
+    assert protocol.secrets['b'] == 43
+    assert protocol.stage_c_port(stage_b.response) == 23456
@@ -0,0 +1,86 @@
+import threading
+import signal
+import socket
+import pytest
+import time
+
+from cse461.project1 import Client, Server, Packet
+
+PORT = 12236
+
+
+@pytest.fixture
+def server():
+    server = Server()
+    thread = threading.Thread(target=server.run, kwargs={'port': PORT, 'drain_timeout': 5})
+    thread.start()
+    # Wait for the server to bind its port
+    deadline = time.monotonic() + 5
+    while PORT not in server.udp_servers and time.monotonic() < deadline:
+        time.sleep(0.01)
+    yield server, thread
+    server.request_stop()
+    thread.join()
+
+
+def test_run_returns_on_request_stop(server):
+    server, thread = server
+    server.request_stop()
+    thread.join(5)
+
+    assert not thread.is_alive()
+    assert not server.udp_servers and not server.tcp_servers
+    assert len(server.workers) == 0
+
+
+def test_run_drains_sessions(server):
+    server, thread = server
+    with Client() as client:
+        resp = client.stage_a(PORT)
+        resp = client.stage_b(resp)
+        server.request_stop()
+        assert server.draining.wait(1)
+
+        # New sessions are refused while draining
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(0.5)
+            hello = Packet(payload=b'hello world\0', p_secret=0, step=1, student_id=0)
+            sock.sendto(hello.bytes, ('localhost', PORT))
+            with pytest.raises(socket.timeout):
+                sock.recv(1024)
+
+        # Sessions in progress still finish
+        resp = client.stage_c(resp)
+        client.stage_d(resp)
+
+    assert set(client.secrets) == {'a', 'b', 'c', 'd'}
+    thread.join(5)
+    assert not thread.is_alive()
+
+
+def test_run_twice():
+    server = Server()
+    for _ in range(2):
+        thread = threading.Thread(target=server.run, kwargs={'port': PORT, 'drain_timeout': 5})
+        thread.start()
+        deadline = time.monotonic() + 5
+        while PORT not in server.udp_servers and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert thread.is_alive()
+
+        with Client() as client:
+            client.start(PORT)
+        assert set(client.secrets) == {'a', 'b', 'c', 'd'}
+        server.request_stop()
+        thread.join(5)
+        assert not thread.is_alive()
+    assert server.stats().get('rejected_draining', 0) == 0
+
+
+def test_stop_on_signals():
+    server = Server()
+    handler = signal.getsignal(signal.SIGINT)
+    with server.stop_on_signals():
+        signal.raise_signal(signal.SIGINT)
+        assert server.stop_requested.is_set()
+    assert signal.getsignal(signal.SIGINT) is handler
@@ -0,0 +1,69 @@
+import threading
+import socket
+import pytest
+
+from cse461.project1.scheduler import Scheduler
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = Scheduler()
+    scheduler.start()
+    yield scheduler
+    scheduler.stop()
+
+
+def test_call_later_order(scheduler):
+    fired = []
+    done = threading.Event()
+
+    scheduler.call_later(0.06, fired.append, 3)
+    scheduler.call_later(0.02, fired.append, 1)
+    scheduler.call_later(0.04, fired.append, 2)
+    scheduler.call_later(0.08, done.set)
+
+    assert done.wait(1)
+    assert fired == [1, 2, 3]
+
+
+def test_cancel(scheduler):
+    fired = []
+    done = threading.Event()
+
+    timer = scheduler.call_later(0.02, fired.append, 1)
+    scheduler.call_later(0.04, done.set)
+    timer.cancel()
+
+    assert done.wait(1)
+    assert fired == []
+
+
+def test_single_thread(scheduler):
+    threads = set()
+    done = threading.Event()
+
+    for i in range(100):
+        scheduler.call_later(i / 1000, lambda: threads.add(threading.current_thread()))
+    scheduler.call_later(0.2, done.set)
+
+    assert done.wait(1)
+    assert threads == {scheduler.thread}
+
+
+def test_add_reader(scheduler):
+    received = []
+    done = threading.Event()
+    sock, peer = socket.socketpair()
+
+    def on_readable():
+        received.append(sock.recv(1024))
+        scheduler.remove_reader(sock)
+        done.set()
+
+    scheduler.add_reader(sock, on_readable)
+    peer.sendall(b'hello')
+
+    assert done.wait(1)
+    assert received == [b'hello']
+    sock.close()
+    peer.close()
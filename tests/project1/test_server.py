@@ -1,17 +1,32 @@
+from functools import partial
 from typing import Callable
 import threading
 import random
+import socket
 import pytest
 import time
 
-from cse461.project1 import Client, Server
+from cse461.project1 import Client, Server, AsyncServer
+from cse461.project1.consts import TIMEOUT
 
 
-@pytest.fixture(autouse=True)
+SERVERS = {
+    'Server': Server,
+    'AsyncServer': AsyncServer,
+    'Server-udp-pool': partial(Server, udp_pool_size=2),
+    'Server-tcp-pool': partial(Server, tcp_pool_size=2),
+}
+# Shared TCP servers accept (and then close) connections for sessions that
+# timed out rather than refusing them.
+NO_REFUSE = {'Server-tcp-pool'}
+
+
+@pytest.fixture(autouse=True, params=list(SERVERS))
 def server(request):
-    server = Server()
+    server = SERVERS[request.param]()
     server.start()
     request.addfinalizer(server.stop)
+    return request.param
 
 
 def spawn_threads(n: int, target: Callable, args=()):
@@ -46,13 +61,20 @@ def test_basic_concurrent_large():
     spawn_concurrent_clients(100)
 
 
-def _test_timeout_single():
+def _test_timeout_single(refuses: bool = True):
     with Client(student_id=random.randint(100, 999)) as client:
         resp = client.stage_a()
         resp = client.stage_b(resp)
         # Servers should time out after 3 seconds;
         # sleep for 4 to be safe
         time.sleep(4)
+        if not refuses:
+            # The session expired, so the shared TCP server should close
+            # the connection without sending a stage C response
+            address = (client.ip_addr, client.stage_c_port(resp))
+            with socket.create_connection(address, timeout=TIMEOUT) as sock:
+                assert sock.recv(1024) == b''
+            return
         # The server timed out, so attempting to send data should raise
         # a ConnectionRefusedError
         pytest.raises(ConnectionRefusedError, client.stage_c, resp)
@@ -60,13 +82,13 @@ def _test_timeout_single():
         assert threading.active_count() == 1
 
 
-def test_timeout_single():
-    _test_timeout_single()
+def test_timeout_single(server):
+    _test_timeout_single(server not in NO_REFUSE)
 
 
-def test_timeout_concurrent_small():
-    spawn_threads(5, target=_test_timeout_single)
+def test_timeout_concurrent_small(server):
+    spawn_threads(5, target=_test_timeout_single, args=(server not in NO_REFUSE,))
 
 
-def test_timeout_concurrent_large():
-    spawn_threads(100, target=_test_timeout_single)
+def test_timeout_concurrent_large(server):
+    spawn_threads(100, target=_test_timeout_single, args=(server not in NO_REFUSE,))
@@ -0,0 +1,124 @@
+import threading
+import socket
+import time
+import pytest
+
+from cse461.project1 import Packet, Server, SessionStore, Session, Stage
+from cse461.project1.consts import TIMEOUT
+
+PORT = 12247
+
+
+def test_add_unique():
+    store = SessionStore(shards=4)
+    secrets = {store.add({'i': i}) for i in range(1000)}
+
+    assert len(secrets) == len(store) == 1000
+    assert set(store) == secrets
+    assert all(secret in store for secret in secrets)
+
+
+def test_new_secret():
+    store = SessionStore(max_size=4, node_id=3, node_bits=2)
+    stored = store.add({'i': 0})
+    secret = store.new_secret()
+
+    # Nothing is stored until the session is added under the secret
+    assert secret != stored and secret >> 30 == 3
+    assert secret not in store and len(store) == 1
+    assert store.add({'i': 1}, secret=secret) == secret
+    assert store[secret] == {'i': 1}
+
+
+def test_pop():
+    store = SessionStore()
+    secret = store.add({'prev_stage': 'a'})
+
+    assert store.pop(secret) == {'prev_stage': 'a'}
+    assert store.pop(secret, None) is None
+    assert store.get(secret) is None
+    assert secret not in store
+
+
+def test_concurrent_updates():
+    store = SessionStore(shards=2)
+    secrets = [store.add({'count': 0}) for _ in range(8)]
+
+    def increment():
+        for _ in range(1000):
+            for secret in secrets:
+                with store.lock(secret):
+                    store[secret]['count'] += 1
+
+    threads = [threading.Thread(target=increment) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(store[secret]['count'] == 4000 for secret in secrets)
+
+
+def test_ttl_expiry():
+    store = SessionStore(ttl=0.05)
+    expiring = store.add({'prev_stage': 'a'})
+    touched = store.add({'prev_stage': 'a'})
+    forever = store.add({'prev_stage': 'b'}, ttl=60)
+
+    time.sleep(0.03)
+    assert store.touch(touched)
+    time.sleep(0.03)
+
+    assert expiring not in store
+    assert store.get(expiring) is None
+    assert not store.touch(expiring)
+    assert touched in store and forever in store
+    assert store.stats() == {'live': 2, 'expired': 1, 'evicted': 0}
+
+
+def test_lru_eviction():
+    store = SessionStore(shards=1, max_size=3)
+    first, second, third = (store.add({'i': i}) for i in range(3))
+
+    # Using a session makes it the most recently used
+    store[first]
+    fourth = store.add({'i': 3})
+
+    assert second not in store
+    assert set(store) == {first, third, fourth}
+    assert store.stats() == {'live': 3, 'expired': 0, 'evicted': 1}
+
+
+def test_bounded_under_load():
+    store = SessionStore(shards=4, max_size=100)
+    for i in range(10_000):
+        store.add({'i': i})
+
+    assert len(store) <= 100
+    assert store.stats()['evicted'] == 10_000 - len(store)
+
+
+def test_session_records_are_compact():
+    session = Session(Stage.A, started=0.0, num_packets=7, ack_fails=1 << 3, packet_len=8)
+    assert not hasattr(session, '__dict__')
+    assert session.remaining_packets == 7
+    assert session.stage_started == session.started
+    with pytest.raises(AttributeError):
+        session.prev_stage = "a"
+
+
+def test_server_session_ttl():
+    server = Server(udp_pool_size=1, session_ttl={'a': 60, 'b': 60, 'c': 60})
+    server.start(PORT)
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(0.5)
+            sock.sendto(Packet(payload=b'hello world\0', p_secret=0, step=1,
+                               student_id=461).bytes, ('localhost', PORT))
+            sock.recv(1024)
+        # Sessions are kept for their stage's TTL, not just TIMEOUT
+        time.sleep(TIMEOUT + 0.5)
+        assert len(server.secrets) == 1
+        assert server.stats()['timed_out'] == 0
+    finally:
+        server.stop()
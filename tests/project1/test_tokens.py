@@ -0,0 +1,91 @@
+import socket
+import time
+import pytest
+
+from cse461.project1 import Client, Server, SessionTokens, Stage
+from cse461.project1.consts import TIMEOUT
+
+PORT = 12238
+
+
+def test_issue_and_verify():
+    tokens = SessionTokens()
+    token = tokens.issue(Stage.A)
+    assert tokens.verify(token, Stage.A)
+    assert not tokens.verify(token, Stage.B)
+    assert not SessionTokens().verify(token, Stage.A)
+
+
+def test_tokens_expire():
+    tokens = SessionTokens(lifetime=10)
+    token = tokens.issue(Stage.A, now=1000)
+    assert tokens.verify(token, Stage.A, now=1000 + 10)
+    assert not tokens.verify(token, Stage.A, now=1000 + 15)
+    # Tokens from the future (e.g. a server with a fast clock) aren't accepted
+    assert not tokens.verify(token, Stage.A, now=1000 - 5)
+
+
+def test_tokens_unique_and_unforgeable():
+    tokens = SessionTokens()
+    issued = {tokens.issue(Stage.A, now=0) for _ in range(10_000)}
+    assert len(issued) == 10_000
+
+    forged = sum(tokens.verify(token ^ 1 << 20, Stage.A, now=0) for token in issued)
+    assert forged < 10_000 * 4 / (1 << SessionTokens.TAG_BITS)
+
+
+def test_sessions_recovered_with_shared_key():
+    issuer = SessionTokens(key=b'key')
+    token = issuer.issue(Stage.A)
+    session = issuer.session(token, Stage.A)
+    recovered = SessionTokens(key=b'key').session(token, Stage.A)
+
+    assert recovered is not None and recovered.started is None
+    for field in ('num_packets', 'ack_fails', 'packet_len', 'num2', 'len2', 'char'):
+        assert getattr(recovered, field) == getattr(session, field)
+    assert 5 <= session.num_packets <= 10
+    assert session.packet_len % 4 == 0
+    assert session.ack_fails < 1 << session.num_packets
+    assert SessionTokens(key=b'other').session(token, Stage.A) is None
+
+
+@pytest.mark.parametrize('tcp_pool_size', [0, 2])
+def test_stateless_server(tcp_pool_size):
+    server = Server(stateless=True, udp_pool_size=2, tcp_pool_size=tcp_pool_size)
+    server.start(PORT)
+    try:
+        with Client() as client:
+            response = client.stage_a(PORT)
+            # Stage A stores nothing
+            assert len(server.secrets) == 0
+            response = client.stage_b(response)
+            response = client.stage_c(response)
+            client.stage_d(response)
+        assert server.stats()['completed'] == 1
+    finally:
+        server.stop()
+
+
+def test_stateless_replay_rejected():
+    # Secrets stay valid for 4 to 6 seconds, but idle sessions expire after 1
+    server = Server(stateless=True, udp_pool_size=1, session_ttl={'a': 1, 'b': 1, 'c': 4})
+    server.start(PORT)
+    try:
+        with Client() as client:
+            response = client.stage_a(PORT)
+            replay = client.start_stage_b(response)
+            client.stage_b(response)
+        time.sleep(TIMEOUT + 0.5)
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(0.5)
+            sock.sendto(replay.packets[0].bytes, ('localhost', replay.port))
+            with pytest.raises(socket.timeout):
+                sock.recv(1024)
+        assert server.stats()['rejected_replay'] == 1
+    finally:
+        server.stop()
+
+
+def test_stateless_requires_udp_pool():
+    with pytest.raises(ValueError):
+        Server(stateless=True)
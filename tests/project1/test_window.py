@@ -0,0 +1,108 @@
+import pytest
+
+from cse461.project1 import Client, RttEstimator, SendWindow, Server
+
+PORT = 12245
+
+
+def test_window_slides():
+    window = SendWindow(count=6, size=3)
+    assert window.to_send(0) == [0, 1, 2]
+    assert window.to_send(0) == []
+    assert window.ack(0, 0.01) and window.ack(1, 0.01)
+    assert window.to_send(0.01) == [3, 4]
+    for packet_id in range(2, 6):
+        assert window.ack(packet_id, 0.02)
+        window.to_send(0.02)
+    assert window.done and window.retransmissions == 0
+    assert window.rtt.samples == 6
+
+
+def test_window_resends_on_timeout():
+    window = SendWindow(count=3, size=2, rtt=RttEstimator(initial=0.5), retries=1)
+    window.to_send(0)
+    assert window.deadline == 0.5
+    assert window.to_send(0.4) == []
+    assert window.to_send(0.5) == [0, 1]
+    assert window.retransmissions == 2
+    # Backed off
+    assert window.deadline == 1.5
+    # Karn's rule: acks of packets sent again aren't RTT samples
+    assert window.ack(0, 0.6) and window.rtt.samples == 0
+    with pytest.raises(TimeoutError):
+        window.to_send(5)
+        window.to_send(10)
+
+
+def test_window_goes_back_on_out_of_order_ack():
+    window = SendWindow(count=4, size=4)
+    window.to_send(0)
+    # Packet 0 was lost, so the server didn't count packets 1 and 2 either
+    assert not window.ack(1, 0)
+    assert not window.ack(2, 0)
+    assert window.to_send(0) == [0, 1, 2, 3]
+    # Later acks from before the packets were sent again are ignored
+    assert not window.ack(3, 0)
+    assert window.to_send(0) == []
+    assert window.ack(0, 0)
+    assert window.base == 1
+
+
+def test_window_size():
+    with pytest.raises(ValueError):
+        SendWindow(count=4, size=0)
+
+
+@pytest.mark.parametrize('window', [1, 8])
+def test_client_window(window):
+    server = Server(udp_pool_size=2)
+    server.start(PORT)
+    try:
+        with Client(window=window) as client:
+            client.start(PORT)
+        assert server.stats()['completed'] == 1
+    finally:
+        server.stop()
+
+
+def test_rtt_estimator():
+    rtt = RttEstimator(initial=1, minimum=0.01, maximum=2)
+    assert rtt.rto == 1
+    rtt.sample(0.1)
+    # SRTT + 4 * RTTVAR
+    assert rtt.rto == pytest.approx(0.1 + 4 * 0.05)
+    for _ in range(100):
+        rtt.sample(0.001)
+    assert rtt.rto == 0.01
+    rtt.backoff()
+    rtt.backoff()
+    assert rtt.rto == 0.04
+    for _ in range(10):
+        rtt.backoff()
+    assert rtt.rto == 2
+    rtt.sample(0.001)
+    assert rtt.rto < 2
+    stats = rtt.stats()
+    assert stats['samples'] == 102 and stats['timeouts'] == 12
+    assert stats['min'] == 0.001 and stats['max'] == 0.1
+
+
+def test_client_retries_hello():
+    # The second hello is shed until a token is available
+    server = Server(hello_rate=2, hello_burst=1)
+    server.start(PORT)
+    try:
+        for _ in range(2):
+            with Client() as client:
+                client.start(PORT)
+        assert server.stats()['completed'] == 2
+        assert client.retransmissions >= 1
+    finally:
+        server.stop()
+
+
+def test_client_gives_up():
+    with Client(retries=1) as client:
+        client.rtt.initial = 0.05
+        with pytest.raises(TimeoutError):
+            client.stage_a(PORT)
@@ -0,0 +1,98 @@
+import threading
+import queue
+import time
+import pytest
+
+from cse461.project1 import Server, WorkerPool
+
+
+@pytest.fixture
+def blocked():
+    """Event that blocked tasks wait on. Set when the test finishes."""
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_runs_tasks():
+    pool = WorkerPool(size=4)
+    results = []
+    lock = threading.Lock()
+
+    def task(i):
+        with lock:
+            results.append(i)
+
+    assert all(pool.submit(task, i) for i in range(100))
+    assert pool.join(timeout=5)
+    assert sorted(results) == list(range(100))
+    stats = pool.stats()
+    assert stats['threads'] <= 4
+    assert stats['submitted'] == stats['completed'] == 100
+    assert stats['rejected'] == 0
+    assert pool.shutdown(timeout=5)
+    assert not pool.threads
+
+
+def test_discard_when_full(blocked):
+    pool = WorkerPool(size=2, queue_size=3)
+    for _ in range(5):
+        assert pool.submit(blocked.wait)
+    assert not pool.submit(blocked.wait)
+
+    assert wait_until(lambda: pool.stats()['active'] == 2)
+    stats = pool.stats()
+    assert stats['threads'] == 2
+    assert stats['queued'] == 3
+    assert stats['rejected'] == 1
+    blocked.set()
+    assert pool.shutdown(timeout=5)
+    assert pool.stats()['completed'] == 5
+
+
+def test_caller_runs_when_full(blocked):
+    pool = WorkerPool(size=1, queue_size=1, policy=WorkerPool.CALLER_RUNS)
+    pool.submit(blocked.wait)
+    pool.submit(blocked.wait)
+
+    ran_on = []
+    assert pool.submit(lambda: ran_on.append(threading.current_thread()))
+    assert ran_on == [threading.current_thread()]
+    blocked.set()
+    assert pool.shutdown(timeout=5)
+
+
+def test_caller_runs_requires_no_tcp_pool():
+    # Stage D reads would block the scheduler's thread
+    with pytest.raises(ValueError):
+        Server(tcp_pool_size=2, reject_policy=WorkerPool.CALLER_RUNS)
+
+
+def test_abort_when_full(blocked):
+    pool = WorkerPool(size=1, queue_size=0, policy=WorkerPool.ABORT)
+    pool.submit(blocked.wait)
+    with pytest.raises(queue.Full):
+        pool.submit(blocked.wait)
+    blocked.set()
+    assert pool.shutdown(timeout=5)
+
+
+def test_shutdown_finishes_queued_tasks(blocked):
+    pool = WorkerPool(size=1)
+    done = []
+    pool.submit(blocked.wait)
+    pool.submit(done.append, 1)
+
+    assert not pool.shutdown(timeout=0.1)
+    with pytest.raises(RuntimeError):
+        pool.submit(done.append, 2)
+    blocked.set()
+    assert pool.shutdown(timeout=5)
+    assert done == [1]